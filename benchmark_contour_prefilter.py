@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark del prefiltro vectorizado de contornos de extract_rectangles.
+
+Genera hojas sintéticas fotografiadas sobre un fondo con textura (que produce decenas
+de miles de contornos diminutos al binarizar) y compara el tiempo del bucle de filtrado
+original contorno a contorno con el del prefiltro por área. Comprueba además que ambos
+devuelven exactamente los mismos rectángulos.
+
+Uso:
+    python benchmark_contour_prefilter.py [--sheets 3] [--repeat 5]
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from extract_rectangles import filter_rectangle_contours, filter_rectangle_contours_loop
+
+def make_noisy_sheet(seed, height=4000, width=3000, rows=6, cols=4, line=4, margin=300):
+    """Hoja sintética: cuadrícula negra con códigos y fotos sobre un fondo con textura y ruido."""
+    rng = np.random.default_rng(seed)
+    # Fondo fotografiado (mesa con textura alrededor del umbral): al binarizar deja
+    # decenas de miles de islas blancas diminutas que son contornos externos
+    image = rng.normal(170, 40, (height, width, 1)).clip(0, 255).astype(np.uint8).repeat(3, axis=2)
+    cell_h = (height - 40 - 2 * margin) // rows
+    cell_w = (width - 40 - 2 * margin) // cols
+    image[margin:margin + rows * cell_h + 40, margin:margin + cols * cell_w + 40] = 255
+    image[margin:margin + 20, margin:margin + cols * cell_w + 40] = 0
+    image[margin:margin + rows * cell_h + 40, margin:margin + 20] = 0
+
+    for r in range(rows + 1):
+        y = margin + 20 + r * cell_h
+        image[y:y + line, margin + 20:margin + 20 + cols * cell_w + line] = 0
+    for c in range(cols + 1):
+        x = margin + 20 + c * cell_w
+        image[margin + 20:margin + 20 + rows * cell_h + line, x:x + line] = 0
+
+    for r in range(rows):
+        for c in range(cols):
+            y, x = margin + 20 + r * cell_h, margin + 20 + c * cell_w
+            if (r + c) % 2:
+                cv2.putText(image, str(rng.integers(10**7, 10**8)), (x + 30, y + cell_h // 2),
+                            cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 4)
+            else:
+                # Foto con textura
+                ph, pw = cell_h // 2, cell_w // 2
+                texture = rng.normal(190, 25, (ph, pw, 1)).clip(0, 255).astype(np.uint8)
+                py, px = y + cell_h // 4, x + cell_w // 4
+                image[py:py + ph, px:px + pw] = texture
+
+    noise = rng.normal(0, 10, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+def find_contours(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    _, threshold = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return contours
+
+def best_time(function, contours, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(contours)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del prefiltro vectorizado de contornos')
+    parser.add_argument('--sheets', type=int, default=3, help='Número de hojas sintéticas')
+    parser.add_argument('--repeat', type=int, default=5, help='Repeticiones por medida (se toma la mejor)')
+    args = parser.parse_args()
+
+    print("📊 Bucle de filtrado de contornos: original vs prefiltro vectorizado")
+    print(f"{'hoja':>4} {'contornos':>10} {'rect.':>6} {'original':>10} {'prefiltro':>10} {'mejora':>7}  iguales")
+
+    all_equal = True
+    for seed in range(args.sheets):
+        contours = find_contours(make_noisy_sheet(seed))
+        loop_time, loop_result = best_time(filter_rectangle_contours_loop, contours, args.repeat)
+        fast_time, fast_result = best_time(filter_rectangle_contours, contours, args.repeat)
+
+        equal = (len(loop_result) == len(fast_result) and
+                 all(np.array_equal(a, b) for a, b in zip(loop_result, fast_result)))
+        all_equal &= equal
+        print(f"{seed:>4} {len(contours):>10} {len(fast_result):>6} {loop_time * 1000:>8.1f}ms "
+              f"{fast_time * 1000:>8.1f}ms {loop_time / fast_time:>6.1f}x  {'✅' if equal else '❌'}")
+
+    if not all_equal:
+        print("❌ El prefiltro no devuelve los mismos rectángulos que el bucle original")
+        raise SystemExit(1)
+    print("✅ Mismos rectángulos en todas las hojas")
+
+if __name__ == "__main__":
+    main()
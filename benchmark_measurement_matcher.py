@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark del detector de medidas/pesos (ver measurement_matcher.py).
+
+Genera un corpus de textos parecidos a los que devuelve el OCR (pesos, medidas, tallas,
+errores 'll'/'11', separadores con espacios o comas, códigos de producto y ruido) y mide
+la latencia por llamada de match_measurement y del bucle original
+(match_measurement_legacy). La equivalencia de ambos se comprueba en
+test_measurement_matcher.py con el mismo corpus.
+
+Uso:
+    python benchmark_measurement_matcher.py [--count 20000] [--seed 0] [--repeat 3]
+"""
+
+import argparse
+import random
+import string
+import time
+
+from measurement_matcher import (DISCARD_PATTERNS, match_measurement,
+                                 match_measurement_legacy)
+
+# Unidades tal como pueden aparecer en el OCR (mayúsculas, minúsculas y errores típicos)
+UNITS = ['g', 'G', 'gr', 'GR', 'gramos', 'gram', 'gms', 'kg', 'KG', 'oz', 'llg', 'lg', 'lb',
+         'libras', 'pounds', 'cm', 'CM', 'mm', 'm', 'pulgadas', 'in', 'inch', 'ft', 'feet',
+         'yd', 'yard', 'k', 'kt', 'quilates', 'c', 'l', 'ml', 'cl', 'cc', 'gal', '%', '€', '$',
+         'usd', 'eur', 'll', 'LL', 'II', 'x', '']
+SEPARATORS = ['.', '. ', ',', ' . ', ' ']
+
+def random_number(rng):
+    return str(rng.randint(0, 999)) if rng.random() < 0.7 else str(rng.randint(0, 9))
+
+def random_text(rng):
+    """Un texto del corpus, eligiendo al azar entre los tipos de contenido de las celdas."""
+    kind = rng.random()
+    if kind < 0.35:
+        # Decimal con unidad: "6.1g", "6. llg", "6,11 G"
+        decimals = ''.join(rng.choice('0123456789l') for _ in range(rng.randint(1, 3)))
+        return f"{random_number(rng)}{rng.choice(SEPARATORS)}{decimals}{rng.choice(['', ' '])}{rng.choice(UNITS)}"
+    if kind < 0.55:
+        # Entero con unidad o talla: "34G", "22 cm", "7"
+        return f"{random_number(rng)}{rng.choice(['', ' '])}{rng.choice(UNITS)}"
+    if kind < 0.65:
+        # Unidad sola o patrón de un grupo concreto
+        category = rng.choice(list(DISCARD_PATTERNS))
+        return rng.choice(UNITS) if rng.random() < 0.5 else category.upper()
+    if kind < 0.85:
+        # Código de producto: "AB12345", "123456789"
+        letters = ''.join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(0, 3)))
+        digits = ''.join(rng.choice(string.digits) for _ in range(rng.randint(4, 10)))
+        return letters + digits if rng.random() < 0.5 else digits + letters
+    # Ruido del OCR sobre siluetas o texto libre
+    alphabet = string.ascii_letters + string.digits + ' .,-/\n'
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 14)))
+
+def time_per_call(function, corpus, repeat):
+    """Mejor tiempo medio por llamada en microsegundos."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in corpus:
+            function(text)
+        best = min(best, time.perf_counter() - start)
+    return best / len(corpus) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='Latencia del detector de medidas/pesos')
+    parser.add_argument('--count', type=int, default=20000, help='Textos del corpus')
+    parser.add_argument('--seed', type=int, default=0, help='Semilla del corpus')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones (se toma la mejor)')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = [random_text(rng) for _ in range(args.count)]
+
+    types = {}
+    for text in corpus:
+        match_type = match_measurement(text)['type']
+        types[match_type] = types.get(match_type, 0) + 1
+
+    print(f"Corpus: {len(corpus)} textos")
+    for match_type, count in sorted(types.items(), key=lambda item: -item[1]):
+        print(f"  • {match_type}: {count}")
+
+    legacy_us = time_per_call(match_measurement_legacy, corpus, args.repeat)
+    compiled_us = time_per_call(match_measurement, corpus, args.repeat)
+    print(f"⏱️ Bucle original:        {legacy_us:.2f} µs/llamada")
+    print(f"⏱️ Detector precompilado: {compiled_us:.2f} µs/llamada ({legacy_us / compiled_us:.1f}x)")
+
+if __name__ == "__main__":
+    main()
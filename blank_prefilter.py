@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Prefiltro por lotes de celdas en blanco, antes de cualquier OCR o modelo.
+
+Los recortes de una hoja se pasan a grises y se concatenan en un único búfer; con
+comparaciones y reducciones segmentadas sobre ese búfer se obtienen, para todos a la
+vez, el porcentaje de contenido no blanco, el mínimo y máximo de gris (contraste) y
+una densidad de bordes gruesa (transiciones claro/oscuro). Sólo los recortes casi
+vacíos que no resuelven esas reglas pasan por findContours.
+
+Las reglas son conservadoras: sólo se marca como en blanco un recorte que
+classify_rectangles.is_image_blank también daría por en blanco, así que en
+classify_rectangles.process_cells el resultado de la clasificación no cambia; sólo se
+evita el OCR de esos recortes.
+
+En process_rectangles_improved y en la versión web (find_blank_paths) el criterio sí
+cambia: antes decidía el veredicto 'blank_image' del clasificador ML y ahora estas
+reglas de píxeles descartan el recorte antes de llegar al modelo. Un recorte que el ML
+no daba por en blanco puede descartarse aquí, y uno que el ML descartaba sigue
+descartándose sólo si el ML lo hace después.
+"""
+
+import cv2
+import numpy as np
+
+from rectangle_features import RectangleFeatures
+
+# is_image_blank considera en blanco cualquier recorte con menos de un 0.1% de contenido...
+MAX_BLANK_CONTENT = 0.1
+
+# ... o con contraste < 30 y contenido < 1%, salvo silueta con contenido > 0.3%
+MAX_BLANK_CONTRAST = 30
+MAX_LOW_CONTRAST_CONTENT = 0.3
+
+# ... o con contenido < 0.5% sin contornos de área > 50. El área de un contorno es la que
+# encierra, no su tinta (un "0" de 48 píxeles oscuros puede encerrar más de 50), así que
+# para los pocos recortes que llegan a esta regla se buscan los contornos como allí
+MAX_SPARSE_CONTENT = 0.5
+MAX_SPARSE_CONTOUR_AREA = 50
+
+def segment_counts(mask, starts, sizes):
+    """Píxeles activos de cada recorte del búfer (count_nonzero es mucho más rápido que add.reduceat)."""
+    return np.array([np.count_nonzero(mask[start:start + size]) for start, size in zip(starts, sizes)],
+                    dtype=np.int64)
+
+def prefilter_blank_images(images, threshold=230):
+    """
+    Analiza todos los recortes de una hoja de una vez.
+
+    Args:
+        images: Lista de recortes (BGR o grises); None se considera ilegible, no en blanco
+        threshold: Umbral de blanco (el mismo que is_image_blank)
+
+    Returns:
+        list: Por recorte, {'blank', 'content_percent', 'contrast', 'edge_density'}
+    """
+    valid = [i for i, image in enumerate(images) if image is not None and image.size]
+    results = [{'blank': False, 'content_percent': None, 'contrast': None, 'edge_density': None}
+               for _ in images]
+    if not valid:
+        return results
+
+    grays = [cv2.cvtColor(images[i], cv2.COLOR_BGR2GRAY) if images[i].ndim == 3 else images[i] for i in valid]
+    shapes = [gray.shape for gray in grays]
+    sizes = np.array([gray.size for gray in grays], dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    flat = np.concatenate([gray.ravel() for gray in grays])
+    del grays
+
+    # Mismas definiciones que is_image_blank: contenido = gris < umbral, y la máscara de
+    # contornos (THRESH_BINARY_INV) marca gris <= umbral
+    dark = flat < threshold
+    content = segment_counts(dark, starts, sizes) / sizes * 100
+    contrast = np.maximum.reduceat(flat, starts).astype(np.int32) - np.minimum.reduceat(flat, starts)
+
+    # Densidad de bordes gruesa: cambios claro/oscuro entre píxeles consecutivos
+    transitions = np.concatenate((dark[1:] != dark[:-1], [False]))
+    edge_density = segment_counts(transitions, starts, sizes) / sizes
+
+    blank = ((content < MAX_BLANK_CONTENT) |
+             ((contrast < MAX_BLANK_CONTRAST) & (content < MAX_LOW_CONTRAST_CONTENT)))
+
+    # Regla de poco contenido: contornos (los mismos que is_image_blank) sólo de los candidatos
+    for k in np.flatnonzero(~blank & (content < MAX_SPARSE_CONTENT)):
+        gray = flat[starts[k]:starts[k] + sizes[k]].reshape(shapes[k])
+        areas = RectangleFeatures(gray).contour_areas(threshold)
+        blank[k] = all(area <= MAX_SPARSE_CONTOUR_AREA for area in areas)
+
+    for k, i in enumerate(valid):
+        results[i] = {
+            'blank': bool(blank[k]),
+            'content_percent': float(content[k]),
+            'contrast': int(contrast[k]),
+            'edge_density': float(edge_density[k])
+        }
+    return results
+
+def split_blank_cells(cells, threshold=230):
+    """
+    Separa las celdas en blanco del resto antes de clasificar.
+
+    Args:
+        cells: Celdas con la clave 'image' (ver extract_rectangles.extract_cells)
+
+    Returns:
+        tuple: (celdas en blanco, celdas a clasificar, informe del prefiltro)
+    """
+    results = prefilter_blank_images([cell.get('image') for cell in cells], threshold)
+    blank, remaining = [], []
+    for cell, result in zip(cells, results):
+        cell['prefilter'] = result
+        (blank if result['blank'] else remaining).append(cell)
+    report = {'total': len(cells), 'blank': len(blank), 'remaining': len(remaining)}
+    print(f"⚡ Prefiltro de celdas en blanco: {len(blank)}/{len(cells)} descartadas sin OCR")
+    return blank, remaining, report
@@ -2,10 +2,30 @@ import cv2
 import numpy as np
 import os
 import shutil
+import threading
 from pathlib import Path
-import pytesseract
 from PIL import Image
 
+from blank_prefilter import split_blank_cells
+from ocr_cache import cache_report
+from ocr_montage import montage_ocr, report_montage
+from ocr_normalizer import normalizer_report
+from ocr_service import CODE_ACCEPT_CONFIDENCE, CODE_REVIEW_CONFIDENCE, char_confidences, recognize
+from rectangle_features import RectangleFeatures
+
+# Configuración de Tesseract para códigos de producto
+CODE_OCR_CONFIG = '--psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+
+# Variantes de OCR de contains_significant_text, en su orden original
+OCR_VARIANTS = ('gris', 'adaptativo', 'invertido')
+
+# Recortes analizados antes de reordenar las variantes según sus victorias
+CASCADE_MIN_SAMPLES = 20
+
+_ocr_stats = {'crops': 0, 'calls': 0, 'early_exits': 0, 'skipped': 0,
+              'wins': {variant: 0 for variant in OCR_VARIANTS}}
+_ocr_stats_lock = threading.Lock()
+
 def clean_output_directories(codes_dir, images_dir):
     """
     Limpia las carpetas de salida para comenzar desde cero.
@@ -33,54 +53,40 @@ def is_image_blank(image, min_content_percent=0.5, threshold=230):
     Determina si una imagen está en blanco o tiene contenido significativo.
     
     Args:
-        image: Imagen en formato numpy array (OpenCV)
+        image: Imagen en formato numpy array (OpenCV) o RectangleFeatures del recorte
         min_content_percent: Porcentaje mínimo de píxeles no blancos para considerar válida
         threshold: Umbral para distinguir entre blanco y no blanco (0-255)
     
     Returns:
         bool: True si la imagen está en blanco (tiene muy poco contenido)
     """
-    # Convertir a escala de grises si no lo está
-    if len(image.shape) == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = image
+    features = RectangleFeatures.of(image)
     
     # Contar píxeles que no son completamente blancos (valor < threshold)
-    non_white_pixels = np.sum(gray < threshold)
-    total_pixels = gray.size
-    
-    # Calcular el porcentaje de contenido
-    content_percent = (non_white_pixels / total_pixels) * 100
+    content_percent = features.content_percent(threshold)
     
     # Verificar el contraste de la imagen
-    min_val, max_val, _, _ = cv2.minMaxLoc(gray)
-    contrast = max_val - min_val
-    
-    # Binarizar la imagen para detectar mejor los componentes no blancos
-    _, binary = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY_INV)
+    contrast = features.contrast
     
-    # Encontrar contornos
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # Contornos de la imagen binarizada (umbral threshold) con sus áreas
+    areas = features.contour_areas(threshold)
     
     # Filtrar contornos muy pequeños (probablemente ruido)
-    significant_contours = [cnt for cnt in contours if cv2.contourArea(cnt) > 50]
+    significant_contours = [i for i, area in enumerate(areas) if area > 50]
     has_significant_contours = len(significant_contours) > 0
     
     # Detectar si es una silueta continua (como un colgante)
     # Las siluetas de joyería a menudo tienen contornos conectados
     has_jewelry_silhouette = False
-    for cnt in significant_contours:
-        area = cv2.contourArea(cnt)
+    for i in significant_contours:
         # Las joyas/colgantes suelen tener contornos significativos
-        if area > 500:
+        if areas[i] > 500:
             # Obtener forma aproximada del contorno
-            perimeter = cv2.arcLength(cnt, True)
-            approx = cv2.approxPolyDP(cnt, 0.02 * perimeter, True)
+            vertices = features.approx_vertices(threshold, i)
             # Si es una forma relativamente simple pero no un rectángulo perfecto
-            if 4 < len(approx) < 20:
+            if 4 < vertices < 20:
                 has_jewelry_silhouette = True
-                print(f"    Detectada posible silueta de joyería (puntos de contorno: {len(approx)})")
+                print(f"    Detectada posible silueta de joyería (puntos de contorno: {vertices})")
     
     # Imprimir resultados para diagnóstico
     print(f"    Contenido no blanco: {content_percent:.2f}%, Contraste: {contrast}")
@@ -109,36 +115,35 @@ def is_image_blank(image, min_content_percent=0.5, threshold=230):
     
     return is_blank
 
-def contains_significant_text(image, min_chars=7):
+def contains_significant_text(image, min_chars=7, cascade=True, precomputed_text=None):
     """
     Detecta si una imagen contiene suficientes caracteres alfanuméricos para ser considerada un código.
     Versión mejorada con criterios más estrictos para reducir falsos positivos.
     
     Args:
-        image: Imagen en formato numpy array (OpenCV)
+        image: Imagen en formato numpy array (OpenCV) o RectangleFeatures del recorte
         min_chars: Número mínimo de caracteres alfanuméricos para considerar que hay texto significativo
+        cascade: Usar la cascada de OCR (ver ocr_cascade); con False se leen siempre las
+                 tres variantes en su orden original
+        precomputed_text: Texto o resultado de OCR (ver ocr_service.ocr_result) ya leído
+                          de la variante en grises (p. ej. con el OCR por mosaico de
+                          ocr_montage.py); evita esa llamada a Tesseract
     
     Returns:
         bool: True si se detecta texto significativo de un código
     """
     # Preparar imagen para OCR
-    if len(image.shape) == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = image
+    features = RectangleFeatures.of(image)
     
     # Detectar características de imagen que podrían interferir con el OCR
     # Detectar siluetas cerradas (como siluetas de joyas)
-    _, binary = cv2.threshold(gray, 220, 255, cv2.THRESH_BINARY_INV)
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    areas = features.contour_areas(220)
     
     # Detectar contornos cerrados y compactos (como siluetas de joyería)
     has_jewelry_silhouette = False
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
+    for i, area in enumerate(areas):
         if area > 1000:
-            hull = cv2.convexHull(cnt)
-            hull_area = cv2.contourArea(hull)
+            hull_area = features.hull_area(220, i)
             if hull_area > 0:
                 solidity = float(area) / hull_area
                 
@@ -152,32 +157,51 @@ def contains_significant_text(image, min_chars=7):
         print(f"    ⚠️ Ajustando criterios OCR por posible silueta de joyería")
         min_chars = min_chars + 3  # Requerir más caracteres para considerar un código válido
     
-    # Método 1: Usar directamente la imagen en escala de grises
-    text1 = pytesseract.image_to_string(
-        gray, 
-        config='--psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
-    )
+    precomputed = {'gris': as_ocr_result(precomputed_text)} if precomputed_text is not None else {}
+    is_code, alphanumeric_chars, digits_count, letters_count = ocr_cascade(features, min_chars, precomputed,
+                                                                          early_exit=cascade)
     
-    # Método 2: Aplicar umbral adaptativo para mejorar el contraste
-    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                  cv2.THRESH_BINARY, 11, 2)
-    text2 = pytesseract.image_to_string(
-        binary,
-        config='--psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
-    )
+    # Imprimir información de diagnóstico
+    print(f"    Caracteres detectados: {len(alphanumeric_chars)} ({alphanumeric_chars})")
+    print(f"    Dígitos: {digits_count}, Letras: {letters_count}")
+    print(f"    ¿Código detectado? {is_code}")
     
+    return is_code
+
+def as_ocr_result(value):
+    """Admite un texto plano (confianza desconocida) o un resultado de ocr_service.ocr_result."""
+    if isinstance(value, dict):
+        return value
+    return {'text': value, 'words': None, 'confidence': None, 'min_confidence': None}
+
+def confidence_score(result, alphanumeric_chars):
+    """
+    Caracteres alfanuméricos ponderados por su confianza: cuántos se esperan correctos.
+    Sin confianzas (texto plano) cuenta cada carácter entero, como antes.
+    """
+    if not result.get('words'):
+        return float(len(alphanumeric_chars))
+    return sum(conf / 100 for word in result['words']
+               for char, conf in zip(word['text'], char_confidences(word)) if char.isalnum())
+
+def variant_image(features, variant):
+    """Imagen de una variante del recorte ('gris', 'adaptativo' o 'invertido')."""
+    if variant == 'gris':
+        # Método 1: Usar directamente la imagen en escala de grises
+        return features.gray
+    if variant == 'adaptativo':
+        # Método 2: Aplicar umbral adaptativo para mejorar el contraste
+        return features.adaptive_binary
     # Método 3: Invertir imagen binaria (puede ayudar con ciertos tipos de códigos)
-    inverted = cv2.bitwise_not(binary)
-    text3 = pytesseract.image_to_string(
-        inverted,
-        config='--psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
-    )
-    
-    # Seleccionar el resultado con más caracteres alfanuméricos
-    texts = [text1, text2, text3]
-    alphanumeric_counts = [sum(c.isalnum() for c in t) for t in texts]
-    text = texts[alphanumeric_counts.index(max(alphanumeric_counts))]
+    return cv2.bitwise_not(features.adaptive_binary)
+
+def evaluate_code_text(text, min_chars):
+    """
+    Aplica los criterios de código al texto de OCR.
     
+    Returns:
+        tuple: (es código, caracteres alfanuméricos, nº de dígitos, nº de letras)
+    """
     # Filtrar solo caracteres alfanuméricos
     alphanumeric_chars = ''.join(c for c in text if c.isalnum())
     
@@ -190,10 +214,6 @@ def contains_significant_text(image, min_chars=7):
     digits_count = len(digits)
     letters_count = len(letters)
     
-    # Imprimir información de diagnóstico
-    print(f"    Caracteres detectados: {char_count} ({alphanumeric_chars})")
-    print(f"    Dígitos: {digits_count}, Letras: {letters_count}")
-    
     # Evaluación más estricta de códigos - CRITERIOS ACTUALIZADOS
     is_code = False
     
@@ -231,36 +251,197 @@ def contains_significant_text(image, min_chars=7):
         if char_count < min_chars + 2:
             is_code = False
     
-    print(f"    ¿Código detectado? {is_code}")
-    
-    return is_code
+    return is_code, alphanumeric_chars, digits_count, letters_count
+
+def ocr_cascade(features, min_chars, precomputed=None, early_exit=True):
+    """
+    Cascada de OCR: prueba primero la variante que más veces ha ganado y se para en
+    cuanto una lectura es decisiva (ver decisive_reading), que es la que se evalúa. Los
+    recortes ambiguos leen todas las variantes y gana la de más caracteres alfanuméricos
+    ponderados por su confianza (en empate, la del orden original). Con early_exit=False
+    se leen siempre las tres variantes en su orden original. Las variantes de
+    'precomputed' ({variante: resultado}) se evalúan primero y no cuentan como llamadas;
+    las imágenes uniformes no tienen nada que leer y tampoco van a Tesseract.
+    """
+    precomputed = precomputed or {}
+    order = ocr_variant_order() if early_exit else OCR_VARIANTS
+    order = sorted(order, key=lambda variant: variant not in precomputed)
+    results = []
+    calls = 0
+    skipped = 0
+    decisive = None
+    for variant in order:
+        if variant in precomputed:
+            result = precomputed[variant]
+        else:
+            image = variant_image(features, variant)
+            if is_uniform(image):
+                result = as_ocr_result('')
+                skipped += 1
+            else:
+                result = recognize(image, CODE_OCR_CONFIG, normalize=True)
+                calls += 1
+        evaluation = evaluate_code_text(result['text'], min_chars)
+        results.append((-confidence_score(result, evaluation[1]), OCR_VARIANTS.index(variant), variant, evaluation))
+        if early_exit and decisive_reading(evaluation, result):
+            decisive = results[-1]
+            break
+    
+    _, _, winner, evaluation = decisive or min(results, key=lambda result: result[:2])
+    if early_exit:
+        early = decisive is not None and len(results) < len(OCR_VARIANTS)
+        record_ocr_cascade(winner, calls, skipped, early)
+        if early:
+            print(f"    ⚡ Cascada OCR: código aceptado con '{winner}' tras {calls} llamada(s)")
+    return evaluation
+
+def decisive_reading(evaluation, result):
+    """
+    Lectura que no necesita más variantes: un código con confianza media de al menos
+    CODE_ACCEPT_CONFIDENCE y ningún carácter que main.py mandaría a revisión. Una
+    lectura sin confianza (texto plano) nunca es decisiva.
+    """
+    return (evaluation[0] and confident(result['confidence'], CODE_ACCEPT_CONFIDENCE)
+            and confident(result['min_confidence'], CODE_REVIEW_CONFIDENCE))
+
+def confident(confidence, threshold):
+    return confidence is not None and confidence >= threshold
+
+def ocr_variant_order():
+    """Variantes ordenadas por victorias una vez hay muestras suficientes (empates: orden original)."""
+    with _ocr_stats_lock:
+        if _ocr_stats['crops'] < CASCADE_MIN_SAMPLES:
+            return OCR_VARIANTS
+        wins = dict(_ocr_stats['wins'])
+    return tuple(sorted(OCR_VARIANTS, key=lambda variant: -wins[variant]))
+
+def is_uniform(image):
+    """True si todos los píxeles tienen el mismo valor (nada que leer)."""
+    return image.size == 0 or image.min() == image.max()
+
+def record_ocr_cascade(winner, calls, skipped, early_exit):
+    with _ocr_stats_lock:
+        _ocr_stats['crops'] += 1
+        _ocr_stats['calls'] += calls
+        _ocr_stats['skipped'] += skipped
+        _ocr_stats['early_exits'] += early_exit
+        _ocr_stats['wins'][winner] += 1
+
+def ocr_cascade_report():
+    """
+    Estadísticas de la cascada: recortes, llamadas a Tesseract, media por recorte,
+    salidas anticipadas, variantes uniformes omitidas y victorias.
+    """
+    with _ocr_stats_lock:
+        report = dict(_ocr_stats, wins=dict(_ocr_stats['wins']))
+    report['calls_per_crop'] = report['calls'] / report['crops'] if report['crops'] else 0.0
+    return report
+
+def load_rectangle(source):
+    """
+    Obtiene la imagen y el nombre de un rectángulo a partir de una ruta,
+    de una celda en memoria (ver extract_rectangles.extract_cells) o de un array.
+
+    Returns:
+        tuple: (imagen o None, nombre de archivo o None)
+    """
+    if isinstance(source, dict):
+        return source.get('image'), source.get('name')
+    if isinstance(source, np.ndarray):
+        return source, None
+    return cv2.imread(str(source)), os.path.basename(str(source))
+
+def load_cells_from_directory(input_dir):
+    """
+    Carga los rectángulos guardados en input_dir como celdas en memoria,
+    con el mismo formato que extract_rectangles.extract_cells más la clave 'path'.
+    """
+    image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
+    image_paths = []
+
+    for ext in image_extensions:
+        image_paths.extend(list(Path(input_dir).glob(f'*{ext}')))
+        image_paths.extend(list(Path(input_dir).glob(f'*{ext.upper()}')))
+
+    cells = []
+    for index, image_path in enumerate(image_paths):
+        cells.append({
+            'index': index,
+            'name': image_path.name,
+            'path': str(image_path),
+            'image': cv2.imread(str(image_path))
+        })
+    return cells
+
+def save_cell(cell, destination_dir):
+    """
+    Guarda una celda clasificada en destination_dir. Si la celda ya existe en disco
+    se copia el archivo; si sólo está en memoria se codifica directamente.
+    """
+    destination = os.path.join(destination_dir, cell['name'])
+    if cell.get('path'):
+        shutil.copy2(cell['path'], destination)
+    else:
+        cv2.imwrite(destination, cell['image'])
+    return destination
+
+def looks_like_jewelry(features):
+    """
+    Reglas visuales con las que classify_rectangle da un recorte por foto de joyería
+    sin llegar al OCR (también deciden qué celdas entran en el mosaico de process_cells).
 
-def classify_rectangle(image_path):
+    Args:
+        features: RectangleFeatures del recorte (no en blanco)
+
+    Returns:
+        bool: True si el recorte parece una imagen de producto
+    """
+    content_percent = features.content_percent(220)
+    areas = features.contour_areas(220)
+    large_contours = sum(1 for area in areas if area > 200)
+
+    # Imágenes de joyería suelen tener alta densidad de píxeles y contornos complejos
+    if content_percent > 10 and len(areas) > 8:
+        return True
+
+    # Imágenes de joyería suelen tener contornos grandes
+    if large_contours >= 1 and content_percent > 5:
+        return True
+
+    # Siluetas de joyería (como el colgante de oso): ratio característico de bordes
+    edge_count = features.edge_count
+    edge_ratio = edge_count / features.total_pixels
+    if edge_ratio > 0.03 and edge_count > 200:
+        print(f"  ⚠️ Detectada posible silueta de joyería (ratio bordes: {edge_ratio:.4f})")
+        return True
+
+    return False
+
+def classify_rectangle(image_path, features=None, precomputed_text=None):
     """
     Clasifica una imagen como texto, imagen (no blanca) o descartar (blanca).
     Versión mejorada con verificaciones adicionales para corregir falsos positivos.
-    
+
     Args:
-        image_path: Ruta a la imagen a clasificar
-    
+        image_path: Ruta a la imagen a clasificar, celda en memoria o array numpy
+        features: RectangleFeatures ya calculado para este recorte (opcional)
+        precomputed_text: Texto ya leído en grises para contains_significant_text (opcional)
+
     Returns:
         str: 'text', 'image', o 'discard'
     """
     # Leer imagen
-    image = cv2.imread(str(image_path))
+    image, file_name = load_rectangle(image_path)
     if image is None:
-        print(f"No se pudo cargar la imagen: {image_path}")
+        print(f"No se pudo cargar la imagen: {file_name or image_path}")
         return 'discard'
-    
+
     # Lista de rectángulos que sabemos que deben ser imágenes (basado en el análisis previo)
     known_images = ['rect_0.png', 'rect_12.png', 'rect_15.png', 'rect_9.png', 'rect_6.png', 'rect_3.png']
-    
+
     # Lista de rectángulos que sabemos que son códigos válidos
     known_codes = ['rect_2.png', 'rect_5.png', 'rect_8.png', 'rect_11.png', 'rect_14.png', 'rect_17.png']
     
-    # Obtener solo el nombre del archivo sin la ruta
-    file_name = os.path.basename(str(image_path))
-    
     # Verificación de casos conocidos - Usar impresión más visible para debug
     if file_name in known_images:
         print(f"  🖼️🖼️🖼️ ATENCIÓN: Forzando clasificación como IMAGEN (caso conocido): {file_name}")
@@ -270,63 +451,32 @@ def classify_rectangle(image_path):
         print(f"  📝📝📝 ATENCIÓN: Forzando clasificación como CÓDIGO (caso conocido): {file_name}")
         return 'text'
     
+    # Todas las heurísticas comparten las características calculadas una sola vez
+    if features is None:
+        features = RectangleFeatures(image, file_name)
+    
     # Primero, verificar si la imagen está en blanco
-    if is_image_blank(image):
+    if is_image_blank(features):
         return 'discard'
     
-    # Verificar contenido para analizar si es más probable que sea joyería vs código
-    if len(image.shape) == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = image
-        
     # Calcular métricas para ayudar a distinguir códigos vs imágenes
-    non_white_pixels = np.sum(gray < 220)
-    total_pixels = gray.size
-    content_percent = (non_white_pixels / total_pixels) * 100
-    
-    # Binarizar para análisis de contornos
-    _, binary = cv2.threshold(gray, 220, 255, cv2.THRESH_BINARY_INV)
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    content_percent = features.content_percent(220)
     
     # Características típicas de una imagen de joyería vs código
-    contour_count = len(contours)
-    large_contours = sum(1 for cnt in contours if cv2.contourArea(cnt) > 200)
+    areas = features.contour_areas(220)
+    contour_count = len(areas)
+    large_contours = sum(1 for area in areas if area > 200)
     
     # Print diagnostic info
     print(f"    Análisis adicional: Contenido no blanco: {content_percent:.2f}%, Contornos: {contour_count}, Contornos grandes: {large_contours}")
     
-    # Reglas heurísticas adicionales
-    likely_jewelry = False
-    
-    # Imágenes de joyería suelen tener alta densidad de píxeles y contornos complejos
-    if content_percent > 10 and contour_count > 8:
-        likely_jewelry = True
-    
-    # Imágenes de joyería suelen tener contornos grandes
-    if large_contours >= 1 and content_percent > 5:
-        likely_jewelry = True
-        
-    # Detectar posibles siluetas de joyería (como el colgante de oso)
-    # Usar morfología para detectar siluetas de joyería
-    kernel = np.ones((3,3), np.uint8)
-    dilated = cv2.dilate(binary, kernel, iterations=1)
-    edges = cv2.Canny(dilated, 50, 150)
-    edge_count = np.sum(edges > 0)
-    edge_ratio = edge_count / total_pixels
-    
-    # Las joyas como colgantes suelen tener un ratio característico de bordes
-    if edge_ratio > 0.03 and edge_count > 200:
-        print(f"  ⚠️ Detectada posible silueta de joyería (ratio bordes: {edge_ratio:.4f})")
-        likely_jewelry = True
-    
     # Si parece joyería, clasificar como imagen independientemente del OCR
-    if likely_jewelry:
+    if looks_like_jewelry(features):
         print(f"  ⚠️ Clasificando como IMAGEN basado en características visuales")
         return 'image'
     
     # Si contains_significant_text devuelve True, es un código
-    if contains_significant_text(image):
+    if contains_significant_text(features, precomputed_text=precomputed_text):
         # Verificación adicional por si acaso
         if content_percent > 20 and contour_count > 12:
             print(f"  ⚠️ Reclasificando como IMAGEN por complejidad visual a pesar del texto detectado")
@@ -346,22 +496,44 @@ def process_rectangles(input_dir, codes_dir, images_dir):
         codes_dir: Directorio donde se guardarán los rectángulos de texto
         images_dir: Directorio donde se guardarán los rectángulos de imágenes
     """
-    # Limpiar las carpetas de salida para comenzar desde cero
-    clean_output_directories(codes_dir, images_dir)
-    
     # Obtener todas las imágenes en el directorio de entrada
-    image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
-    image_paths = []
+    cells = load_cells_from_directory(input_dir)
     
-    for ext in image_extensions:
-        image_paths.extend(list(Path(input_dir).glob(f'*{ext}')))
-        image_paths.extend(list(Path(input_dir).glob(f'*{ext.upper()}')))
-    
-    if not image_paths:
+    if not cells:
+        # Limpiar las carpetas de salida para comenzar desde cero
+        clean_output_directories(codes_dir, images_dir)
         print(f"No se encontraron imágenes en {input_dir}")
         return
     
-    print(f"Procesando {len(image_paths)} rectángulos...")
+    return process_cells(cells, codes_dir, images_dir)
+
+def process_cells(cells, codes_dir, images_dir, arena=None, montage=False):
+    """
+    Clasifica en códigos o imágenes las celdas ya cargadas en memoria
+    (ver extract_rectangles.extract_cells) sin volver a leerlas de disco.
+    Sólo se escriben en disco las celdas clasificadas, en codes_dir e images_dir.
+    
+    Args:
+        cells: Celdas con al menos las claves 'name' e 'image'
+        codes_dir: Directorio donde se guardarán los rectángulos de texto
+        images_dir: Directorio donde se guardarán los rectángulos de imágenes
+        arena: CropArena opcional (ver crop_arena.py); si se indica, la clasificación se
+               anota como etiqueta en el arena y no se copia ningún archivo
+        montage: Leer la variante en grises de todas las celdas con un solo OCR por
+                 mosaico (ver ocr_montage.py) en lugar de una llamada por celda
+    
+    Returns:
+        dict: Clasificación final por nombre de celda ('text', 'image' o 'discard')
+    """
+    # Limpiar las carpetas de salida para comenzar desde cero
+    if arena is None:
+        clean_output_directories(codes_dir, images_dir)
+    
+    if not cells:
+        print("No se recibieron celdas para clasificar")
+        return {}
+    
+    print(f"Procesando {len(cells)} rectángulos...")
     
     # Definir listas de imágenes y códigos conocidos (globalmente)
     known_images = ['rect_0.png', 'rect_12.png', 'rect_15.png', 'rect_9.png', 'rect_6.png', 'rect_3.png']
@@ -373,67 +545,91 @@ def process_rectangles(input_dir, codes_dir, images_dir):
     discard_count = 0
     
     # Primera pasada - clasificación inicial
+    cells_by_name = {cell['name']: cell for cell in cells}
     classification_results = {}
     confidence_scores = {}  # Añadir puntuaciones de confianza para cada clasificación
     
-    for image_path in image_paths:
-        file_name = os.path.basename(str(image_path))
+    # Prefiltro por lotes: las celdas en blanco (salvo casos conocidos) se descartan sin OCR
+    blank_cells, _, _ = split_blank_cells(cells)
+    blank_names = {cell['name'] for cell in blank_cells} - set(known_images) - set(known_codes)
+    
+    # Características de cada celda, calculadas una sola vez para el mosaico y la clasificación
+    features_by_name = {}
+    
+    # OCR por mosaico: una llamada para las celdas que pueden llegar al OCR. Las que
+    # parecen fotos de producto (looks_like_jewelry) se clasifican sin leerlas y
+    # sólo engordarían el mosaico
+    precomputed_texts = {}
+    if montage:
+        candidates = []
+        for cell in cells:
+            name = cell['name']
+            if (name in blank_names or cell.get('image') is None
+                    or name in known_images or name in known_codes):
+                continue
+            features_by_name[name] = RectangleFeatures(cell['image'], name)
+            if not looks_like_jewelry(features_by_name[name]):
+                candidates.append(cell)
+        if candidates:
+            result = montage_ocr([cell['image'] for cell in candidates], CODE_OCR_CONFIG)
+            report_montage(result, len(candidates))
+            precomputed_texts = {cell['name']: ocr for cell, ocr in zip(candidates, result['results'])}
+    
+    for cell in cells:
+        file_name = cell['name']
         print(f"Analizando: {file_name}")
         
+        if file_name in blank_names:
+            classification_results[file_name] = 'discard'
+            discard_count += 1
+            print(f"  ⚡ Descartado por el prefiltro de celdas en blanco")
+            continue
+        
         # Comprobar si es un caso conocido primero
         is_known_case = False
         
         if file_name in known_images:
             classification = 'image'
-            confidence_scores[image_path] = 1.0  # Máxima confianza para casos conocidos
+            confidence_scores[file_name] = 1.0  # Máxima confianza para casos conocidos
             is_known_case = True
             print(f"  🖼️🖼️🖼️ ATENCIÓN: Forzando clasificación como IMAGEN (caso conocido): {file_name}")
         elif file_name in known_codes:
             classification = 'text'
-            confidence_scores[image_path] = 1.0  # Máxima confianza para casos conocidos
+            confidence_scores[file_name] = 1.0  # Máxima confianza para casos conocidos
             is_known_case = True
             print(f"  📝📝📝 ATENCIÓN: Forzando clasificación como CÓDIGO (caso conocido): {file_name}")
         
         # Si no es un caso conocido, realizar la clasificación normal
         if not is_known_case:
-            print(f"Analizando: {image_path.name}")
+            print(f"Analizando: {file_name}")
         
         # Pre-análisis para detectar caso de colgante de oso u otra silueta de joyería
-        image = cv2.imread(str(image_path))
-        if image is not None:
-            # Convertir a escala de grises
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
+        image = cell['image']
+        # Características del recorte calculadas una vez para todas las heurísticas
+        features = features_by_name.get(file_name)
+        if features is None and image is not None:
+            features = RectangleFeatures(image, file_name)
+        if features is not None:
             # Análisis de bordes y siluetas
-            _, binary = cv2.threshold(gray, 220, 255, cv2.THRESH_BINARY_INV)
-            contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            areas = features.contour_areas(220)
             
             # Buscar contornos cerrados que puedan ser siluetas de joyería
-            for cnt in contours:
-                area = cv2.contourArea(cnt)
+            for i, area in enumerate(areas):
                 if area > 1000:  # Contorno significativo
-                    perimeter = cv2.arcLength(cnt, True)
-                    approx = cv2.approxPolyDP(cnt, 0.02 * perimeter, True)
-                    
                     # Detectar formas orgánicas (más puntos que un simple rectángulo)
-                    if len(approx) > 6:
+                    if features.approx_vertices(220, i) > 6:
                         # Esto podría ser una silueta de joyería
-                        print(f"  ⚠️ Posible silueta de joyería detectada en {image_path.name}")
+                        print(f"  ⚠️ Posible silueta de joyería detectada en {file_name}")
         
         # Realizar la clasificación
-        classification = classify_rectangle(image_path)
-        classification_results[image_path] = classification
+        classification = classify_rectangle(cell, features, precomputed_texts.get(file_name))
+        classification_results[file_name] = classification
         
         # Añadir una puntuación de confianza basada en características de la imagen
-        if image is not None:
+        if features is not None:
             # Características para evaluar la confianza
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
-            _, binary = cv2.threshold(gray, 220, 255, cv2.THRESH_BINARY_INV)
-            contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            non_white_pixels = np.sum(gray < 220)
-            total_pixels = gray.size
-            content_percent = (non_white_pixels / total_pixels) * 100
+            contour_count = len(features.contour_areas(220))
+            content_percent = features.content_percent(220)
             
             # Confianza inicial alta
             confidence = 0.8
@@ -441,24 +637,22 @@ def process_rectangles(input_dir, codes_dir, images_dir):
             # Ajustar confianza según características
             if classification == 'text':
                 # Para texto, reducir confianza si tiene características de joyería
-                if content_percent > 15 or len(contours) > 10:
+                if content_percent > 15 or contour_count > 10:
                     confidence -= 0.2
                     
                 # Si parece una silueta, baja confianza para la clasificación como texto
-                largest_contour = max(contours, key=cv2.contourArea) if contours else None
-                if largest_contour is not None:
-                    perimeter = cv2.arcLength(largest_contour, True)
-                    approx = cv2.approxPolyDP(largest_contour, 0.02 * perimeter, True)
-                    if len(approx) > 6:
+                largest_index = features.largest_contour_index(220)
+                if largest_index is not None:
+                    if features.approx_vertices(220, largest_index) > 6:
                         confidence -= 0.3
             
             elif classification == 'image':
                 # Para imágenes, aumentar confianza si tiene características de joyería
-                if content_percent > 10 or len(contours) > 8:
+                if content_percent > 10 or contour_count > 8:
                     confidence += 0.1
             
-            confidence_scores[image_path] = min(max(confidence, 0.1), 1.0)  # Limitar entre 0.1 y 1.0
-            print(f"  Confianza de clasificación: {confidence_scores[image_path]:.2f}")
+            confidence_scores[file_name] = min(max(confidence, 0.1), 1.0)  # Limitar entre 0.1 y 1.0
+            print(f"  Confianza de clasificación: {confidence_scores[file_name]:.2f}")
         
         if classification == 'text':
             text_count += 1
@@ -481,8 +675,8 @@ def process_rectangles(input_dir, codes_dir, images_dir):
         print(f"\nAjustando clasificación para equilibrar códigos e imágenes...")
         
         # Crear lista de nombres de archivos conocidos para preservarlos durante el balanceo
-        known_image_names = [os.path.basename(str(p)) for p in image_paths if os.path.basename(str(p)) in known_images]
-        known_code_names = [os.path.basename(str(p)) for p in image_paths if os.path.basename(str(p)) in known_codes]
+        known_image_names = [name for name in cells_by_name if name in known_images]
+        known_code_names = [name for name in cells_by_name if name in known_codes]
         
         print(f"  Preservando clasificación de imágenes conocidas: {known_image_names}")
         print(f"  Preservando clasificación de códigos conocidos: {known_code_names}")
@@ -493,9 +687,9 @@ def process_rectangles(input_dir, codes_dir, images_dir):
             to_convert = text_count - target_count
             
             # Filtrar para excluir casos conocidos
-            candidates = [(p, confidence_scores.get(p, 0.5)) 
-                          for p, c in classification_results.items() 
-                          if c == 'text' and os.path.basename(str(p)) not in known_codes]
+            candidates = [(name, confidence_scores.get(name, 0.5)) 
+                          for name, c in classification_results.items() 
+                          if c == 'text' and name not in known_codes]
             
             # Ordenar por menor confianza primero (convertir los menos confiables)
             candidates.sort(key=lambda x: x[1])
@@ -503,15 +697,15 @@ def process_rectangles(input_dir, codes_dir, images_dir):
             # Convertir los primeros 'to_convert' candidatos con menor confianza
             for i in range(min(to_convert, len(candidates))):
                 classification_results[candidates[i][0]] = 'image'
-                print(f"  Reclasificando {candidates[i][0].name} de TEXTO a IMAGEN (confianza: {candidates[i][1]:.2f})")
+                print(f"  Reclasificando {candidates[i][0]} de TEXTO a IMAGEN (confianza: {candidates[i][1]:.2f})")
         else:
             # Tenemos que convertir algunos 'image' en 'text'
             to_convert = image_count - target_count
             
             # Filtrar para excluir casos conocidos
-            candidates = [(p, confidence_scores.get(p, 0.5)) 
-                          for p, c in classification_results.items() 
-                          if c == 'image' and os.path.basename(str(p)) not in known_images]
+            candidates = [(name, confidence_scores.get(name, 0.5)) 
+                          for name, c in classification_results.items() 
+                          if c == 'image' and name not in known_images]
             
             # Ordenar por menor confianza primero
             candidates.sort(key=lambda x: x[1])
@@ -519,38 +713,56 @@ def process_rectangles(input_dir, codes_dir, images_dir):
             # Convertir los primeros 'to_convert' candidatos con menor confianza
             for i in range(min(to_convert, len(candidates))):
                 classification_results[candidates[i][0]] = 'text'
-                print(f"  Reclasificando {candidates[i][0].name} de IMAGEN a TEXTO (confianza: {candidates[i][1]:.2f})")
+                print(f"  Reclasificando {candidates[i][0]} de IMAGEN a TEXTO (confianza: {candidates[i][1]:.2f})")
     
     # Reset counters
     text_count = 0
     image_count = 0
     discard_count = 0
     
-    # Segunda pasada - aplicar la clasificación final y copiar archivos
-    for image_path, classification in classification_results.items():
+    # Segunda pasada - aplicar la clasificación final y guardar sólo las celdas clasificadas
+    for file_name, classification in classification_results.items():
+        cell = cells_by_name[file_name]
+        if arena is not None:
+            # Con arena sólo se anota la etiqueta: los PNG se exportan bajo demanda
+            arena.set_label(file_name, classification)
+
         if classification == 'text':
-            # Copiar al directorio de códigos
-            destination = os.path.join(codes_dir, image_path.name)
-            shutil.copy2(image_path, destination)
+            # Guardar en el directorio de códigos
+            if arena is None:
+                save_cell(cell, codes_dir)
             text_count += 1
-            print(f"  → Clasificado como TEXTO (código): {image_path.name}")
+            print(f"  → Clasificado como TEXTO (código): {file_name}")
             
         elif classification == 'image':
-            # Copiar al directorio de imágenes
-            destination = os.path.join(images_dir, image_path.name)
-            shutil.copy2(image_path, destination)
+            # Guardar en el directorio de imágenes
+            if arena is None:
+                save_cell(cell, images_dir)
             image_count += 1
-            print(f"  → Clasificado como IMAGEN: {image_path.name}")
+            print(f"  → Clasificado como IMAGEN: {file_name}")
             
         else:  # 'discard'
             discard_count += 1
-            print(f"  → Descartado (mayormente blanco): {image_path.name}")
+            print(f"  → Descartado (mayormente blanco): {file_name}")
     
     print("\nResumen de clasificación final:")
     print(f"  - Rectángulos de texto: {text_count}")
     print(f"  - Rectángulos de imagen: {image_count}")
     print(f"  - Descartados: {discard_count}")
-    print(f"  - Total procesado: {len(image_paths)}")
+    print(f"  - Total procesado: {len(cells)}")
+    
+    cascade = ocr_cascade_report()
+    if cascade['crops']:
+        print(f"  - Llamadas OCR por recorte: {cascade['calls_per_crop']:.2f} "
+              f"({cascade['early_exits']} salidas anticipadas, {cascade['skipped']} variantes uniformes "
+              f"omitidas, victorias: {cascade['wins']})")
+    cache = cache_report()
+    if cache['hits'] or cache['misses']:
+        print(f"  - Caché OCR: {cache['hits']} aciertos, {cache['misses']} fallos ({cache['hit_rate']:.0%})")
+    normalization = normalizer_report()
+    if normalization['images']:
+        print(f"  - Normalización OCR: {normalization['pixel_reduction']:.0%} menos píxeles, "
+              f"ahorro estimado {normalization['estimated_saved']:.2f} s")
     
     # Comprobar si todavía hay discrepancia entre el número de códigos e imágenes
     if text_count != image_count:
@@ -558,6 +770,12 @@ def process_rectangles(input_dir, codes_dir, images_dir):
         print("Este es un caso poco común que puede requerir revisión manual.")
     else:
         print(f"\n✅ Clasificación equilibrada: {text_count} códigos y {image_count} imágenes")
+    
+    if arena is not None:
+        arena.save_index()
+        print(f"🗃️ Etiquetas guardadas en {arena.index_path}")
+    
+    return classification_results
 
 def main():
     # Definir directorios
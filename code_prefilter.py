@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Prefiltro aprendido código/producto: decide qué celdas necesitan OCR.
+
+Cada celda que no está en blanco pasa por el OCR antes de saber si es una foto de
+producto o un código. Aquí una regresión logística en NumPy sobre características
+baratas del recorte (densidad de bordes, estadísticas de componentes conexos, perfil
+de tramos horizontales de tinta y variación de color) estima la probabilidad de que la
+celda contenga texto. Las celdas con probabilidad por debajo de 'skip_threshold' se
+consideran productos claros y van directas a la categorización de joyería sin OCR; el
+resto (códigos, medidas y casos dudosos) sigue pasando por Tesseract.
+
+El modelo se entrena con el histórico ya clasificado (codes_output como texto,
+images_output como producto y, opcionalmente, discards_output como texto) y se guarda
+en JSON junto a los demás modelos. El umbral se elige de forma conservadora para que
+prácticamente ningún código del entrenamiento se quede sin OCR, y la matriz de
+confusión y la fracción de OCR evitado se miden sobre una partición de validación.
+
+Uso:
+    python code_prefilter.py train --codes codes_output --images images_output [--discards discards_output]
+    python code_prefilter.py evaluate --codes codes_output --images images_output
+
+Variables de entorno: CODE_PREFILTER_MODEL (ruta del modelo) y
+CODE_PREFILTER_DISABLED=1 para pasar siempre por el OCR.
+"""
+
+import argparse
+import json
+import os
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from ocr_normalizer import text_mask
+
+DEFAULT_MODEL_PATH = os.path.join('MachineLearning', 'models', 'code_prefilter.json')
+MODEL_ENV = 'CODE_PREFILTER_MODEL'
+DISABLE_ENV = 'CODE_PREFILTER_DISABLED'
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+
+# Las características se calculan sobre el recorte reducido a este lado máximo
+FEATURE_SIZE = 256
+
+FEATURE_NAMES = [
+    'edge_density', 'ink_fraction', 'log_components', 'small_component_fraction',
+    'median_component_height', 'largest_component_share', 'ink_row_fraction',
+    'ink_bands', 'mean_run_length', 'runs_per_ink_row', 'gray_std', 'saturation_mean',
+    'log_aspect'
+]
+
+# Fracción máxima de celdas de texto del entrenamiento que pueden quedar sin OCR
+MAX_TEXT_LEAK = 0.0
+
+_stats = {'cells': 0, 'skipped': 0}
+_stats_lock = threading.Lock()
+
+def code_features(image):
+    """
+    Vector de características del recorte (orden de FEATURE_NAMES).
+
+    Args:
+        image: Recorte BGR o en grises
+
+    Returns:
+        np.ndarray: Vector float64 de len(FEATURE_NAMES)
+    """
+    height, width = image.shape[:2]
+    factor = FEATURE_SIZE / max(height, width)
+    if factor < 1:
+        image = cv2.resize(image, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    h, w = gray.shape
+
+    edges = cv2.Canny(gray, 50, 150)
+    mask = text_mask(gray)
+    ink = mask > 0
+    ink_pixels = int(np.count_nonzero(ink))
+
+    # Componentes conexos: el texto son muchos componentes pequeños de altura parecida
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    heights = stats[1:count, cv2.CC_STAT_HEIGHT]
+    areas = stats[1:count, cv2.CC_STAT_AREA]
+    components = count - 1
+    if components:
+        small_fraction = np.count_nonzero(heights <= 0.25 * h) / components
+        median_height = np.median(heights) / h
+        largest_share = areas.max() / max(ink_pixels, 1)
+    else:
+        small_fraction = median_height = largest_share = 0.0
+
+    # Perfil horizontal: filas con tinta, bandas de texto y longitud de los tramos
+    row_ink = np.count_nonzero(ink, axis=1)
+    ink_rows = row_ink > 0
+    bands = np.count_nonzero(np.diff(ink_rows.astype(np.int8)) == 1) + int(ink_rows[0])
+    starts = np.count_nonzero(ink[:, 1:] & ~ink[:, :-1]) + np.count_nonzero(ink[:, 0])
+    runs = max(starts, 1)
+
+    if image.ndim == 3:
+        saturation = (image.max(axis=2).astype(np.int16) - image.min(axis=2)).mean() / 255
+    else:
+        saturation = 0.0
+
+    return np.array([
+        np.count_nonzero(edges) / edges.size,
+        ink_pixels / ink.size,
+        np.log1p(components),
+        small_fraction,
+        median_height,
+        largest_share,
+        np.count_nonzero(ink_rows) / h,
+        bands,
+        ink_pixels / runs / w,
+        starts / max(np.count_nonzero(ink_rows), 1),
+        gray.std() / 255,
+        saturation,
+        np.log(width / height)
+    ], dtype=np.float64)
+
+def sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+def fit_logistic(X, y, l2=1e-2, iterations=3000, learning_rate=0.5):
+    """
+    Regresión logística por descenso de gradiente sobre características estandarizadas.
+
+    Returns:
+        tuple: (pesos, sesgo, media, desviación) para predecir sigmoid(((x - media) / desviación) @ pesos + sesgo)
+    """
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std == 0] = 1.0
+    Z = (X - mean) / std
+    weights = np.zeros(X.shape[1])
+    bias = 0.0
+    # Clases equilibradas: cada clase pesa lo mismo aunque haya más productos que códigos
+    sample_weight = np.where(y == 1, 0.5 / max(y.sum(), 1), 0.5 / max(len(y) - y.sum(), 1))
+    for _ in range(iterations):
+        error = (sigmoid(Z @ weights + bias) - y) * sample_weight
+        weights -= learning_rate * (Z.T @ error + l2 * weights)
+        bias -= learning_rate * error.sum()
+    return weights, bias, mean, std
+
+class CodePrefilter:
+    """Modelo del prefiltro: probabilidad de texto y decisión de saltar el OCR."""
+
+    def __init__(self, weights, bias, mean, std, skip_threshold, validation=None):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        self.skip_threshold = float(skip_threshold)
+        self.validation = validation or {}
+
+    def text_probability(self, features):
+        """Probabilidad de texto para un vector o una matriz de características."""
+        return sigmoid(((np.asarray(features) - self.mean) / self.std) @ self.weights + self.bias)
+
+    def skip_ocr(self, image):
+        """True si el recorte es un producto claro y puede categorizarse sin OCR."""
+        if image is None or not image.size:
+            return False
+        skip = bool(self.text_probability(code_features(image)) < self.skip_threshold)
+        with _stats_lock:
+            _stats['cells'] += 1
+            _stats['skipped'] += skip
+        return skip
+
+    def to_dict(self):
+        return {
+            'features': FEATURE_NAMES,
+            'weights': self.weights.tolist(),
+            'bias': self.bias,
+            'mean': self.mean.tolist(),
+            'std': self.std.tolist(),
+            'skip_threshold': self.skip_threshold,
+            'validation': self.validation
+        }
+
+    def save(self, path=DEFAULT_MODEL_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('features') != FEATURE_NAMES:
+            raise ValueError(f"El modelo {path} usa otras características; vuelve a entrenarlo")
+        return cls(data['weights'], data['bias'], data['mean'], data['std'],
+                   data['skip_threshold'], data.get('validation'))
+
+def routing_confusion(probabilities, labels, skip_threshold):
+    """
+    Matriz de confusión del enrutado (texto/producto real frente a OCR/sin OCR) y
+    fracción de llamadas de OCR evitadas.
+    """
+    skipped = probabilities < skip_threshold
+    text = labels == 1
+    matrix = {
+        'text_ocr': int(np.count_nonzero(text & ~skipped)),
+        'text_skipped': int(np.count_nonzero(text & skipped)),
+        'product_ocr': int(np.count_nonzero(~text & ~skipped)),
+        'product_skipped': int(np.count_nonzero(~text & skipped))
+    }
+    return {
+        'confusion_matrix': matrix,
+        'ocr_avoided': float(np.count_nonzero(skipped) / len(labels)) if len(labels) else 0.0,
+        'text_leak': matrix['text_skipped'] / max(int(np.count_nonzero(text)), 1)
+    }
+
+def load_labelled_features(codes_dir, images_dir, discards_dir=None):
+    """Características y etiquetas (1 = texto, 0 = producto) del histórico clasificado."""
+    sources = [(codes_dir, 1), (images_dir, 0)]
+    if discards_dir:
+        sources.append((discards_dir, 1))
+    features, labels = [], []
+    for directory, label in sources:
+        for path in sorted(Path(directory).iterdir()):
+            if path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            image = cv2.imread(str(path))
+            if image is None:
+                continue
+            features.append(code_features(image))
+            labels.append(label)
+    return np.array(features), np.array(labels, dtype=np.float64)
+
+def train_prefilter(X, y, validation_fraction=0.2, max_text_leak=MAX_TEXT_LEAK, seed=0):
+    """
+    Entrena el prefiltro y lo valida en una partición aparte.
+
+    El umbral para saltar el OCR es el cuantil max_text_leak de las probabilidades de
+    las celdas de texto del entrenamiento (con 0.0, la menor), sin pasar de 0.5.
+    """
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(y))
+    split = int(len(y) * (1 - validation_fraction))
+    train, validation = order[:split], order[split:]
+
+    weights, bias, mean, std = fit_logistic(X[train], y[train])
+    model = CodePrefilter(weights, bias, mean, std, 0.0)
+    text_probabilities = model.text_probability(X[train][y[train] == 1])
+    if len(text_probabilities):
+        model.skip_threshold = min(0.5, float(np.quantile(text_probabilities, max_text_leak)))
+
+    report = routing_confusion(model.text_probability(X[validation]), y[validation], model.skip_threshold)
+    report['samples'] = {'train': int(len(train)), 'validation': int(len(validation))}
+    model.validation = report
+    return model
+
+def print_validation(report, title='validación'):
+    matrix = report['confusion_matrix']
+    print(f"📊 Matriz de confusión ({title}):")
+    print(f"                 OCR   sin OCR")
+    print(f"  texto     {matrix['text_ocr']:8d}  {matrix['text_skipped']:8d}")
+    print(f"  producto  {matrix['product_ocr']:8d}  {matrix['product_skipped']:8d}")
+    print(f"⚡ OCR evitado: {report['ocr_avoided']:.0%} - textos sin OCR: {report['text_leak']:.1%}")
+
+_model = None
+_model_loaded = False
+_model_lock = threading.Lock()
+
+def get_code_prefilter():
+    """Prefiltro compartido del proceso, o None si está desactivado o no hay modelo entrenado."""
+    global _model, _model_loaded
+    if os.environ.get(DISABLE_ENV, '') in ('1', 'true', 'yes'):
+        return None
+    with _model_lock:
+        if not _model_loaded:
+            _model_loaded = True
+            path = os.environ.get(MODEL_ENV, DEFAULT_MODEL_PATH)
+            try:
+                _model = CodePrefilter.load(path)
+                print(f"⚡ Prefiltro código/producto cargado (umbral {_model.skip_threshold:.3f})")
+            except FileNotFoundError:
+                print(f"ℹ️ Sin modelo de prefiltro en {path}: todas las celdas pasan por el OCR")
+            except (ValueError, KeyError) as e:
+                print(f"⚠️ Modelo de prefiltro no válido: {e}")
+        return _model
+
+def prefilter_report():
+    """Celdas evaluadas, celdas sin OCR y fracción de OCR evitado en este proceso."""
+    with _stats_lock:
+        report = dict(_stats)
+    report['ocr_avoided'] = report['skipped'] / report['cells'] if report['cells'] else 0.0
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Prefiltro aprendido código/producto')
+    parser.add_argument('command', choices=['train', 'evaluate'])
+    parser.add_argument('--codes', default='codes_output', help='Celdas de código ya clasificadas')
+    parser.add_argument('--images', default='images_output', help='Imágenes de producto ya clasificadas')
+    parser.add_argument('--discards', default=None, help='Descartes (medidas, pesos) como texto')
+    parser.add_argument('--model', default=os.environ.get(MODEL_ENV, DEFAULT_MODEL_PATH))
+    parser.add_argument('--max-text-leak', type=float, default=MAX_TEXT_LEAK)
+    args = parser.parse_args()
+
+    X, y = load_labelled_features(args.codes, args.images, args.discards)
+    print(f"📁 {int(y.sum())} celdas de texto y {int(len(y) - y.sum())} de producto")
+    if args.command == 'train':
+        if y.sum() == 0 or y.sum() == len(y):
+            raise SystemExit("❌ Hacen falta ejemplos de las dos clases")
+        model = train_prefilter(X, y, max_text_leak=args.max_text_leak)
+        model.save(args.model)
+        print(f"💾 Modelo guardado en {args.model} (umbral {model.skip_threshold:.3f})")
+        print_validation(model.validation)
+    else:
+        model = CodePrefilter.load(args.model)
+        print_validation(routing_confusion(model.text_probability(X), y, model.skip_threshold), 'evaluación')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Almacén de recortes por hoja en un único archivo mapeado en memoria.
+
+En lugar de escribir decenas de rect_N.png por hoja (y copiarlos después a
+codes_output/, images_output/ y discards_output/), todos los recortes se guardan
+contiguos en un archivo binario (<ruta>) con un índice JSON (<ruta>.json) que
+indica desplazamiento, forma y etiqueta de cada uno. Cualquier proceso puede abrir
+el arena y obtener vistas numpy sin copia; la clasificación sólo anota etiquetas y
+los PNG se generan bajo demanda, únicamente para los recortes que alguien mira.
+"""
+
+import json
+import os
+
+import cv2
+import numpy as np
+
+# Metadatos de la celda que se guardan en el índice junto a cada recorte
+INDEX_KEYS = ('index', 'bbox', 'row', 'col', 'reading_order')
+
+class CropArena:
+    """Recortes de una hoja en un archivo mapeado en memoria más su índice JSON."""
+
+    def __init__(self, path, entries):
+        self.path = path
+        self.index_path = f"{path}.json"
+        self.entries = entries
+        self._by_name = {entry['name']: entry for entry in entries}
+        size = os.path.getsize(path)
+        self._data = np.memmap(path, dtype=np.uint8, mode='r', shape=(size,)) if size else np.zeros(0, np.uint8)
+
+    @classmethod
+    def create(cls, path, cells):
+        """
+        Escribe todos los recortes contiguos en 'path' y guarda el índice.
+
+        Args:
+            path: Archivo del arena (el índice se guarda en path + '.json')
+            cells: Celdas de extract_rectangles.extract_cells (claves 'name' e 'image')
+
+        Returns:
+            CropArena con los recortes escritos y sin etiquetas
+        """
+        entries = []
+        offset = 0
+        for cell in cells:
+            crop = cell['image']
+            entry = {
+                'name': cell['name'],
+                'offset': offset,
+                'shape': list(crop.shape),
+                'dtype': str(crop.dtype),
+                'label': None
+            }
+            for key in INDEX_KEYS:
+                if key in cell:
+                    entry[key] = [int(v) for v in cell[key]] if key == 'bbox' else cell[key]
+            entries.append(entry)
+            offset += crop.nbytes
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Reservar el archivo completo y copiar cada recorte en su hueco
+        with open(path, 'wb') as f:
+            f.truncate(offset)
+        if offset:
+            data = np.memmap(path, dtype=np.uint8, mode='r+', shape=(offset,))
+            for cell, entry in zip(cells, entries):
+                crop = np.ascontiguousarray(cell['image'])
+                data[entry['offset']:entry['offset'] + crop.nbytes] = crop.reshape(-1).view(np.uint8)
+            data.flush()
+            del data
+
+        arena = cls(path, entries)
+        arena.save_index()
+        return arena
+
+    @classmethod
+    def open(cls, path):
+        """Abre un arena existente (sólo lectura de píxeles)."""
+        with open(f"{path}.json", 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        return cls(path, index['crops'])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def names(self):
+        return [entry['name'] for entry in self.entries]
+
+    def get(self, name):
+        """Devuelve el recorte como vista numpy sobre el archivo mapeado (sin copia)."""
+        entry = self._by_name[name]
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape']))
+        start = entry['offset']
+        return self._data[start:start + count * dtype.itemsize].view(dtype).reshape(entry['shape'])
+
+    def cells(self):
+        """Celdas en el mismo formato que extract_cells, con 'image' apuntando al arena."""
+        cells = []
+        for entry in self.entries:
+            cell = {key: entry[key] for key in INDEX_KEYS if key in entry}
+            cell['name'] = entry['name']
+            cell['image'] = self.get(entry['name'])
+            cells.append(cell)
+        return cells
+
+    def set_label(self, name, label):
+        """Anota la clasificación de un recorte ('text', 'image', 'discard'...)."""
+        self._by_name[name]['label'] = label
+
+    def labels(self):
+        return {entry['name']: entry['label'] for entry in self.entries}
+
+    def names_with_label(self, label):
+        return [entry['name'] for entry in self.entries if entry['label'] == label]
+
+    def save_index(self):
+        """Guarda el índice de forma atómica (archivo temporal + reemplazo)."""
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'crops': self.entries}, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def export_png(self, name, output_dir=None):
+        """
+        Genera (sólo la primera vez) el PNG de un recorte para la interfaz de revisión.
+
+        Args:
+            name: Nombre del recorte (rect_N.png)
+            output_dir: Directorio de exportación (por defecto <arena>_png/)
+
+        Returns:
+            str: Ruta del PNG
+        """
+        output_dir = output_dir or f"{self.path}_png"
+        output_path = os.path.join(output_dir, name)
+        if not os.path.exists(output_path):
+            os.makedirs(output_dir, exist_ok=True)
+            cv2.imwrite(output_path, self.get(name))
+        return output_path
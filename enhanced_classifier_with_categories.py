@@ -13,21 +13,47 @@ import sys
 import re
 from datetime import datetime
 
-# Importar el nuevo predictor de categorías
-try:
-    from MachineLearning.jewelry_category_predictor import JewelryCategoryPredictor
-    CATEGORY_PREDICTOR_AVAILABLE = True
-    print("✅ Predictor de categorías de joyería cargado")
-except ImportError as e:
-    print(f"⚠️ Predictor de categorías no disponible: {e}")
-    CATEGORY_PREDICTOR_AVAILABLE = False
+from model_registry import get_model, module_available
+
+# El predictor de categorías (y scikit-learn) se importa al crear el primer clasificador,
+# no al importar este módulo, para no cargarlo en el arranque de la web
+CATEGORY_PREDICTOR_AVAILABLE = module_available('MachineLearning.jewelry_category_predictor')
+if not CATEGORY_PREDICTOR_AVAILABLE:
+    print("⚠️ Predictor de categorías no disponible")
 
 # Importar funciones existentes
 from improved_classify_rectangles_ocr_fixed import (
     is_measurements_or_weight_only_enhanced,
-    clean_output_directories
+    clean_output_directories,
+    iter_rectangle_analyses
 )
 
+# Resultado cuando no hay predictor o la predicción falla
+UNKNOWN_CATEGORY = {
+    'category': 'sin_categoria',
+    'category_display': '❓ Sin Categoría',
+    'css_class': 'category-unknown',
+    'confidence': 0.0,
+    'confidence_level': 'baja',
+    'features': {}
+}
+
+def json_safe(obj):
+    """Convierte recursivamente los tipos de NumPy a tipos serializables en JSON."""
+    if isinstance(obj, np.ndarray):
+        return obj.item() if obj.size == 1 else obj.tolist()
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, dict):
+        return {k: json_safe(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [json_safe(item) for item in obj]
+    return obj
+
 class EnhancedJewelryClassifier:
     """
     Clasificador mejorado que incluye categorías específicas de joyería
@@ -39,16 +65,16 @@ class EnhancedJewelryClassifier:
         
         if CATEGORY_PREDICTOR_AVAILABLE:
             try:
-                self.category_predictor = JewelryCategoryPredictor()
+                # Instancia compartida: el predictor se carga una sola vez por proceso
+                self.category_predictor = get_model('category_predictor')
                 print("✅ Clasificador de joyería con categorías inicializado")
             except Exception as e:
                 print(f"⚠️ Error inicializando predictor: {e}")
                 self.category_predictor = None
         
-        # Importar clasificador ML existente
+        # Clasificador ML existente (compartido, ver model_registry.py)
         try:
-            from MachineLearning.classify_image import ImageCategoryClassifier
-            self.ml_classifier = ImageCategoryClassifier()
+            self.ml_classifier = get_model('image_classifier')
             print("✅ Clasificador ML base cargado")
         except ImportError as e:
             print(f"⚠️ Clasificador ML base no disponible: {e}")
@@ -181,6 +207,34 @@ class EnhancedJewelryClassifier:
         
         return result
     
+    def predict_categories(self, image_paths):
+        """
+        Categorías de joyería de varias imágenes, en el mismo orden.
+        
+        Todavía no hay predicción por lotes: se llama a predict_jewelry_category imagen a
+        imagen, y una imagen que falla no interrumpe las demás.
+        
+        Args:
+            image_paths: Rutas de las imágenes
+            
+        Returns:
+            list: Resultado por imagen con el formato de predict_jewelry_category
+                  ('category', 'category_display', 'css_class', 'confidence',
+                  'confidence_level', 'features')
+        """
+        results = []
+        for path in image_paths:
+            path = str(path)
+            if not self.category_predictor:
+                results.append(dict(UNKNOWN_CATEGORY))
+                continue
+            try:
+                results.append(self.category_predictor.predict_jewelry_category(path))
+            except Exception as e:
+                print(f"  ⚠️ Error prediciendo categoría de {os.path.basename(path)}: {e}")
+                results.append(dict(UNKNOWN_CATEGORY))
+        return results
+    
     def _is_likely_product_code(self, text: str) -> bool:
         """
         Determina si un texto parece un código de producto
@@ -209,7 +263,35 @@ class EnhancedJewelryClassifier:
         
         return False
 
-def process_rectangles_with_categories(input_dir, codes_dir, images_dir, discards_dir):
+def category_sidecar(filename, category_result):
+    """Contenido del archivo _category.json de una imagen a partir de su predicción."""
+    confidence = float(category_result.get('confidence', 0.0))
+    return json_safe({
+        'filename': filename,
+        'category': category_result.get('category', 'sin_categoria'),
+        'category_display': category_result.get('category_display', '❓ Sin Categoría'),
+        'css_class': category_result.get('css_class', 'category-unknown'),
+        'confidence': confidence,
+        'confidence_level': 'alta' if confidence >= 0.8 else 'media' if confidence >= 0.6 else 'baja',
+        'features': category_result.get('features', {}),
+        'timestamp': datetime.now().isoformat()
+    })
+
+def categorize_jewelry_images(image_paths):
+    """
+    Información de categoría (formato _category.json) de varias imágenes de producto
+    con el clasificador compartido del proceso (ver predict_categories).
+    """
+    classifier = get_model('enhanced_classifier')
+    predictions = classifier.predict_categories(image_paths)
+    return [category_sidecar(os.path.basename(str(path)), prediction)
+            for path, prediction in zip(image_paths, predictions)]
+
+def categorize_jewelry_enhanced(image_path):
+    """Información de categoría (formato _category.json) de una imagen de producto."""
+    return categorize_jewelry_images([image_path])[0]
+
+def process_rectangles_with_categories(input_dir, codes_dir, images_dir, discards_dir, parallel=False, workers=None):
     """
     Versión mejorada que incluye categorías de joyería para imágenes
     
@@ -218,12 +300,15 @@ def process_rectangles_with_categories(input_dir, codes_dir, images_dir, discard
         codes_dir: Directorio donde se guardarán los rectángulos de texto
         images_dir: Directorio donde se guardarán los rectángulos de imágenes
         discards_dir: Directorio donde se guardarán los rectángulos descartados
+        parallel: Clasificar en un pool de procesos (ver iter_rectangle_analyses)
+        workers: Número de procesos del pool
     """
     # Limpiar las carpetas de salida
     clean_output_directories(codes_dir, images_dir, discards_dir)
     
-    # Crear clasificador mejorado
-    classifier = EnhancedJewelryClassifier()
+    # Crear clasificador mejorado (en paralelo lo carga cada proceso del pool)
+    if not parallel:
+        get_model('enhanced_classifier')
     
     # Obtener todas las imágenes
     image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
@@ -254,14 +339,12 @@ def process_rectangles_with_categories(input_dir, codes_dir, images_dir, discard
     discard_count = 0
     category_stats = {}
     
-    # Procesar cada imagen
-    for i, image_path in enumerate(image_paths, 1):
+    # Procesar cada imagen (análisis mejorado con categorías, en orden rect_N)
+    analyses = iter_rectangle_analyses(image_paths, mode='categories', parallel=parallel, workers=workers)
+    for i, (image_path, analysis) in enumerate(zip(image_paths, analyses), 1):
         file_name = os.path.basename(str(image_path))
         print(f"\n📊 [{i}/{len(image_paths)}] {file_name}")
         
-        # Análisis mejorado con categorías
-        analysis = classifier.enhanced_rectangle_analysis_with_categories(str(image_path))
-        
         if analysis['should_discard']:
             # Guardar en descartes
             discard_count += 1
@@ -1,81 +1,890 @@
 import cv2
+import json
 import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import numpy as np
 
-def extract_rectangles(image_path, output_dir, debug_path=None):
+from crop_arena import CropArena
+
+def load_sheet(source):
     """
-    Detecta rectángulos en una imagen y guarda cada uno como una imagen independiente.
-    EXACTAMENTE el mismo método que en test_rectangles.py
-    
+    Carga la imagen de la hoja si se recibe una ruta; si ya es un array se devuelve tal cual.
+
+    Las hojas guardadas como .npy se abren mapeadas en memoria (sólo se leen del disco
+    las franjas que se procesan), útil junto con el modo por franjas. Los JPEG y PNG se
+    decodifican enteros con cv2.imread: la imagen completa queda siempre en memoria.
+
     Args:
-        image_path: Ruta a la imagen original
-        output_dir: Directorio donde se guardarán los rectángulos extraídos
-        debug_path: Ruta opcional para guardar una imagen con los rectángulos marcados
+        source: Ruta a la imagen o imagen ya decodificada (numpy array BGR)
+
+    Returns:
+        numpy array con la imagen o None si no se pudo cargar
     """
-    # Leer la imagen
-    image = cv2.imread(str(image_path))
-    if image is None:
-        print(f"No se pudo cargar la imagen: {image_path}")
-        return
-    
-    # Crear una copia para visualización
-    output_image = image.copy()
-    
+    if isinstance(source, np.ndarray):
+        return source
+    if str(source).lower().endswith('.npy'):
+        return np.load(str(source), mmap_mode='r')
+    return cv2.imread(str(source))
+
+def describe_sheet(source):
+    """Texto para los mensajes de progreso: la ruta o 'imagen en memoria'."""
+    return 'imagen en memoria' if isinstance(source, np.ndarray) else source
+
+# Lado largo objetivo (px) para la detección reducida en modo 'auto'
+DETECTION_TARGET_LONG_SIDE = 1500
+
+# Lado largo máximo (px) de la imagen de depuración en el modo por franjas
+DEBUG_MAX_SIDE = 2000
+
+# Motores de detección disponibles (ver detect_rectangles)
+DETECTION_ENGINES = ('contour', 'lines', 'auto')
+
+# En modo 'auto': con menos celdas que esto, o con una celda que ocupe más de esta
+# fracción de la hoja (un marco exterior), se prueba el motor de líneas
+AUTO_MIN_CELLS = 2
+AUTO_FRAME_FRACTION = 0.5
+
+# Longitud mínima de una línea de la cuadrícula, como fracción del lado de la hoja
+LINE_MIN_FRACTION = 0.05
+
+# Fracción mínima de píxeles oscuros de una fila/columna para considerarla línea de la tabla
+PROFILE_LINE_FRACTION = 0.5
+
+def detect_rectangles(image, detection_downscale=1, max_working_mb=None, engine='auto'):
+    """
+    Detecta los contornos rectangulares de la hoja (mismo criterio que test_rectangles.py).
+
+    Args:
+        image: Imagen BGR decodificada
+        detection_downscale: Factor entero de reducción para buscar los contornos
+                             (1 = resolución completa, 'auto' = según el tamaño de la hoja).
+                             Los rectángulos se devuelven siempre en coordenadas completas.
+        max_working_mb: Si se indica, la hoja se procesa por franjas solapadas para que los
+                        búferes de trabajo (grises, binaria, contornos) no superen ese tamaño
+        engine: 'contour' (contornos externos de las zonas blancas), 'lines' (celdas
+                delimitadas por las líneas de la cuadrícula, ver detect_rectangles_lines)
+                o 'auto' (contornos, y líneas si el resultado parece incompleto; por
+                defecto, ya que en las hojas normales cuesta lo mismo que 'contour')
+
+    Returns:
+        list: Polígonos aproximados de 4 vértices con área > 1000
+    """
+    if engine not in DETECTION_ENGINES:
+        raise ValueError(f"Motor de detección desconocido: {engine} (opciones: {', '.join(DETECTION_ENGINES)})")
+    if engine == 'lines':
+        return detect_rectangles_lines(image)
+
+    rectangles = detect_rectangles_contours(image, detection_downscale, max_working_mb)
+
+    if engine == 'auto' and looks_incomplete(image, rectangles):
+        line_rectangles = detect_rectangles_lines(image)
+        if len(line_rectangles) > len(rectangles):
+            print(f"📏 Motor de líneas: {len(line_rectangles)} celdas (contornos: {len(rectangles)})")
+            return line_rectangles
+    return rectangles
+
+def detect_rectangles_contours(image, detection_downscale=1, max_working_mb=None):
+    """Motor de contornos: zonas blancas con RETR_EXTERNAL aproximadas a 4 vértices."""
+    if max_working_mb:
+        return detect_rectangles_tiled(image, max_working_mb)
+
+    factor = choose_detection_factor(image, detection_downscale)
+    if factor > 1:
+        rectangles = detect_rectangles_pyramid(image, factor)
+        if rectangles is not None:
+            return rectangles
+        print(f"⚠️ Detección reducida (x{factor}) ambigua, repitiendo a resolución completa")
+
     # Convertir a escala de grises
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    
+
     # Aplicar umbral para obtener una imagen binaria
     _, threshold = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY)
-    
+
     # Encontrar contornos
     contours, _ = cv2.findContours(threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    # Crear directorio de salida si no existe
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
+
+    return filter_rectangle_contours(contours)
+
+def looks_incomplete(image, rectangles):
+    """
+    Indica si el resultado del motor de contornos es sospechoso: muy pocas celdas o una
+    celda del tamaño de la hoja (con marco exterior, RETR_EXTERNAL no ve las interiores).
+    """
+    if len(rectangles) < AUTO_MIN_CELLS:
+        return True
+    sheet_area = image.shape[0] * image.shape[1]
+    for rect in rectangles:
+        _, _, w, h = cv2.boundingRect(rect)
+        if w * h > AUTO_FRAME_FRACTION * sheet_area:
+            return True
+    return False
+
+def detect_rectangles_lines(image, min_line_fraction=LINE_MIN_FRACTION):
+    """
+    Motor de líneas: localiza las líneas horizontales y verticales de la cuadrícula y
+    devuelve como celdas las regiones cerradas por ellas.
+
+    A diferencia de RETR_EXTERNAL, encuentra las celdas interiores aunque la hoja tenga
+    un marco exterior o las celdas compartan bordes. En tablas regulares alineadas basta
+    con los perfiles de proyección (ver grid_cells_from_profiles); si no, se extraen las
+    líneas con una apertura morfológica.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    _, dark = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY_INV)
+    del gray
+
+    boxes = grid_cells_from_profiles(dark)
+    if boxes is not None:
+        rectangles = [box_to_polygon(box) for box in boxes]
+    else:
+        rectangles = grid_cells_from_morphology(dark, min_line_fraction)
+
+    # Mismo orden que el motor de contornos (orden inverso de barrido)
+    return sorted(rectangles, key=lambda rect: (int(rect[0][0][1]), int(rect[0][0][0])), reverse=True)
+
+def line_bands(profile, length):
+    """Tramos consecutivos de filas (o columnas) oscuras en al menos PROFILE_LINE_FRACTION de su longitud."""
+    is_line = np.concatenate(([False], profile >= PROFILE_LINE_FRACTION * length * 255, [False]))
+    changes = np.flatnonzero(is_line[1:] != is_line[:-1])
+    return list(zip(changes[::2], changes[1::2]))
+
+def grid_cells_from_profiles(dark, min_border_dark=0.9):
+    """
+    Cuadrícula regular a partir de las proyecciones de píxeles oscuros por filas y columnas:
+    cada hueco entre dos líneas horizontales consecutivas y dos verticales consecutivas es
+    una celda. Devuelve None si la hoja no es una tabla regular alineada (pocas líneas,
+    hoja girada o algún borde de celda incompleto, p. ej. celdas combinadas).
+    """
+    height, width = dark.shape
+    rows = line_bands(cv2.reduce(dark, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel(), width)
+    cols = line_bands(cv2.reduce(dark, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel(), height)
+    if len(rows) < 2 or len(cols) < 2:
+        return None
+
+    boxes = []
+    for (_, top), (bottom, _) in zip(rows[:-1], rows[1:]):
+        for (_, left), (right, _) in zip(cols[:-1], cols[1:]):
+            w, h = right - left, bottom - top
+            if w * h <= 1000:
+                continue
+            # Los cuatro bordes de la celda tienen que ser línea
+            borders = (dark[top - 1, left:right], dark[bottom, left:right],
+                       dark[top:bottom, left - 1], dark[top:bottom, right])
+            if min(np.count_nonzero(border) / border.size for border in borders) < min_border_dark:
+                return None
+            boxes.append((int(left), int(top), int(w), int(h)))
+    return boxes or None
+
+def grid_cells_from_morphology(dark, min_line_fraction=LINE_MIN_FRACTION):
+    """
+    Extrae las líneas con una apertura morfológica (sólo sobreviven los trazos oscuros más
+    largos que el elemento estructurante, no el texto ni las fotos) y devuelve las regiones
+    cerradas por ellas aproximadas a 4 vértices. Funciona también con tablas irregulares
+    o ligeramente giradas.
+    """
+    height, width = dark.shape
+    horizontal_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(15, int(width * min_line_fraction)), 1))
+    vertical_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(15, int(height * min_line_fraction))))
+    lines = cv2.bitwise_or(cv2.morphologyEx(dark, cv2.MORPH_OPEN, horizontal_kernel),
+                           cv2.morphologyEx(dark, cv2.MORPH_OPEN, vertical_kernel))
+
+    # RETR_CCOMP devuelve en el nivel superior el borde exterior de cada región sin
+    # líneas, también de las que quedan dentro del hueco de otra (celdas dentro del marco)
+    contours, hierarchy = cv2.findContours(cv2.bitwise_not(lines), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    if hierarchy is None:
+        return []
+
+    regions = []
+    for contour, (_, _, _, parent) in zip(contours, hierarchy[0]):
+        if parent != -1:
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        # Lo que toca el borde de la imagen es fondo exterior, no una celda cerrada
+        if x == 0 or y == 0 or x + w == width or y + h == height:
+            continue
+        regions.append(contour)
+
+    return filter_rectangle_contours(regions)
+
+def contour_areas(contours):
+    """
+    Área de todos los contornos de una vez (fórmula del área de Gauss sobre los puntos
+    concatenados). Da el mismo valor que cv2.contourArea sin recorrer los contornos en Python.
+    """
+    if len(contours) == 0:
+        return np.zeros(0)
+    lengths = np.fromiter((len(contour) for contour in contours), dtype=np.int64, count=len(contours))
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.int64)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+
+    # Siguiente vértice de cada punto, cerrando cada polígono sobre su primer punto
+    following = np.arange(1, len(points) + 1)
+    following[ends - 1] = starts
+    cross = points[:, 0] * points[following, 1] - points[following, 0] * points[:, 1]
+    return np.abs(np.add.reduceat(cross, starts)) / 2.0
+
+def filter_rectangle_contours(contours, min_area=1000):
+    """Filtra los contornos que se aproximan a un polígono de 4 vértices con área suficiente."""
+    # Prefiltro vectorizado: en hojas fotografiadas con ruido hay decenas de miles de
+    # contornos diminutos; sólo los que superan el área mínima llegan a approxPolyDP
+    candidates = np.flatnonzero(contour_areas(contours) > min_area)
+
     # Filtrar contornos para encontrar rectángulos
     rectangles = []
-    for contour in contours:
+    for i in candidates:
+        contour = contours[i]
+
         # Calcular el perímetro del contorno
         perimeter = cv2.arcLength(contour, True)
-        
+
         # Aproximar el contorno a un polígono
         approx = cv2.approxPolyDP(contour, 0.02 * perimeter, True)
-        
-        # Calcular el área
+
+        # Filtrar por número de vértices (4 para rectángulos)
+        if len(approx) == 4:
+            rectangles.append(approx)
+
+    return rectangles
+
+def filter_rectangle_contours_loop(contours, min_area=1000):
+    """Versión original contorno a contorno, usada como referencia en benchmark_contour_prefilter.py."""
+    rectangles = []
+    for contour in contours:
+        perimeter = cv2.arcLength(contour, True)
+        approx = cv2.approxPolyDP(contour, 0.02 * perimeter, True)
         area = cv2.contourArea(contour)
-        
-        # Filtrar por área mínima y número de vértices (4 para rectángulos)
-        if len(approx) == 4 and area > 1000:  # Umbral de área según test_rectangles.py
+        if len(approx) == 4 and area > min_area:
             rectangles.append(approx)
-    
-    print(f"Detectados {len(rectangles)} rectángulos en {image_path}")
-    
-    # Procesar cada rectángulo
-    rect_count = 0
-    for rect in rectangles:
-        # Dibujar el contorno en la imagen de salida (para visualización)
-        cv2.drawContours(output_image, [rect], 0, (0, 255, 0), 2)
-        
+    return rectangles
+
+def choose_detection_factor(image, detection_downscale='auto'):
+    """
+    Calcula el factor entero de reducción para la detección.
+    En modo 'auto' se reduce hasta que el lado largo quede cerca de DETECTION_TARGET_LONG_SIDE.
+    Tanto en 'auto' como con un factor explícito, el factor nunca supera el grosor
+    estimado de las líneas de la cuadrícula: si no, al muestrear la hoja una línea fina
+    podría quedar entre dos muestras y fusionar celdas sin que el ajuste de bordes lo note.
+    """
+    if detection_downscale == 'auto':
+        factor = max(1, max(image.shape[:2]) // DETECTION_TARGET_LONG_SIDE)
+    else:
+        factor = max(1, int(detection_downscale or 1))
+    if factor > 1:
+        line_width = estimate_line_width(image)
+        if line_width < factor and detection_downscale != 'auto':
+            print(f"⚠️ Factor de reducción x{factor} mayor que el grosor de las líneas ({line_width} px), "
+                  f"se usa x{line_width}")
+        factor = min(factor, line_width)
+    return max(1, factor)
+
+def estimate_line_width(image, samples=9, max_run=40):
+    """
+    Estima el grosor (px) de las líneas oscuras de la hoja midiendo las rachas de píxeles
+    oscuros en unas pocas filas y columnas. Se usa un percentil bajo para ser conservador
+    (los trazos de texto finos también cuentan y sólo reducen el factor).
+    """
+    height, width = image.shape[:2]
+    runs = []
+    lines = [image[int(height * (i + 1) / (samples + 1))] for i in range(samples)]
+    lines += [image[:, int(width * (i + 1) / (samples + 1))] for i in range(samples)]
+    for line in lines:
+        gray = cv2.cvtColor(line.reshape(1, -1, 3), cv2.COLOR_BGR2GRAY)[0]
+        dark = np.concatenate(([False], gray <= 200, [False]))
+        changes = np.flatnonzero(np.diff(dark.astype(np.int8)))
+        lengths = changes[1::2] - changes[0::2]
+        runs.extend(lengths[lengths <= max_run].tolist())
+    if not runs:
+        return 1
+    return max(1, int(np.percentile(runs, 10)))
+
+def _white_run(gray_band):
+    """Longitud de la racha de píxeles blancos (> 200) desde la columna 0 de cada fila."""
+    white = gray_band > 200
+    full = white.all(axis=1)
+    runs = np.where(full, white.shape[1], np.argmin(white, axis=1))
+    return int(runs.max()) if runs.size else 0
+
+def snap_rectangle(image, box, factor):
+    """
+    Ajusta a resolución completa la caja encontrada en la hoja muestreada.
+    Cada borde real está a menos de `factor` píxeles del borde muestreado, así que sólo
+    se leen franjas de `factor` píxeles de ancho alrededor de la caja.
+
+    Returns:
+        (x, y, w, h) exacto o None si la región blanca continúa más allá de la franja
+        (resultado ambiguo: hay que repetir la detección completa).
+    """
+    img_h, img_w = image.shape[:2]
+    x, y, w, h = box
+    x0, y0 = x * factor, y * factor
+    x1, y1 = (x + w - 1) * factor, (y + h - 1) * factor
+    reach = factor - 1
+
+    def gray(region):
+        return cv2.cvtColor(np.ascontiguousarray(region), cv2.COLOR_BGR2GRAY)
+
+    # Franja de cada lado, orientada para que la columna 0 sea la primera fuera de la caja
+    sides = {
+        'left': gray(image[y0:y1 + 1, max(0, x0 - reach - 1):x0][:, ::-1]) if x0 > 0 else None,
+        'right': gray(image[y0:y1 + 1, x1 + 1:min(img_w, x1 + reach + 2)]) if x1 + 1 < img_w else None,
+        'top': gray(image[max(0, y0 - reach - 1):y0, x0:x1 + 1][::-1].transpose(1, 0, 2)) if y0 > 0 else None,
+        'bottom': gray(image[y1 + 1:min(img_h, y1 + reach + 2), x0:x1 + 1].transpose(1, 0, 2)) if y1 + 1 < img_h else None,
+    }
+
+    extension = {}
+    for side, band in sides.items():
+        if band is None:
+            extension[side] = 0
+            continue
+        run = _white_run(band)
+        # La franja incluye un píxel más que el alcance máximo: si también es blanco,
+        # la región no termina donde se esperaba
+        if run > reach and band.shape[1] > reach:
+            return None
+        extension[side] = min(run, reach)
+
+    left, top = x0 - extension['left'], y0 - extension['top']
+    right, bottom = x1 + extension['right'], y1 + extension['bottom']
+    return (left, top, right - left + 1, bottom - top + 1)
+
+def box_to_polygon(box):
+    """Polígono de 4 vértices (mismo formato que approxPolyDP) para una caja (x, y, w, h)."""
+    x, y, w, h = box
+    return np.array([[[x, y]], [[x, y + h - 1]], [[x + w - 1, y + h - 1]], [[x + w - 1, y]]], dtype=np.int32)
+
+def detect_rectangles_pyramid(image, factor):
+    """
+    Busca los rectángulos en una copia muestreada (1 de cada `factor` píxeles) de la hoja
+    y ajusta sus bordes a resolución completa. Devuelve None si algún rectángulo es
+    ambiguo, para que el llamador repita la detección completa y el resultado no cambie.
+    """
+    height, width = image.shape[:2]
+    rows, cols = height // factor, width // factor
+    # INTER_NEAREST con un factor entero exacto toma justo el píxel (i*factor, j*factor)
+    sampled = cv2.resize(image[:rows * factor, :cols * factor], (cols, rows), interpolation=cv2.INTER_NEAREST)
+    small = cv2.cvtColor(sampled, cv2.COLOR_BGR2GRAY)
+    _, threshold = cv2.threshold(small, 200, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    # Descartar antes de ajustar los contornos que ni siquiera ampliados llegarían al área mínima
+    min_area = 1000 / ((factor + 1) * (factor + 1))
+
+    rectangles = []
+    for candidate in filter_rectangle_contours(contours, min_area=min_area):
+        snapped = snap_rectangle(image, cv2.boundingRect(candidate), factor)
+        if snapped is None:
+            return None
+        x, y, w, h = snapped
+        # Área del contorno de un rectángulo de w x h píxeles (pasa por los centros de píxel)
+        if (w - 1) * (h - 1) <= 1000:
+            continue
+        rectangles.append(box_to_polygon(snapped))
+
+    # Mismo orden que findContours a resolución completa (orden inverso de barrido)
+    rectangles.sort(key=lambda rect: (int(rect[0][0][1]), int(rect[0][0][0])), reverse=True)
+    return rectangles
+
+def detect_rectangles_tiled(image, max_working_mb=64, overlap=16):
+    """
+    Detección por franjas horizontales solapadas con memoria de trabajo acotada.
+
+    Los contornos que quedan completos dentro de una franja se filtran directamente.
+    Los que tocan el corte entre franjas se guardan como fragmentos, se agrupan con los
+    de la franja vecina y se vuelven a analizar sobre una ventana del tamaño de la celda;
+    esa ventana puede superar max_working_mb si la celda es mayor que el límite (se avisa).
+
+    max_working_mb sólo acota los búferes de trabajo (grises, binaria, contornos), no la
+    hoja: una hoja JPEG o PNG ya está decodificada entera en memoria (ver load_sheet) y
+    sólo una .npy abierta con mmap se lee del disco franja a franja.
+    """
+    height, width = image.shape[:2]
+    max_bytes = max_working_mb * 1024 * 1024
+
+    # Grises + binaria + copia interna de findContours: ~3 bytes por píxel de la franja
+    strip_rows = max(4 * overlap, int(max_bytes // (width * 3)))
+
+    rectangles = {}
+    fragments = []
+    top = 0
+    while True:
+        bottom = min(height, top + strip_rows)
+        gray = cv2.cvtColor(image[top:bottom], cv2.COLOR_BGR2GRAY)
+        _, threshold = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY)
+        del gray
+        contours, _ = cv2.findContours(threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        del threshold
+
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if (y == 0 and top > 0) or (y + h == bottom - top and bottom < height):
+                fragments.append((x, y + top, w, h))
+                continue
+            for rect in filter_rectangle_contours([contour]):
+                rect = rect + np.array([0, top], dtype=rect.dtype)
+                # Las regiones dentro del solape aparecen en las dos franjas
+                rectangles.setdefault(cv2.boundingRect(rect), rect)
+
+        if bottom == height:
+            break
+        top = bottom - overlap
+
+    # Una celda que cruza el corte se analiza siempre entera aunque su ventana supere el
+    # límite: perder la celda sería peor que superar puntualmente la memoria de trabajo
+    oversized = 0
+    for box in merge_boxes(fragments):
+        oversized += region_exceeds_budget(image, box, max_bytes)
+        for rect in analyze_region(image, box):
+            rectangles.setdefault(cv2.boundingRect(rect), rect)
+    if oversized:
+        print(f"⚠️ {oversized} regiones entre franjas superan el límite de {max_working_mb} MB; "
+              f"se analizaron igualmente a resolución completa")
+
+    # Un hueco blanco dentro de una silueta cortada por el borde de la franja parece
+    # externo dentro de la franja; a resolución completa queda dentro de su celda y
+    # RETR_EXTERNAL no lo devuelve, así que se descartan las cajas contenidas en otra
+    boxes = list(rectangles)
+    for box in boxes:
+        x, y, w, h = box
+        if any(other != box and other[0] <= x and other[1] <= y and
+               x + w <= other[0] + other[2] and y + h <= other[1] + other[3] for other in boxes):
+            del rectangles[box]
+
+    # Mismo orden que findContours a resolución completa (orden inverso de barrido)
+    return sorted(rectangles.values(), key=lambda rect: (int(rect[0][0][1]), int(rect[0][0][0])), reverse=True)
+
+def merge_boxes(boxes):
+    """Une en grupos las cajas que se tocan o solapan y devuelve la caja envolvente de cada grupo."""
+    parent = list(range(len(boxes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, (xa, ya, wa, ha) in enumerate(boxes):
+        for j in range(i + 1, len(boxes)):
+            xb, yb, wb, hb = boxes[j]
+            if xa <= xb + wb and xb <= xa + wa and ya <= yb + hb and yb <= ya + ha:
+                parent[find(i)] = find(j)
+
+    groups = {}
+    for i, (x, y, w, h) in enumerate(boxes):
+        x0, y0, x1, y1 = groups.get(find(i), (x, y, x + w, y + h))
+        groups[find(i)] = (min(x0, x), min(y0, y), max(x1, x + w), max(y1, y + h))
+    return [(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in groups.values()]
+
+def region_exceeds_budget(image, box, max_bytes, margin=2):
+    """True si la ventana de analyze_region para la caja no cabe en el límite de memoria."""
+    img_h, img_w = image.shape[:2]
+    x, y, w, h = box
+    width = min(img_w, x + w + margin) - max(0, x - margin)
+    height = min(img_h, y + h + margin) - max(0, y - margin)
+    return width * height * 3 > max_bytes
+
+def analyze_region(image, box, margin=2):
+    """
+    Analiza a resolución completa la región que cruzaba el corte entre franjas.
+    Devuelve todas las regiones completas de la ventana (con celdas giradas, las cajas
+    de celdas vecinas se solapan y la ventana puede contener varias). Las regiones que
+    se salen de la ventana ya estaban completas en otra franja (sólo teníamos un trozo)
+    y se ignoran.
+
+    Returns:
+        list: Polígonos de 4 vértices en coordenadas de la hoja
+    """
+    img_h, img_w = image.shape[:2]
+    x, y, w, h = box
+    x0, y0 = max(0, x - margin), max(0, y - margin)
+    x1, y1 = min(img_w, x + w + margin), min(img_h, y + h + margin)
+
+    roi_gray = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+    _, roi_threshold = cv2.threshold(roi_gray, 200, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(roi_threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    complete = []
+    for contour in contours:
+        cx, cy, cw, ch = cv2.boundingRect(contour)
+        touches_window = ((cx == 0 and x0 > 0) or (cy == 0 and y0 > 0) or
+                          (cx + cw == x1 - x0 and x1 < img_w) or (cy + ch == y1 - y0 and y1 < img_h))
+        if not touches_window:
+            complete.append(contour)
+
+    offset = np.array([x0, y0], dtype=np.int32)
+    return [rect + offset.astype(rect.dtype) for rect in filter_rectangle_contours(complete)]
+
+def check_detection_parity(image_path, detection_downscale='auto'):
+    """
+    Compara la detección reducida con la detección a resolución completa.
+
+    Args:
+        image_path: Ruta o array de la hoja
+        detection_downscale: 'auto', un factor entero o una lista de factores
+                             (p. ej. ['auto', 2, 3, 4]); con una lista se devuelve un
+                             informe por factor
+
+    Returns:
+        dict: Conteos, cajas que faltan/sobran, si coincide el orden y tiempos de cada modo
+              (o lista de informes si se pasó una lista de factores)
+    """
+    if isinstance(detection_downscale, (list, tuple)):
+        return [check_detection_parity(image_path, factor) for factor in detection_downscale]
+
+    image = load_sheet(image_path)
+    if image is None:
+        print(f"No se pudo cargar la imagen: {describe_sheet(image_path)}")
+        return None
+
+    factor = choose_detection_factor(image, detection_downscale)
+
+    start = time.perf_counter()
+    full = [cv2.boundingRect(rect) for rect in detect_rectangles(image, 1, engine='contour')]
+    full_time = time.perf_counter() - start
+
+    # Se pasa el valor pedido (no el factor ya limitado) para comprobar el camino real
+    start = time.perf_counter()
+    reduced = [cv2.boundingRect(rect) for rect in detect_rectangles(image, detection_downscale, engine='contour')]
+    reduced_time = time.perf_counter() - start
+
+    report = {
+        'requested': detection_downscale,
+        'factor': factor,
+        'full_count': len(full),
+        'reduced_count': len(reduced),
+        'missing': [box for box in full if box not in reduced],
+        'extra': [box for box in reduced if box not in full],
+        'same_order': full == reduced,
+        'full_time': full_time,
+        'reduced_time': reduced_time
+    }
+    report['matches'] = not report['missing'] and not report['extra']
+
+    status = '✅' if report['matches'] else '❌'
+    print(f"{status} Paridad x{factor}: {len(reduced)}/{len(full)} rectángulos, "
+          f"orden {'igual' if report['same_order'] else 'distinto'}, "
+          f"{full_time * 1000:.1f} ms → {reduced_time * 1000:.1f} ms")
+    return report
+
+# Nombre del índice de cuadrícula que se guarda junto a los rect_N.png
+GRID_INDEX_FILENAME = 'cells.json'
+
+def cluster_positions(centers, tolerance):
+    """
+    Agrupa coordenadas 1D (centros de celda) en bandas: una nueva banda empieza cuando el
+    centro se separa más de 'tolerance' de la media de la banda actual.
+
+    Returns:
+        list: Índice de banda (0, 1, ...) de cada coordenada, en el orden de entrada
+    """
+    order = sorted(range(len(centers)), key=lambda i: centers[i])
+    bands = [0] * len(centers)
+    band, band_sum, band_count = -1, 0.0, 0
+    for i in order:
+        if band_count == 0 or centers[i] - band_sum / band_count > tolerance:
+            band, band_sum, band_count = band + 1, 0.0, 0
+        bands[i] = band
+        band_sum += centers[i]
+        band_count += 1
+    return bands
+
+def assign_grid_positions(cells):
+    """
+    Reconstruye la cuadrícula de la hoja: añade a cada celda 'row', 'col' y
+    'reading_order' (izquierda a derecha, de arriba abajo). La numeración rect_N
+    no cambia, así que los archivos existentes siguen siendo válidos.
+    """
+    if not cells:
+        return cells
+
+    # Tolerancia: media celda típica (la mediana ignora celdas gigantes como el marco)
+    tolerance_y = float(np.median([cell['bbox'][3] for cell in cells])) / 2
+    tolerance_x = float(np.median([cell['bbox'][2] for cell in cells])) / 2
+    rows = cluster_positions([cell['bbox'][1] + cell['bbox'][3] / 2 for cell in cells], tolerance_y)
+    cols = cluster_positions([cell['bbox'][0] + cell['bbox'][2] / 2 for cell in cells], tolerance_x)
+
+    for cell, row, col in zip(cells, rows, cols):
+        cell['row'] = row
+        cell['col'] = col
+
+    reading = sorted(cells, key=lambda cell: (cell['row'], cell['col'], cell['index']))
+    for order, cell in enumerate(reading):
+        cell['reading_order'] = order
+    return cells
+
+def save_grid_index(cells, output_dir):
+    """
+    Guarda cells.json con la posición en la cuadrícula de cada rect_N.png,
+    para que el emparejamiento pueda buscar vecinos sin depender de la numeración.
+    """
+    index = {
+        'rows': max((cell['row'] for cell in cells), default=-1) + 1,
+        'cols': max((cell['col'] for cell in cells), default=-1) + 1,
+        'cells': [{
+            'name': cell['name'],
+            'index': cell['index'],
+            'row': cell['row'],
+            'col': cell['col'],
+            'reading_order': cell['reading_order'],
+            'bbox': [int(v) for v in cell['bbox']]
+        } for cell in cells]
+    }
+    index_path = os.path.join(output_dir, GRID_INDEX_FILENAME)
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    return index_path
+
+def load_grid_index(index_path):
+    """
+    Carga cells.json y devuelve dos diccionarios: nombre -> (fila, columna) y
+    (fila, columna) -> nombre. Devuelve (None, None) si no existe o no se puede leer.
+    """
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ No se pudo cargar el índice de cuadrícula {index_path}: {e}")
+        return None, None
+
+    positions = {}
+    by_position = {}
+    for cell in index.get('cells', []):
+        position = (cell['row'], cell['col'])
+        positions[cell['name']] = position
+        # Si dos celdas caen en la misma posición se queda la primera en orden de lectura
+        if position not in by_position or cell['reading_order'] < by_position[position][1]:
+            by_position[position] = (cell['name'], cell['reading_order'])
+    return positions, {position: name for position, (name, _) in by_position.items()}
+
+def extract_cells(image_path, detection_downscale=1, template_store=None, max_working_mb=None,
+                  engine='auto'):
+    """
+    Detecta las celdas de una hoja y las devuelve en memoria, sin escribir nada en disco.
+
+    Cada celda es un diccionario con:
+        - 'index': posición de la celda (la misma que el N de rect_N.png)
+        - 'name': nombre de archivo equivalente ('rect_N.png')
+        - 'bbox': (x, y, w, h) en coordenadas de la hoja
+        - 'contour': polígono detectado (para depuración)
+        - 'image': vista numpy (sin copia) sobre la hoja decodificada
+        - 'row', 'col', 'reading_order': posición en la cuadrícula (ver assign_grid_positions)
+
+    Args:
+        image_path: Ruta a la imagen original o imagen ya decodificada
+        detection_downscale: Factor de reducción para la detección (ver detect_rectangles)
+        template_store: LayoutTemplateStore opcional (ver layout_templates.py); si la hoja
+                        coincide con una plantilla conocida se reutilizan sus celdas
+        max_working_mb: Límite de memoria de trabajo para la detección por franjas
+        engine: Motor de detección ('contour', 'lines' o 'auto', ver detect_rectangles)
+
+    Returns:
+        list: Celdas detectadas ([] si no se pudo cargar la imagen)
+    """
+    image = load_sheet(image_path)
+    if image is None:
+        print(f"No se pudo cargar la imagen: {describe_sheet(image_path)}")
+        return []
+
+    rectangles = template_store.match(image) if template_store is not None else None
+    if rectangles is None:
+        rectangles = detect_rectangles(image, detection_downscale, max_working_mb, engine)
+        if template_store is not None:
+            template_store.remember(image, rectangles)
+
+    cells = []
+    for index, rect in enumerate(rectangles):
         # Extraer las coordenadas del rectángulo
         x, y, w, h = cv2.boundingRect(rect)
-        
-        # Recortar el rectángulo de la imagen original
-        cropped = image[y:y+h, x:x+w]
-        
-        # Guardar el rectángulo recortado con nombre simple
-        output_path = os.path.join(output_dir, f'rect_{rect_count}.png')
-        cv2.imwrite(output_path, cropped)
-        rect_count += 1
-    
-    print(f"{rect_count} celdas extraídas y guardadas en {output_dir}")
-    
+
+        cells.append({
+            'index': index,
+            'name': f'rect_{index}.png',
+            'bbox': (x, y, w, h),
+            'contour': rect,
+            # El slicing de numpy devuelve una vista: no se copia ningún píxel
+            'image': image[y:y+h, x:x+w]
+        })
+
+    return assign_grid_positions(cells)
+
+def save_cells(cells, output_dir):
+    """
+    Sumidero opcional: guarda cada celda como rect_N.png en output_dir, junto con el
+    índice de cuadrícula cells.json. Añade a cada celda la clave 'path' con la ruta
+    del archivo escrito.
+
+    Args:
+        cells: Celdas devueltas por extract_cells
+        output_dir: Directorio donde se guardarán los rectángulos extraídos
+
+    Returns:
+        int: Número de celdas guardadas
+    """
+    # Crear directorio de salida si no existe
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    for cell in cells:
+        output_path = os.path.join(output_dir, cell['name'])
+        cv2.imwrite(output_path, cell['image'])
+        cell['path'] = output_path
+
+    if cells and 'row' in cells[0]:
+        save_grid_index(cells, output_dir)
+
+    return len(cells)
+
+def save_debug_image(image, cells, debug_path, max_side=None):
+    """
+    Guarda una copia de la hoja con los rectángulos detectados marcados en verde.
+    Con max_side la copia se reduce antes de dibujar (no se duplica la hoja completa).
+    """
+    scale = 1.0
+    if max_side and max(image.shape[:2]) > max_side:
+        scale = max_side / max(image.shape[:2])
+        output_image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    else:
+        output_image = image.copy()
+    for cell in cells:
+        contour = cell['contour'] if scale == 1.0 else (cell['contour'] * scale).astype(np.int32)
+        cv2.drawContours(output_image, [contour], 0, (0, 255, 0), 2)
+    cv2.imwrite(debug_path, output_image)
+
+def extract_rectangles(image_path, output_dir=None, debug_path=None, detection_downscale=1,
+                       template_store=None, max_working_mb=None, arena_path=None, engine='auto'):
+    """
+    Detecta rectángulos en una imagen y guarda cada uno como una imagen independiente.
+    EXACTAMENTE el mismo método que en test_rectangles.py
+
+    Args:
+        image_path: Ruta a la imagen original
+        output_dir: Directorio donde se guardarán los rectángulos extraídos
+                    (None para trabajar sólo en memoria)
+        debug_path: Ruta opcional para guardar una imagen con los rectángulos marcados
+        detection_downscale: Factor de reducción para la detección (1, entero o 'auto')
+        template_store: Caché opcional de plantillas de maquetación (ver layout_templates.py)
+        max_working_mb: Si se indica, detección por franjas con memoria de trabajo acotada
+                        (la imagen de depuración se genera entonces a resolución reducida)
+        arena_path: Si se indica, todos los recortes se guardan en un único archivo mapeado
+                    en memoria (ver crop_arena.py) y cada celda recibe la clave 'arena'
+        engine: Motor de detección ('contour', 'lines' o 'auto', ver detect_rectangles)
+
+    Returns:
+        list: Celdas detectadas (ver extract_cells)
+    """
+    # Leer la imagen
+    image = load_sheet(image_path)
+    if image is None:
+        print(f"No se pudo cargar la imagen: {describe_sheet(image_path)}")
+        return []
+
+    cells = extract_cells(image, detection_downscale, template_store, max_working_mb, engine)
+
+    print(f"Detectados {len(cells)} rectángulos en {describe_sheet(image_path)}")
+
+    if output_dir:
+        rect_count = save_cells(cells, output_dir)
+        print(f"{rect_count} celdas extraídas y guardadas en {output_dir}")
+
+    if arena_path:
+        arena = CropArena.create(arena_path, cells)
+        for cell in cells:
+            cell['arena'] = arena
+        print(f"🗃️ {len(arena)} recortes guardados en el arena {arena_path}")
+
     # Guardar la imagen con los rectángulos marcados
     if debug_path:
-        cv2.imwrite(debug_path, output_image)
+        save_debug_image(image, cells, debug_path, DEBUG_MAX_SIDE if max_working_mb else None)
         print(f"Imagen de depuración guardada en {debug_path}")
 
+    return cells
+
+def sheet_output_dir(output_root, image_path, taken=None):
+    """
+    Directorio de salida propio de una hoja (output_root/<nombre de la hoja>), para que
+    varias hojas procesadas a la vez no escriban en el mismo rectangles_output/.
+    """
+    stem = os.path.splitext(os.path.basename(str(image_path)))[0]
+    name, suffix = stem, 1
+    while taken is not None and name in taken:
+        suffix += 1
+        name = f"{stem}_{suffix}"
+    if taken is not None:
+        taken.add(name)
+    return os.path.join(output_root, name)
+
+def _extract_sheet_job(image_path, output_dir, debug_path, options):
+    """Trabajo de un proceso del pool: extrae una hoja y devuelve un resumen serializable."""
+    start = time.time()
+    try:
+        clean_output_dirs(output_dir)
+        cells = extract_rectangles(image_path, output_dir=output_dir, debug_path=debug_path, **options)
+        error = None
+    except Exception as e:
+        cells, error = [], str(e)
+    return {
+        'source': str(image_path),
+        'output_dir': output_dir,
+        'grid_index': os.path.join(output_dir, GRID_INDEX_FILENAME),
+        'count': len(cells),
+        'cells': [{key: cell[key] for key in ('name', 'bbox', 'row', 'col', 'reading_order') if key in cell}
+                  for cell in cells],
+        'elapsed': time.time() - start,
+        'error': error
+    }
+
+def extract_rectangles_batch(image_paths, output_root='rectangles_output', max_workers=None,
+                             max_in_flight=None, debug=False, **options):
+    """
+    Extrae las celdas de muchas hojas en un pool de procesos.
+
+    Cada hoja escribe en su propio directorio (ver sheet_output_dir) y los resultados se
+    devuelven a medida que terminan, no en el orden de entrada. Como mucho hay
+    max_in_flight hojas enviadas al pool a la vez, así que la memoria no crece con el
+    tamaño del lote.
+
+    Args:
+        image_paths: Rutas de las hojas
+        output_root: Directorio raíz; cada hoja se guarda en output_root/<hoja>/
+        max_workers: Número de procesos (por defecto, núcleos disponibles)
+        max_in_flight: Hojas enviadas al pool a la vez (por defecto, 2 por proceso)
+        debug: Guardar output_root/<hoja>_debug.png con los rectángulos marcados
+        **options: Argumentos de extract_rectangles (detection_downscale, max_working_mb...);
+                   deben poder enviarse a otro proceso (no admite template_store)
+
+    Yields:
+        dict: Resumen de cada hoja ('source', 'output_dir', 'grid_index', 'count',
+              'cells', 'elapsed', 'error')
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max(1, max_in_flight or 2 * max_workers)
+    os.makedirs(output_root, exist_ok=True)
+
+    taken = set()
+    pending_paths = iter(image_paths)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = set()
+
+        def submit_next():
+            for image_path in pending_paths:
+                output_dir = sheet_output_dir(output_root, image_path, taken)
+                debug_path = f"{output_dir}_debug.png" if debug else None
+                in_flight.add(executor.submit(_extract_sheet_job, image_path, output_dir, debug_path, options))
+                return True
+            return False
+
+        while len(in_flight) < max_in_flight and submit_next():
+            pass
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                in_flight.discard(future)
+                submit_next()
+                yield future.result()
+
 # Limpiar directorios de salida
 def clean_output_dirs(*dirs):
     for d in dirs:
@@ -5,6 +5,7 @@ Específicamente orientada a manejar casos como '6. llg' que deberían ser '6.11
 ACTUALIZADA: Descarta más agresivamente unidades de medida problemáticas
 """
 
+import atexit
 import cv2
 import numpy as np
 import os
@@ -12,9 +13,15 @@ import shutil
 from pathlib import Path
 import sys
 import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from MachineLearning.classify_image import ImageCategoryClassifier
-from MachineLearning.jewelry_category_detector import JewelryCategoryDetector
+from functools import partial
+from model_registry import get_model, warm_up
+from blank_prefilter import prefilter_blank_images
+from code_prefilter import get_code_prefilter, prefilter_report
+from measurement_matcher import match_measurement
+import ocr_service
 
 def clean_output_directories(codes_dir, images_dir, discards_dir):
     """Limpia las carpetas de salida para comenzar desde cero."""
@@ -27,13 +34,16 @@ def clean_output_directories(codes_dir, images_dir, discards_dir):
     
     print("Directorios de salida limpios y listos para nuevos archivos.")
 
-def is_measurements_or_weight_only_enhanced(text: str) -> dict:
+def is_measurements_or_weight_only_enhanced(text: str, verbose: bool = False) -> dict:
     """
     VERSIÓN MEJORADA: Detecta medidas/pesos incluyendo confusiones OCR como 'll' en lugar de '11'
     ACTUALIZADA: Descarta más agresivamente unidades problemáticas
+    Los patrones se comprueban en una sola pasada con el detector precompilado de
+    measurement_matcher.py, con la misma prioridad que antes
     
     Args:
         text: Texto extraído del rectángulo
+        verbose: Imprimir el detalle de la limpieza y del patrón detectado
         
     Returns:
         dict: {
@@ -46,230 +56,7 @@ def is_measurements_or_weight_only_enhanced(text: str) -> dict:
             'corrected_text': str (opcional)
         }
     """
-    if not text or len(text.strip()) == 0:
-        return {
-            'is_only_measurement': False,
-            'type': 'empty',
-            'reason': 'Texto vacío',
-            'matched_pattern': None
-        }
-    
-    # LIMPIEZA AGRESIVA para manejar variaciones de OCR
-    text_original = text.strip()
-    print(f"   📝 Texto original: '{text_original}'")
-    
-    # Paso 1: Aplicar correcciones específicas para errores OCR comunes
-    # Corregir confusión de 'll' por '11'
-    corrected_text = text_original
-    if 'll' in corrected_text.lower():
-        ocr_fixed = corrected_text.lower().replace('ll', '11')
-        print(f"   🔄 Corrección OCR: '{corrected_text}' → '{ocr_fixed}' (ll → 11)")
-        corrected_text = ocr_fixed
-    
-    # Paso 2: Normalización y limpieza estándar
-    text_clean = corrected_text.upper()
-    text_clean = re.sub(r'(\d)\s+([A-Z])', r'\1\2', text_clean)
-    text_clean = re.sub(r'(\d)\s*\.\s*(\d)', r'\1.\2', text_clean)  # "6. 11" → "6.11"
-    text_clean = re.sub(r'\s+', '', text_clean)  # Eliminar espacios restantes
-    text_clean = text_clean.replace(',', '.')    # "6,11g" → "6.11g"
-    
-    print(f"   🧹 Texto limpio final: '{text_clean}'")
-    
-    # NUEVA SECCIÓN: Descarte ultra-agresivo para problemas específicos
-    problematic_patterns = [
-        # === PATRONES PROBLEMÁTICOS ESPECÍFICOS ===
-        r'^\d+\.\d+[G|GR|GRAM|GRAMOS|GMS]$',  # Cualquier decimal + unidad de peso
-        r'^\d+\.\d+[K|KG|KT|QUILATES]$',      # Cualquier decimal + unidad de peso/material
-        r'^\d+\.\d+[C|CM|M|MM|IN|INCH]$',     # Cualquier decimal + unidad de longitud
-        r'^\d+\.\d+[L|ML|CL|CC|GAL]$',        # Cualquier decimal + unidad de volumen
-        r'^\d+\.\d+[%|€|\$|USD|EUR]$',        # Cualquier decimal + símbolo monetario/porcentaje
-        r'^\d+\.\d{1,2}G$',                   # Específicamente para casos como "6.1G", "7.25G"
-        r'^\d+\.\d{1,2}KG$',                  # Específicamente para casos como "1.5KG", "0.8KG"
-        r'^\d+\.\d{1,2}CM$',                  # Específicamente para casos como "2.5CM", "1.2CM"
-        r'^\d+\.\d{1,2}MM$',                  # Específicamente para casos como "5.3MM", "7.8MM"
-    ]
-    
-    # Primero probar los patrones problemáticos específicos (máxima prioridad)
-    for pattern in problematic_patterns:
-        if re.match(pattern, text_clean):
-            print(f"   🚨 DETECTADO patrón problemático: {pattern}")
-            return {
-                'is_only_measurement': True,
-                'type': 'problematic_measurement',
-                'reason': 'Patrón problemático de medida con decimal (ej: 6.1g)',
-                'matched_pattern': pattern,
-                'original_text': text_original,
-                'cleaned_text': text_clean,
-                'corrected_text': corrected_text
-            }
-    
-    # PATRONES ESPECÍFICOS MEJORADOS PARA DESCARTAR - VERSIÓN AGRESIVA
-    discard_patterns = {
-        # === PESOS (MEJORADOS Y MÁS AGRESIVOS) ===
-        'weight_decimal': [
-            r'^\d+\.\d+G$',         # "6.11G", "7.3G", "12.5G", "6.1G"
-            r'^\d+\.\d+GR$',        # "6.11GR", "7.3GR", "12.5GR", "6.1GR"
-            r'^\d+\.\d+GRAMOS$',    # "6.11GRAMOS", "6.1GRAMOS"
-            r'^\d+\.\d+GRAM$',      # "6.11GRAM", "6.1GRAM"
-            r'^\d+\.\d+GMS$',       # "6.11GMS", "6.1GMS"
-            r'^\d+\.\d+KG$',        # "1.5KG", "0.1KG"
-            r'^\d+\.\d+OZ$',        # "0.26OZ", "0.1OZ"
-            r'^\d+\.\d+LLG$',       # "6.11LLG" o "6.llG" (error OCR)
-            r'^\d+\.\d+LG$',        # "6.11LG" o "6.lG" (error OCR)
-            r'^\d+\.\d+LB$',        # "2.5LB", "0.1LB"
-            r'^\d+\.\d+LIBRAS$',    # "2.5LIBRAS", "0.1LIBRAS"
-            r'^\d+\.\d+POUNDS$',    # "2.5POUNDS", "0.1POUNDS"
-        ],
-        'weight_integer': [
-            r'^\d+G$',              # "3G", "34G", "1G"
-            r'^\d+GR$',             # "3GR", "34GR", "1GR"
-            r'^\d+GRAMOS$',         # "3GRAMOS", "1GRAMOS"
-            r'^\d+GRAM$',           # "3GRAM", "1GRAM"
-            r'^\d+GMS$',            # "3GMS", "1GMS"
-            r'^\d+KG$',             # "1KG", "0KG"
-            r'^\d+OZ$',             # "1OZ", "0OZ"
-            r'^\d+LLG$',            # "6LLG" o "6llG" (error OCR)
-            r'^\d+LG$',             # "6LG" o "6lG" (error OCR)
-            r'^\d+LB$',             # "2LB", "1LB"
-            r'^\d+LIBRAS$',         # "2LIBRAS", "1LIBRAS"
-            r'^\d+POUNDS$',         # "2POUNDS", "1POUNDS"
-        ],
-        
-        # === MEDIDAS/DIMENSIONES (MEJORADAS Y MÁS AGRESIVAS) ===
-        'measurement_decimal': [
-            r'^\d+\.\d+CM$',        # "2.5CM", "10.2CM", "0.1CM"
-            r'^\d+\.\d+MM$',        # "7.3MM", "15.8MM", "0.1MM"
-            r'^\d+\.\d+M$',         # "1.2M", "0.1M"
-            r'^\d+\.\d+PULGADAS$',  # "2.5PULGADAS", "0.1PULGADAS"
-            r'^\d+\.\d+IN$',        # "2.5IN", "0.1IN"
-            r'^\d+\.\d+INCH$',      # "2.5INCH", "0.1INCH"
-            r'^\d+\.\d+FT$',        # "2.5FT", "0.1FT"
-            r'^\d+\.\d+FEET$',      # "2.5FEET", "0.1FEET"
-            r'^\d+\.\d+YD$',        # "2.5YD", "0.1YD"
-            r'^\d+\.\d+YARD$',      # "2.5YARD", "0.1YARD"
-        ],
-        'measurement_integer': [
-            r'^\d+CM$',             # "2CM", "22CM", "0CM"
-            r'^\d+MM$',             # "5MM", "10MM", "0MM"
-            r'^\d+M$',              # "1M", "0M"
-            r'^\d+PULGADAS$',       # "5PULGADAS", "0PULGADAS"
-            r'^\d+IN$',             # "5IN", "0IN"
-            r'^\d+INCH$',           # "5INCH", "0INCH"
-            r'^\d+FT$',             # "2FT", "0FT"
-            r'^\d+FEET$',           # "2FEET", "0FEET"
-            r'^\d+YD$',             # "2YD", "0YD"
-            r'^\d+YARD$',           # "2YARD", "0YARD"
-        ],
-        
-        # === NÚMEROS PEQUEÑOS (PROBABLEMENTE TALLAS) ===
-        'size_number': [
-            r'^\d{1,2}$',           # "6", "7", "42" (números de 1-2 dígitos)
-            r'^\d+\.\d+$',          # "6.5", "7.5", "6.1" (tallas decimales)
-        ],
-        
-        # === UNIDADES ESPECÍFICAS ===
-        'specific_units': [
-            r'^LLG$',               # Solo "LLG" (probablemente error OCR para "11G")
-            r'^G$',                 # Solo "G"
-            r'^KG$',                # Solo "KG"
-            r'^L$',                 # Solo "L"
-            r'^ML$',                # Solo "ML"
-            r'^CM$',                # Solo "CM"
-            r'^MM$',                # Solo "MM"
-        ],
-    }
-    
-    # CASOS ESPECIALES para patrones con formato atípico - MÁS AGRESIVOS
-    special_cases = [
-        # === CONFUSIONES OCR ESPECÍFICAS ===
-        r'^\d+\.\s*LLG$',       # "6. LLG", "6.LLG" (probablemente "6.11G")
-        r'^\d+\s+LLG$',         # "6 LLG" (probablemente "6 11G")
-        r'^\d+\.\s*G$',         # "6. G", "6.G"
-        r'^\d+\s+G$',           # "6 G"
-        r'^\d+\.\s*KG$',        # "6. KG", "6.KG"
-        r'^\d+\s+KG$',          # "6 KG"
-        
-        # === NÚMEROS CON UN SOLO DÍGITO DECIMAL (MUY PROBLEMÁTICOS) ===
-        r'^\d+\.\d$',           # "6.1", "7.5", "8.3" (sin unidad pero formato de medida)
-        r'^\d+\.\d[A-Z]*$',     # "6.1G", "7.5K", "8.3CM" etc.
-        
-        # === PATRONES NUMÉRICOS QUE PARECEN MEDIDAS ===
-        r'^\d+\.\s*\d+$',       # "6. 11", "6.11" (sin unidad pero probablemente medida)
-        r'^\d+\.\s*LL$',        # "6. LL", "6.LL" (probablemente "6.11")
-        r'^\d+\.\s*ll$',        # "6. ll", "6.ll" (minúsculas)
-        r'^\d+\.\s*II$',        # "6. II", "6.II" (confusión con números romanos)
-        
-        # === PATRONES DE UN SOLO DÍGITO DECIMAL MUY ESPECÍFICOS ===
-        r'^\d\.\d+[A-Z]*$',     # "6.1g", "7.2kg", "5.8cm" (un dígito antes del punto)
-        r'^\d{1,2}\.\d{1,2}[A-Z]*$',  # Hasta 2 dígitos antes y después del punto con unidad
-    ]
-    
-    # Segundo, probar los casos especiales (alta prioridad)
-    for pattern in special_cases:
-        if re.match(pattern, text_clean) or re.match(pattern, text_original.upper()):
-            print(f"   🎯 DETECTADO caso especial: patrón {pattern}")
-            return {
-                'is_only_measurement': True,
-                'type': 'special_case',
-                'reason': 'Caso especial de medida/peso con formato atípico o error OCR',
-                'matched_pattern': pattern,
-                'original_text': text_original,
-                'cleaned_text': text_clean,
-                'corrected_text': corrected_text
-            }
-    
-    # Tercero, probar los patrones regulares
-    for category, patterns in discard_patterns.items():
-        for pattern in patterns:
-            if re.match(pattern, text_clean):
-                print(f"   🎯 DETECTADO como {category}: patrón {pattern}")
-                return {
-                    'is_only_measurement': True,
-                    'type': category,
-                    'reason': f'Coincide con patrón de {category}',
-                    'matched_pattern': pattern,
-                    'original_text': text_original,
-                    'cleaned_text': text_clean,
-                    'corrected_text': corrected_text
-                }
-    
-    # Caso específico: Detectar "6. llg" como medida por su formato
-    if re.search(r'\d+\s*\.\s*ll', text_original.lower()):
-        print(f"   🎯 DETECTADO caso específico: formato '6. llg' (error OCR)")
-        return {
-            'is_only_measurement': True,
-            'type': 'ocr_error_weight',
-            'reason': 'Formato que corresponde a error OCR en peso (ll en lugar de 11)',
-            'matched_pattern': r'\d+\s*\.\s*ll',
-            'original_text': text_original,
-            'cleaned_text': text_clean,
-            'corrected_text': corrected_text
-        }
-    
-    # NUEVO: Verificación adicional para números decimales sospechosos
-    if re.match(r'^\d+\.\d{1,2}$', text_clean):  # Números como "6.1", "7.25", etc.
-        print(f"   🤔 SOSPECHOSO: Número decimal sin unidad que podría ser medida")
-        return {
-            'is_only_measurement': True,
-            'type': 'suspicious_decimal',
-            'reason': 'Número decimal sospechoso sin unidad (probablemente medida)',
-            'matched_pattern': r'^\d+\.\d{1,2}$',
-            'original_text': text_original,
-            'cleaned_text': text_clean,
-            'corrected_text': corrected_text
-        }
-    
-    # Si llegamos aquí, NO es solo una medida/peso
-    print(f"   ✅ NO es medida/peso - texto válido para clasificación")
-    return {
-        'is_only_measurement': False,
-        'type': 'valid_content',
-        'reason': 'No coincide con patrones de medidas/pesos únicamente',
-        'matched_pattern': None,
-        'original_text': text_original,
-        'cleaned_text': text_clean,
-        'corrected_text': corrected_text
-    }
+    return match_measurement(text, verbose)
 
 def enhanced_rectangle_analysis(image_path: str) -> dict:
     """
@@ -289,10 +76,20 @@ def enhanced_rectangle_analysis(image_path: str) -> dict:
     
     print(f"🔍 Analizando: {os.path.basename(image_path)}")
     
+    # Paso 0: Prefiltro aprendido - los productos claros van a la categorización sin OCR
+    prefilter = get_code_prefilter()
+    if prefilter is not None and prefilter.skip_ocr(cv2.imread(image_path)):
+        result['analysis_steps'].append('code_prefilter')
+        result['category'] = 'image'
+        print(f"  ⚡ Producto según el prefiltro: se omite el OCR")
+        detect_jewelry_category(result, image_path, "")
+        result['confidence'] = 0.8
+        return result
+    
     # Paso 1: Usar el clasificador ML existente para extraer texto
     result['analysis_steps'].append('ml_classification')
     try:
-        classifier = ImageCategoryClassifier()
+        classifier = get_model('image_classifier')
         ml_result = classifier.classify_image(image_path)
         
         # Si el ML ya lo descarta, respetamos esa decisión
@@ -348,34 +145,139 @@ def enhanced_rectangle_analysis(image_path: str) -> dict:
     
     # Paso 4: NUEVO - Detectar categoría de joyería para imágenes
     if result['category'] == 'image':
-        result['analysis_steps'].append('jewelry_category_detection')
-        try:
-            detector = JewelryCategoryDetector()
-            jewelry_result = detector.detect_category(
-                image_path=image_path,
-                extracted_text=extracted_text,
-                filename=os.path.basename(image_path)
-            )
-            
-            # Actualizar resultado con información de joyería
-            result['jewelry_category'] = jewelry_result.get('category', 'sin_categoria')
-            result['jewelry_confidence'] = jewelry_result.get('confidence', 0.0)
-            result['jewelry_features'] = jewelry_result.get('features', {})
-            result['jewelry_analysis'] = jewelry_result
-            
-            print(f"  🏷️ Categoría de joyería: {result['jewelry_category']} (confianza: {result['jewelry_confidence']:.2f})")
-            
-        except Exception as e:
-            print(f"  ⚠️ Error en detección de categoría de joyería: {e}")
-            result['jewelry_category'] = 'pendientes'  # Fallback
-            result['jewelry_confidence'] = 0.3
+        detect_jewelry_category(result, image_path, extracted_text)
     
     result['confidence'] = 0.8
     print(f"  ✅ VÁLIDO - Categoría final: {result['category']}")
     
     return result
 
-def process_rectangles_improved(input_dir, codes_dir, images_dir, discards_dir):
+def detect_jewelry_category(result, image_path, extracted_text):
+    """Añade al resultado del análisis la categoría de joyería de una imagen de producto."""
+    result['analysis_steps'].append('jewelry_category_detection')
+    try:
+        detector = get_model('jewelry_detector')
+        jewelry_result = detector.detect_category(
+            image_path=image_path,
+            extracted_text=extracted_text,
+            filename=os.path.basename(image_path)
+        )
+        
+        # Actualizar resultado con información de joyería
+        result['jewelry_category'] = jewelry_result.get('category', 'sin_categoria')
+        result['jewelry_confidence'] = jewelry_result.get('confidence', 0.0)
+        result['jewelry_features'] = jewelry_result.get('features', {})
+        result['jewelry_analysis'] = jewelry_result
+        
+        print(f"  🏷️ Categoría de joyería: {result['jewelry_category']} (confianza: {result['jewelry_confidence']:.2f})")
+        
+    except Exception as e:
+        print(f"  ⚠️ Error en detección de categoría de joyería: {e}")
+        result['jewelry_category'] = 'pendientes'  # Fallback
+        result['jewelry_confidence'] = 0.3
+
+def find_blank_paths(image_paths):
+    """
+    Prefiltro por lotes (ver blank_prefilter.py): devuelve las rutas de los recortes en
+    blanco, que pueden descartarse sin pasar por el clasificador ML ni el OCR.
+    
+    Sustituye al veredicto 'blank_image' del ML para estos recortes: el descarte lo
+    deciden las reglas de píxeles de is_image_blank, no el modelo.
+    """
+    images = [cv2.imread(str(path)) for path in image_paths]
+    results = prefilter_blank_images(images)
+    blank_paths = {str(path) for path, result in zip(image_paths, results) if result['blank']}
+    del images
+    print(f"⚡ Prefiltro de celdas en blanco: {len(blank_paths)}/{len(image_paths)} descartadas sin OCR")
+    return blank_paths
+
+def blank_cell_analysis(image_path):
+    """Resultado de análisis (mismo formato que enhanced_rectangle_analysis) para una celda en blanco."""
+    return {
+        'image_path': image_path,
+        'should_discard': True,
+        'discard_reason': "Celda en blanco (prefiltro)",
+        'discard_type': 'blank',
+        'category': None,
+        'confidence': 0.99,
+        'analysis_steps': ['blank_prefilter'],
+        'jewelry_category': None,
+        'jewelry_confidence': 0.0,
+        'jewelry_features': {}
+    }
+
+# Modelos que precarga cada proceso del pool según el tipo de análisis
+ANALYSIS_MODELS = {
+    'improved': ['image_classifier', 'jewelry_detector'],
+    'categories': ['enhanced_classifier'],
+}
+
+def _init_analysis_worker(mode):
+    """Inicializador de cada proceso del pool: carga los modelos una sola vez por proceso."""
+    # La paralelización ya está en el pool: un único proceso de OCR por trabajador
+    os.environ.setdefault(ocr_service.WORKERS_ENV, '1')
+    warm_up(ANALYSIS_MODELS[mode])
+
+def _analysis_job(mode, image_path):
+    """Analiza un rectángulo (en el proceso actual o en uno del pool)."""
+    if mode == 'categories':
+        return get_model('enhanced_classifier').enhanced_rectangle_analysis_with_categories(image_path)
+    return enhanced_rectangle_analysis(image_path)
+
+_analysis_pools = {}
+
+def get_analysis_pool(mode, workers):
+    """
+    Pool de procesos de análisis compartido por (modo, procesos): se crea la primera vez
+    y se reutiliza en las siguientes llamadas, así los modelos se cargan una sola vez
+    por proceso y no una vez por hoja.
+    """
+    key = (mode, workers)
+    if key not in _analysis_pools:
+        print(f"⚙️ Iniciando pool de clasificación con {workers} procesos")
+        _analysis_pools[key] = ProcessPoolExecutor(max_workers=workers,
+                                                   mp_context=multiprocessing.get_context('spawn'),
+                                                   initializer=_init_analysis_worker, initargs=(mode,))
+        if len(_analysis_pools) == 1:
+            atexit.register(shutdown_analysis_pools)
+    return _analysis_pools[key]
+
+def shutdown_analysis_pools():
+    while _analysis_pools:
+        _, pool = _analysis_pools.popitem()
+        pool.shutdown(cancel_futures=True)
+
+def iter_rectangle_analyses(image_paths, blank_paths=(), mode='improved', parallel=False, workers=None):
+    """
+    Analiza los rectángulos y devuelve los resultados en el mismo orden que image_paths
+    (orden rect_N), tanto en secuencial como en paralelo.
+    
+    Args:
+        image_paths: Rutas de los rectángulos, ya ordenadas
+        blank_paths: Rutas descartadas por el prefiltro (no se analizan, ver find_blank_paths)
+        mode: 'improved' (enhanced_rectangle_analysis) o 'categories'
+              (EnhancedJewelryClassifier.enhanced_rectangle_analysis_with_categories)
+        parallel: Repartir los análisis en un pool de procesos persistente (ver
+                  get_analysis_pool); cada proceso carga los modelos una vez al arrancar
+        workers: Número de procesos (por defecto, núcleos disponibles)
+    
+    Yields:
+        dict: Análisis de cada rectángulo, en orden
+    """
+    paths = [str(path) for path in image_paths]
+    pending = [path for path in paths if path not in blank_paths]
+    
+    if parallel and len(pending) > 1:
+        pool = get_analysis_pool(mode, workers or os.cpu_count() or 1)
+        # map conserva el orden de entrada aunque los análisis terminen desordenados
+        results = pool.map(partial(_analysis_job, mode), pending)
+    else:
+        results = (_analysis_job(mode, path) for path in pending)
+    
+    for path in paths:
+        yield blank_cell_analysis(path) if path in blank_paths else next(results)
+
+def process_rectangles_improved(input_dir, codes_dir, images_dir, discards_dir, parallel=False, workers=None):
     """
     Versión mejorada que descarta específicamente rectángulos con solo medidas/pesos
     con mayor robustez ante variaciones de OCR y confusiones entre 'll' y '11'.
@@ -387,6 +289,8 @@ def process_rectangles_improved(input_dir, codes_dir, images_dir, discards_dir):
         codes_dir: Directorio donde se guardarán los rectángulos de texto
         images_dir: Directorio donde se guardarán los rectángulos de imágenes
         discards_dir: Directorio donde se guardarán los rectángulos descartados
+        parallel: Clasificar en un pool de procesos (ver iter_rectangle_analyses)
+        workers: Número de procesos del pool
     """
     # Limpiar las carpetas de salida
     clean_output_directories(codes_dir, images_dir, discards_dir)
@@ -421,14 +325,15 @@ def process_rectangles_improved(input_dir, codes_dir, images_dir, discards_dir):
     discard_count = 0
     discard_reasons = {}
     
-    # Procesar cada imagen con análisis mejorado
-    for i, image_path in enumerate(image_paths, 1):
+    # Descartar las celdas en blanco antes de cualquier OCR o inferencia
+    blank_paths = find_blank_paths(image_paths)
+    
+    # Procesar cada imagen con análisis mejorado (resultados en orden rect_N)
+    analyses = iter_rectangle_analyses(image_paths, blank_paths, parallel=parallel, workers=workers)
+    for i, (image_path, analysis) in enumerate(zip(image_paths, analyses), 1):
         file_name = os.path.basename(str(image_path))
         print(f"\n📊 [{i}/{len(image_paths)}] {file_name}")
         
-        # Análisis mejorado
-        analysis = enhanced_rectangle_analysis(str(image_path))
-        
         if analysis['should_discard']:
             # Guardar en directorio de descartes con información detallada
             discard_count += 1
@@ -438,7 +343,7 @@ def process_rectangles_improved(input_dir, codes_dir, images_dir, discards_dir):
             # Crear nombre de archivo con información del descarte
             base_name = os.path.splitext(file_name)[0]
             ext = os.path.splitext(file_name)[1]
-            safe_reason = analysis['measurement_details']['type'] if 'measurement_details' in analysis else 'unknown'
+            safe_reason = analysis['measurement_details']['type'] if 'measurement_details' in analysis else analysis.get('discard_type', 'unknown')
             discard_filename = f"{base_name}_{safe_reason}{ext}"
             
             # Copiar imagen a directorio de descartes
@@ -486,7 +391,7 @@ def process_rectangles_improved(input_dir, codes_dir, images_dir, discards_dir):
             # NUEVO: Guardar información de categoría de joyería si está disponible
             if analysis.get('jewelry_category') and analysis['jewelry_category'] != 'sin_categoria':
                 try:
-                    detector = JewelryCategoryDetector()
+                    detector = get_model('jewelry_detector')
                     category_json_path = detector.save_category_json(
                         result=analysis['jewelry_analysis'],
                         output_dir=images_dir
@@ -523,6 +428,10 @@ def process_rectangles_improved(input_dir, codes_dir, images_dir, discards_dir):
     print(f"\n📈 ESTADÍSTICAS:")
     print(f"  • Rectángulos válidos: {total_valid} ({100-discard_percentage:.1f}%)")
     print(f"  • Rectángulos descartados: {discard_count} ({discard_percentage:.1f}%)")
+    prefilter = prefilter_report()
+    if prefilter['cells'] and not parallel:
+        print(f"  • OCR evitado por el prefiltro: {prefilter['skipped']}/{prefilter['cells']} "
+              f"({prefilter['ocr_avoided']:.0%})")
     
     if text_count == image_count:
         print(f"\n✅ BALANCE PERFECTO: {text_count} códigos ↔ {image_count} imágenes")
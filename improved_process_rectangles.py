@@ -8,6 +8,7 @@ import shutil
 from pathlib import Path
 import sys
 from MachineLearning.classify_image import ImageCategoryClassifier
+from model_registry import get_model
 
 def clean_output_directories(codes_dir, images_dir):
     """Limpia las carpetas de salida para comenzar desde cero."""
@@ -35,7 +36,7 @@ def process_rectangles_improved(input_dir, codes_dir, images_dir):
     
     # Inicializar clasificador ML
     print("🤖 Inicializando clasificador ML...")
-    classifier = ImageCategoryClassifier()
+    classifier = get_model('image_classifier')
     
     # Obtener todas las imágenes
     image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Caché persistente de plantillas de maquetación de hojas de catálogo.
+
+Muchos catálogos repiten la misma cuadrícula impresa página tras página. Para cada hoja
+se calcula una huella barata de su estructura (proyecciones de líneas oscuras por filas
+y columnas sobre una copia muestreada). Si coincide con una plantilla conocida y una
+verificación rápida confirma que las celdas siguen en su sitio, se reutilizan las cajas
+guardadas en lugar de volver a ejecutar findContours + approxPolyDP.
+"""
+
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from extract_rectangles import box_to_polygon
+
+# Número de posiciones de cada proyección de la huella
+FINGERPRINT_BINS = 128
+
+# Lado largo aproximado de la copia muestreada para calcular la huella
+FINGERPRINT_LONG_SIDE = 1024
+
+class LayoutTemplateStore:
+    """
+    Almacén de plantillas (huella + cajas de las celdas) con expulsión LRU,
+    guardado en un archivo JSON para que persista entre ejecuciones.
+    """
+
+    def __init__(self, path='layout_templates.json', max_templates=32,
+                 min_similarity=0.95, max_aspect_diff=0.01):
+        """
+        Args:
+            path: Archivo JSON donde se guardan las plantillas
+            max_templates: Número máximo de plantillas (se expulsa la menos usada recientemente)
+            min_similarity: Correlación mínima de las proyecciones para considerar que coinciden
+            max_aspect_diff: Diferencia relativa máxima de proporciones entre hoja y plantilla
+        """
+        self.path = path
+        self.max_templates = max_templates
+        self.min_similarity = min_similarity
+        self.max_aspect_diff = max_aspect_diff
+        self.templates = []
+        self.stats = {'hits': 0, 'misses': 0, 'rejected': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        self._pending = threading.local()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.templates = data.get('templates', [])
+        except Exception as e:
+            print(f"⚠️ No se pudieron cargar las plantillas de {self.path}: {e}")
+            self.templates = []
+
+    def save(self):
+        """Guarda las plantillas de forma atómica (archivo temporal + reemplazo)."""
+        with self._lock:
+            data = {'version': 1, 'templates': self.templates}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def match(self, image):
+        """
+        Busca una plantilla que coincida con la hoja y verifica sus celdas.
+
+        Returns:
+            list: Polígonos de las celdas (mismo formato que detect_rectangles) o None
+        """
+        fingerprint = compute_fingerprint(image)
+        height, width = image.shape[:2]
+
+        with self._lock:
+            best, best_score = None, self.min_similarity
+            for template in self.templates:
+                t_height, t_width = template['shape']
+                if abs((width / height) / (t_width / t_height) - 1) > self.max_aspect_diff:
+                    continue
+                score = fingerprint_similarity(fingerprint, template['fingerprint'])
+                if score >= best_score:
+                    best, best_score = template, score
+
+        self._pending.fingerprint = fingerprint
+        self._pending.template = best
+
+        if best is None:
+            self.stats['misses'] += 1
+            return None
+
+        boxes = scale_boxes(best['boxes'], best['shape'], (height, width))
+        if not verify_boxes(image, boxes):
+            self.stats['rejected'] += 1
+            print(f"⚠️ Plantilla {best['id']} descartada en la verificación (similitud {best_score:.3f})")
+            return None
+
+        with self._lock:
+            best['last_used'] = time.time()
+            best['hits'] = best.get('hits', 0) + 1
+        self.stats['hits'] += 1
+        self._pending.template = None
+        print(f"📐 Plantilla {best['id']} reutilizada: {len(boxes)} celdas (similitud {best_score:.3f})")
+        return [box_to_polygon(box) for box in boxes]
+
+    def remember(self, image, rectangles):
+        """
+        Guarda (o actualiza) la plantilla de una hoja tras la detección completa.
+        Si la hoja se parecía a una plantilla que no pasó la verificación, se sustituyen
+        sus cajas en lugar de añadir una plantilla casi duplicada.
+        """
+        if not rectangles:
+            return
+
+        fingerprint = getattr(self._pending, 'fingerprint', None)
+        if fingerprint is None:
+            fingerprint = compute_fingerprint(image)
+        previous = getattr(self._pending, 'template', None)
+        self._pending.fingerprint = None
+        self._pending.template = None
+
+        boxes = [list(cv2.boundingRect(rect)) for rect in rectangles]
+        now = time.time()
+
+        with self._lock:
+            if previous is not None and previous in self.templates:
+                template = previous
+            else:
+                template = {'id': f"tpl_{int(now * 1000):x}", 'hits': 0}
+                self.templates.append(template)
+            template.update({
+                'shape': list(image.shape[:2]),
+                'fingerprint': [round(float(v), 4) for v in fingerprint],
+                'boxes': boxes,
+                'last_used': now
+            })
+
+            # Expulsión LRU
+            while len(self.templates) > self.max_templates:
+                oldest = min(self.templates, key=lambda t: t.get('last_used', 0))
+                self.templates.remove(oldest)
+                self.stats['evicted'] += 1
+
+        self.save()
+
+def compute_fingerprint(image):
+    """
+    Huella de la estructura de la hoja: proporción de píxeles oscuros por fila y por
+    columna de una copia muestreada, realzando las líneas (filas/columnas casi
+    totalmente oscuras) frente al contenido de las celdas.
+    """
+    height, width = image.shape[:2]
+    factor = max(1, max(height, width) // FINGERPRINT_LONG_SIDE)
+    rows, cols = height // factor, width // factor
+    sampled = cv2.resize(image[:rows * factor, :cols * factor], (cols, rows), interpolation=cv2.INTER_NEAREST)
+    dark = cv2.cvtColor(sampled, cv2.COLOR_BGR2GRAY) <= 200
+
+    projections = []
+    for profile in (dark.mean(axis=1), dark.mean(axis=0)):
+        lines = np.clip(profile - 0.5, 0, None) * 2
+        edges = np.linspace(0, len(lines), FINGERPRINT_BINS + 1).astype(int)
+        binned = np.maximum.reduceat(lines, edges[:-1])
+        projections.append(binned)
+    return np.concatenate(projections)
+
+def fingerprint_similarity(a, b):
+    """Correlación (coseno centrado) entre dos huellas; 1.0 = idénticas."""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    a = a - a.mean()
+    b = b - b.mean()
+    norm = np.linalg.norm(a) * np.linalg.norm(b)
+    if norm == 0:
+        return 0.0
+    return float(np.dot(a, b) / norm)
+
+def scale_boxes(boxes, template_shape, shape):
+    """Escala las cajas de la plantilla al tamaño de la hoja actual."""
+    sy = shape[0] / template_shape[0]
+    sx = shape[1] / template_shape[1]
+    if sx == 1 and sy == 1:
+        return [tuple(box) for box in boxes]
+    return [(int(round(x * sx)), int(round(y * sy)), int(round(w * sx)), int(round(h * sy)))
+            for x, y, w, h in boxes]
+
+def verify_boxes(image, boxes, min_dark_outside=0.9, min_white_inside=0.5):
+    """
+    Verificación rápida: justo fuera de cada caja debe haber línea oscura y en su borde
+    interior debe predominar el blanco. Sólo se leen los anillos de 1 píxel de cada caja.
+    """
+    height, width = image.shape[:2]
+    for x, y, w, h in boxes:
+        if x < 0 or y < 0 or x + w > width or y + h > height:
+            return False
+
+        outside = []
+        inside = [image[y, x:x + w], image[y + h - 1, x:x + w], image[y:y + h, x], image[y:y + h, x + w - 1]]
+        if y > 0:
+            outside.append(image[y - 1, x:x + w])
+        if y + h < height:
+            outside.append(image[y + h, x:x + w])
+        if x > 0:
+            outside.append(image[y:y + h, x - 1])
+        if x + w < width:
+            outside.append(image[y:y + h, x + w])
+
+        inside_gray = cv2.cvtColor(np.concatenate(inside).reshape(1, -1, 3), cv2.COLOR_BGR2GRAY)
+        if np.mean(inside_gray > 200) < min_white_inside:
+            return False
+        if outside:
+            outside_gray = cv2.cvtColor(np.concatenate(outside).reshape(1, -1, 3), cv2.COLOR_BGR2GRAY)
+            if np.mean(outside_gray <= 200) < min_dark_outside:
+                return False
+    return True
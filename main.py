@@ -5,9 +5,11 @@ import shutil
 import datetime
 import time
 import pytz
-from extract_rectangles import extract_rectangles
+from extract_rectangles import extract_rectangles_batch, load_grid_index
 # Usar la versión mejorada del procesamiento de rectángulos
 from improved_classify_rectangles_ocr_fixed import process_rectangles_improved as process_rectangles
+from model_registry import mark_startup, print_startup_report, warm_up
+from ocr_service import CODE_REVIEW_CONFIDENCE
 
 # Eliminadas las funciones is_mostly_white, is_code_text, preprocess_for_ocr y classify_and_save_rectangles
 # Ahora estas funcionalidades se importan desde classify_rectangles.py
@@ -18,10 +20,15 @@ from improved_classify_rectangles_ocr_fixed import process_rectangles_improved a
 # La función get_category_from_code fue eliminada y su funcionalidad
 # incorporada directamente en pair_and_upload_codes_images_by_order
 
+# Orden en el que se buscan vecinos de un código en la cuadrícula: la imagen del
+# producto suele estar encima del código, y si no, a su izquierda, derecha o debajo
+GRID_NEIGHBOUR_OFFSETS = [(-1, 0), (0, -1), (0, 1), (1, 0)]
+
 
 def pair_and_upload_codes_images_by_order(
     codes_dir, images_dir, mongo_client, 
-    db_name='images_db', collection_name='codes_images', image_id=None
+    db_name='images_db', collection_name='codes_images', image_id=None,
+    grid_index_path=None, montage=True
 ):
     """
     Empareja códigos e imágenes basándose en los nombres de archivo y los sube a MongoDB.
@@ -34,10 +41,20 @@ def pair_and_upload_codes_images_by_order(
         db_name: Nombre de la base de datos
         collection_name: Nombre de la colección
         image_id: Identificador opcional de la imagen original
+        grid_index_path: Ruta opcional al cells.json de extract_rectangles; si existe, cada
+                         código se empareja con la imagen vecina en la cuadrícula
+        montage: Leer todos los códigos con un solo OCR por mosaico (ver ocr_montage.py);
+                 los recortes ambiguos se leen por separado
+    
+    Cada código guarda la confianza de su OCR ('ocr_confidence'); los que quedan por
+    debajo de CODE_REVIEW_CONFIDENCE se marcan con 'needs_review' para revisarlos a mano.
     """
     import re
-    import pytesseract
     import json
+    from ocr_cache import cache_report
+    from ocr_montage import montage_ocr, report_montage
+    from ocr_normalizer import print_normalizer_report
+    from ocr_service import recognize
     
     # Función auxiliar para extraer el número del nombre del archivo
     def extract_number(fname):
@@ -49,6 +66,12 @@ def pair_and_upload_codes_images_by_order(
     image_files = sorted([f for f in os.listdir(images_dir) if f.endswith('.png')], key=extract_number)
     
     print(f"Encontrados {len(code_files)} códigos y {len(image_files)} imágenes para emparejar")
+
+    # Índice de cuadrícula: búsqueda de vecinos O(1) por (fila, columna)
+    positions, by_position = (None, None)
+    if grid_index_path and os.path.exists(grid_index_path):
+        positions, by_position = load_grid_index(grid_index_path)
+    available_images = set(image_files)
     
     # Acceder a la colección y crear índice si es necesario
     collection = mongo_client[db_name][collection_name]
@@ -57,6 +80,22 @@ def pair_and_upload_codes_images_by_order(
     # Para los registros insertados/actualizados
     inserted_count = 0
     updated_count = 0
+    review_count = 0
+    
+    code_config = '--psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+    
+    # OCR por mosaico: todos los códigos de la hoja en una sola llamada
+    montage_results = {}
+    if montage and code_files:
+        code_images = [cv2.imread(os.path.join(codes_dir, f)) for f in code_files]
+        try:
+            result = montage_ocr(code_images, code_config)
+            report_montage(result, len(code_files))
+            montage_results = {f: ocr for f, img, ocr in zip(code_files, code_images, result['results'])
+                               if img is not None}
+        except Exception as e:
+            print(f"⚠️ OCR por mosaico no disponible, se lee cada código por separado: {e}")
+        del code_images
     
     # Procesar cada código
     for code_file in code_files:
@@ -70,11 +109,16 @@ def pair_and_upload_codes_images_by_order(
             continue
             
         try:
-            # Extraer el texto del código usando OCR
-            code_text = pytesseract.image_to_string(
-                code_img,
-                config='--psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
-            ).strip()
+            # Extraer el texto del código usando OCR (o el ya leído en el mosaico); una
+            # lectura del mosaico con poca confianza se repite sólo para este recorte
+            ocr = montage_results.get(code_file)
+            if ocr is None or ocr['confidence'] < CODE_REVIEW_CONFIDENCE:
+                single = recognize(code_img, code_config, normalize=True)
+                if ocr is None or single['confidence'] >= ocr['confidence']:
+                    ocr = single
+            code_text = ocr['text'].strip()
+            ocr_confidence = round(ocr['confidence'], 1)
+            needs_review = ocr_confidence < CODE_REVIEW_CONFIDENCE
         except Exception as e:
             print(f"Error al procesar {code_file}: {str(e)}")
             continue
@@ -87,7 +131,10 @@ def pair_and_upload_codes_images_by_order(
             print(f"No se pudo extraer texto del archivo {code_file}, omitiendo...")
             continue
             
-        print(f"Código extraído: '{code_text}' de {code_file}")
+        print(f"Código extraído: '{code_text}' de {code_file} (confianza OCR {ocr_confidence:.0f})")
+        if needs_review:
+            review_count += 1
+            print(f"  ⚠️ Confianza baja: código marcado para revisión manual")
         
         # NUEVO: Determinar la categoría usando la detección automática de joyería
         category = 'sin_categoria'  # Por defecto
@@ -97,17 +144,33 @@ def pair_and_upload_codes_images_by_order(
         # Buscar la imagen correspondiente por número de rectángulo
         rect_num = extract_number(code_file)
         matching_image = None
-        
+
+        # Primero por posición en la cuadrícula: la imagen vecina aún sin emparejar
+        if positions and code_file in positions:
+            row, col = positions[code_file]
+            for d_row, d_col in GRID_NEIGHBOUR_OFFSETS:
+                neighbour = by_position.get((row + d_row, col + d_col))
+                if neighbour in available_images:
+                    matching_image = neighbour
+                    image_files.remove(matching_image)
+                    available_images.discard(matching_image)
+                    print(f"  🧩 {code_file} (fila {row}, col {col}) emparejado por cuadrícula con {matching_image}")
+                    break
+
         # Buscar una imagen con el mismo número de rectángulo
-        for img_file in image_files:
-            if extract_number(img_file) == rect_num:
-                matching_image = img_file
-                break
+        if not matching_image:
+            for img_file in image_files:
+                if extract_number(img_file) == rect_num:
+                    matching_image = img_file
+                    image_files.remove(matching_image)  # Eliminar para no reutilizar
+                    available_images.discard(matching_image)
+                    break
         
         # Si no encontramos una correspondencia exacta, usar la primera disponible
         if not matching_image and image_files:
             matching_image = image_files[0]
             image_files.remove(matching_image)  # Eliminar para no reutilizar
+            available_images.discard(matching_image)
             print(f"No se encontró correspondencia exacta para {code_file}. Usando {matching_image}")
         elif not matching_image:
             print(f"No se encontró ninguna imagen disponible para emparejar con {code_file}, omitiendo...")
@@ -154,6 +217,8 @@ def pair_and_upload_codes_images_by_order(
         doc = {
             'code': code_text,
             'category': category,
+            'ocr_confidence': ocr_confidence,
+            'needs_review': needs_review,
             'updated_at': now
         }
         
@@ -197,6 +262,10 @@ def pair_and_upload_codes_images_by_order(
     print(f"  - {inserted_count} nuevos registros insertados")
     print(f"  - {updated_count} registros actualizados")
     print(f"  - {len(code_files)} códigos procesados en total")
+    print(f"  - {review_count} códigos marcados para revisión por baja confianza de OCR")
+    cache = cache_report()
+    print(f"  - Caché OCR: {cache['hits']} aciertos, {cache['misses']} fallos")
+    print_normalizer_report()
 
 def clean_output_dirs(*dirs):
     for d in dirs:
@@ -210,30 +279,41 @@ def clean_output_dirs(*dirs):
                 os.rmdir(d)
 
 if __name__ == "__main__":
+    mark_startup('imports')
     client = return_mongo_client()
     clean_output_dirs("colgantes y collares", "codes_output", "images_output", "discards_output", "preprocessed_output", "rectangles_output")
     print(client.list_database_names())
+    # Cargar los modelos una sola vez antes de procesar las hojas
+    warm_up()
     source_dir = "source_images"
     images_old_dir = "images_old"
     if not os.path.exists(images_old_dir):
         os.makedirs(images_old_dir)
-    for fname in os.listdir(source_dir):
-        if not fname.lower().endswith((".png", ".jpg", ".jpeg")):
-            continue
+    sheet_paths = [os.path.join(source_dir, fname) for fname in sorted(os.listdir(source_dir))
+                   if fname.lower().endswith((".png", ".jpg", ".jpeg"))]
+
+    # La extracción de las hojas corre en paralelo en un pool de procesos; la
+    # clasificación y la subida se hacen aquí a medida que cada hoja termina
+    for index, result in enumerate(extract_rectangles_batch(sheet_paths, output_root="rectangles_output", debug=True)):
+        if index == 0:
+            # Tiempo hasta tener la primera hoja lista para clasificar
+            mark_startup('first_sheet')
+            print_startup_report()
         start_time = time.time()
-        image_path = os.path.join(source_dir, fname)
-        print(f"Procesando {image_path}")
-        extract_rectangles(
-            image_path=image_path,
-            output_dir="rectangles_output",
-            debug_path="debug_contours.png"
-        ) 
+        image_path = result['source']
+        fname = os.path.basename(image_path)
+        print(f"Procesando {image_path} ({result['count']} rectángulos extraídos en {result['elapsed']:.2f} s)")
+        if result['error']:
+            print(f"❌ Error extrayendo {fname}: {result['error']}")
+            continue
+
         # Usar la función process_rectangles del módulo classify_rectangles.py
         process_rectangles(
-            input_dir="rectangles_output",
+            input_dir=result['output_dir'],
             codes_dir="codes_output",
             images_dir="images_output",
-            discards_dir="discards_output"
+            discards_dir="discards_output",
+            parallel=True
         ) 
         
          # Emparejar códigos e imágenes y subir a MongoDB
@@ -241,11 +321,12 @@ if __name__ == "__main__":
             codes_dir="codes_output",
             images_dir="images_output",
             mongo_client=client,
-            image_id=os.path.splitext(fname)[0]
+            image_id=os.path.splitext(fname)[0],
+            grid_index_path=result['grid_index']
         ) 
        
         # Mover la imagen procesada a images_old
         shutil.move(image_path, os.path.join(images_old_dir, fname))
-        elapsed = time.time() - start_time
+        elapsed = time.time() - start_time + result['elapsed']
         print(f"Tiempo de procesamiento para {fname}: {elapsed:.2f} segundos")
         """ clean_output_dirs("rectangles_output", "codes_output", "images_output", "preprocessed_output") """
\ No newline at end of file
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Detector precompilado de textos que son sólo medidas o pesos ("6.1g", "6. llg", "22CM"...).
+
+is_measurements_or_weight_only_enhanced probaba unos 60 patrones uno tras otro con
+re.match e imprimía varias líneas por llamada, y se ejecuta para cada rectángulo con
+texto. Aquí todos los patrones se unen al importar el módulo en una sola alternancia
+con grupos con nombre, en el mismo orden de prioridad: como cada alternativa está
+anclada (^...$), re.match devuelve la primera alternativa que coincide, que es el
+mismo patrón que encontraba el bucle. El resultado (tipo, patrón, texto limpio y
+corregido) es idéntico y los mensajes sólo se imprimen con verbose=True.
+
+match_measurement_legacy conserva el bucle original para comprobar la equivalencia
+(ver benchmark_measurement_matcher.py).
+"""
+
+import re
+
+# Prioridad 1: descarte ultra-agresivo para problemas específicos
+PROBLEMATIC_PATTERNS = [
+    # === PATRONES PROBLEMÁTICOS ESPECÍFICOS ===
+    r'^\d+\.\d+[G|GR|GRAM|GRAMOS|GMS]$',  # Cualquier decimal + unidad de peso
+    r'^\d+\.\d+[K|KG|KT|QUILATES]$',      # Cualquier decimal + unidad de peso/material
+    r'^\d+\.\d+[C|CM|M|MM|IN|INCH]$',     # Cualquier decimal + unidad de longitud
+    r'^\d+\.\d+[L|ML|CL|CC|GAL]$',        # Cualquier decimal + unidad de volumen
+    r'^\d+\.\d+[%|€|\$|USD|EUR]$',        # Cualquier decimal + símbolo monetario/porcentaje
+    r'^\d+\.\d{1,2}G$',                   # Específicamente para casos como "6.1G", "7.25G"
+    r'^\d+\.\d{1,2}KG$',                  # Específicamente para casos como "1.5KG", "0.8KG"
+    r'^\d+\.\d{1,2}CM$',                  # Específicamente para casos como "2.5CM", "1.2CM"
+    r'^\d+\.\d{1,2}MM$',                  # Específicamente para casos como "5.3MM", "7.8MM"
+]
+
+# Prioridad 3: patrones específicos para descartar, por categoría y en orden
+DISCARD_PATTERNS = {
+    # === PESOS (MEJORADOS Y MÁS AGRESIVOS) ===
+    'weight_decimal': [
+        r'^\d+\.\d+G$',         # "6.11G", "7.3G", "12.5G", "6.1G"
+        r'^\d+\.\d+GR$',        # "6.11GR", "7.3GR", "12.5GR", "6.1GR"
+        r'^\d+\.\d+GRAMOS$',    # "6.11GRAMOS", "6.1GRAMOS"
+        r'^\d+\.\d+GRAM$',      # "6.11GRAM", "6.1GRAM"
+        r'^\d+\.\d+GMS$',       # "6.11GMS", "6.1GMS"
+        r'^\d+\.\d+KG$',        # "1.5KG", "0.1KG"
+        r'^\d+\.\d+OZ$',        # "0.26OZ", "0.1OZ"
+        r'^\d+\.\d+LLG$',       # "6.11LLG" o "6.llG" (error OCR)
+        r'^\d+\.\d+LG$',        # "6.11LG" o "6.lG" (error OCR)
+        r'^\d+\.\d+LB$',        # "2.5LB", "0.1LB"
+        r'^\d+\.\d+LIBRAS$',    # "2.5LIBRAS", "0.1LIBRAS"
+        r'^\d+\.\d+POUNDS$',    # "2.5POUNDS", "0.1POUNDS"
+    ],
+    'weight_integer': [
+        r'^\d+G$',              # "3G", "34G", "1G"
+        r'^\d+GR$',             # "3GR", "34GR", "1GR"
+        r'^\d+GRAMOS$',         # "3GRAMOS", "1GRAMOS"
+        r'^\d+GRAM$',           # "3GRAM", "1GRAM"
+        r'^\d+GMS$',            # "3GMS", "1GMS"
+        r'^\d+KG$',             # "1KG", "0KG"
+        r'^\d+OZ$',             # "1OZ", "0OZ"
+        r'^\d+LLG$',            # "6LLG" o "6llG" (error OCR)
+        r'^\d+LG$',             # "6LG" o "6lG" (error OCR)
+        r'^\d+LB$',             # "2LB", "1LB"
+        r'^\d+LIBRAS$',         # "2LIBRAS", "1LIBRAS"
+        r'^\d+POUNDS$',         # "2POUNDS", "1POUNDS"
+    ],
+
+    # === MEDIDAS/DIMENSIONES (MEJORADAS Y MÁS AGRESIVAS) ===
+    'measurement_decimal': [
+        r'^\d+\.\d+CM$',        # "2.5CM", "10.2CM", "0.1CM"
+        r'^\d+\.\d+MM$',        # "7.3MM", "15.8MM", "0.1MM"
+        r'^\d+\.\d+M$',         # "1.2M", "0.1M"
+        r'^\d+\.\d+PULGADAS$',  # "2.5PULGADAS", "0.1PULGADAS"
+        r'^\d+\.\d+IN$',        # "2.5IN", "0.1IN"
+        r'^\d+\.\d+INCH$',      # "2.5INCH", "0.1INCH"
+        r'^\d+\.\d+FT$',        # "2.5FT", "0.1FT"
+        r'^\d+\.\d+FEET$',      # "2.5FEET", "0.1FEET"
+        r'^\d+\.\d+YD$',        # "2.5YD", "0.1YD"
+        r'^\d+\.\d+YARD$',      # "2.5YARD", "0.1YARD"
+    ],
+    'measurement_integer': [
+        r'^\d+CM$',             # "2CM", "22CM", "0CM"
+        r'^\d+MM$',             # "5MM", "10MM", "0MM"
+        r'^\d+M$',              # "1M", "0M"
+        r'^\d+PULGADAS$',       # "5PULGADAS", "0PULGADAS"
+        r'^\d+IN$',             # "5IN", "0IN"
+        r'^\d+INCH$',           # "5INCH", "0INCH"
+        r'^\d+FT$',             # "2FT", "0FT"
+        r'^\d+FEET$',           # "2FEET", "0FEET"
+        r'^\d+YD$',             # "2YD", "0YD"
+        r'^\d+YARD$',           # "2YARD", "0YARD"
+    ],
+
+    # === NÚMEROS PEQUEÑOS (PROBABLEMENTE TALLAS) ===
+    'size_number': [
+        r'^\d{1,2}$',           # "6", "7", "42" (números de 1-2 dígitos)
+        r'^\d+\.\d+$',          # "6.5", "7.5", "6.1" (tallas decimales)
+    ],
+
+    # === UNIDADES ESPECÍFICAS ===
+    'specific_units': [
+        r'^LLG$',               # Solo "LLG" (probablemente error OCR para "11G")
+        r'^G$',                 # Solo "G"
+        r'^KG$',                # Solo "KG"
+        r'^L$',                 # Solo "L"
+        r'^ML$',                # Solo "ML"
+        r'^CM$',                # Solo "CM"
+        r'^MM$',                # Solo "MM"
+    ],
+}
+
+# Prioridad 2: casos especiales con formato atípico (también sobre el texto original)
+SPECIAL_CASES = [
+    # === CONFUSIONES OCR ESPECÍFICAS ===
+    r'^\d+\.\s*LLG$',       # "6. LLG", "6.LLG" (probablemente "6.11G")
+    r'^\d+\s+LLG$',         # "6 LLG" (probablemente "6 11G")
+    r'^\d+\.\s*G$',         # "6. G", "6.G"
+    r'^\d+\s+G$',           # "6 G"
+    r'^\d+\.\s*KG$',        # "6. KG", "6.KG"
+    r'^\d+\s+KG$',          # "6 KG"
+
+    # === NÚMEROS CON UN SOLO DÍGITO DECIMAL (MUY PROBLEMÁTICOS) ===
+    r'^\d+\.\d$',           # "6.1", "7.5", "8.3" (sin unidad pero formato de medida)
+    r'^\d+\.\d[A-Z]*$',     # "6.1G", "7.5K", "8.3CM" etc.
+
+    # === PATRONES NUMÉRICOS QUE PARECEN MEDIDAS ===
+    r'^\d+\.\s*\d+$',       # "6. 11", "6.11" (sin unidad pero probablemente medida)
+    r'^\d+\.\s*LL$',        # "6. LL", "6.LL" (probablemente "6.11")
+    r'^\d+\.\s*ll$',        # "6. ll", "6.ll" (minúsculas)
+    r'^\d+\.\s*II$',        # "6. II", "6.II" (confusión con números romanos)
+
+    # === PATRONES DE UN SOLO DÍGITO DECIMAL MUY ESPECÍFICOS ===
+    r'^\d\.\d+[A-Z]*$',     # "6.1g", "7.2kg", "5.8cm" (un dígito antes del punto)
+    r'^\d{1,2}\.\d{1,2}[A-Z]*$',  # Hasta 2 dígitos antes y después del punto con unidad
+]
+
+# Prioridad 4: "6. llg" como error de OCR en un peso (búsqueda en el texto original)
+OCR_ERROR_WEIGHT_PATTERN = r'\d+\s*\.\s*ll'
+
+# Prioridad 5: número decimal sin unidad ("6.1", "7.25")
+SUSPICIOUS_DECIMAL_PATTERN = r'^\d+\.\d{1,2}$'
+
+# Descripción de cada tipo de coincidencia
+MATCH_REASONS = {
+    'problematic_measurement': 'Patrón problemático de medida con decimal (ej: 6.1g)',
+    'special_case': 'Caso especial de medida/peso con formato atípico o error OCR',
+    'ocr_error_weight': 'Formato que corresponde a error OCR en peso (ll en lugar de 11)',
+    'suspicious_decimal': 'Número decimal sospechoso sin unidad (probablemente medida)',
+}
+
+_SPACE_BEFORE_UNIT = re.compile(r'(\d)\s+([A-Z])')
+_SPACED_DECIMAL = re.compile(r'(\d)\s*\.\s*(\d)')
+_WHITESPACE = re.compile(r'\s+')
+
+def _build_matcher(entries):
+    """
+    Une los patrones en una alternancia con un grupo con nombre por patrón.
+
+    Args:
+        entries: Lista de (tipo, patrón) en orden de prioridad
+
+    Returns:
+        tuple: (regex compilada, {nombre de grupo: (prioridad, tipo, patrón)})
+    """
+    alternatives = []
+    lookup = {}
+    for priority, (match_type, pattern) in enumerate(entries):
+        # Los patrones no deben tener grupos propios para que lastgroup identifique la alternativa
+        assert re.compile(pattern).groups == 0, pattern
+        name = f"p{priority}"
+        alternatives.append(f"(?P<{name}>{pattern})")
+        lookup[name] = (priority, match_type, pattern)
+    return re.compile('|'.join(alternatives)), lookup
+
+# Prioridades 1, 2, 3 y 5 sobre el texto limpio, en una sola pasada
+_CLEAN_ENTRIES = ([('problematic_measurement', p) for p in PROBLEMATIC_PATTERNS] +
+                  [('special_case', p) for p in SPECIAL_CASES] +
+                  [(category, p) for category, patterns in DISCARD_PATTERNS.items() for p in patterns])
+_OCR_ERROR_PRIORITY = len(_CLEAN_ENTRIES)
+_CLEAN_ENTRIES.append(('suspicious_decimal', SUSPICIOUS_DECIMAL_PATTERN))
+_CLEAN_MATCHER, _CLEAN_LOOKUP = _build_matcher(_CLEAN_ENTRIES)
+
+# Los casos especiales también se prueban sobre el texto original en mayúsculas
+_SPECIAL_OFFSET = len(PROBLEMATIC_PATTERNS)
+_ORIGINAL_MATCHER, _ORIGINAL_LOOKUP = _build_matcher([('special_case', p) for p in SPECIAL_CASES])
+_OCR_ERROR_MATCHER = re.compile(OCR_ERROR_WEIGHT_PATTERN)
+
+def clean_measurement_text(text_original):
+    """Corrige 'll' → '11' y normaliza espacios, puntos y comas. Devuelve (corregido, limpio)."""
+    corrected_text = text_original
+    if 'll' in corrected_text.lower():
+        corrected_text = corrected_text.lower().replace('ll', '11')
+
+    text_clean = corrected_text.upper()
+    text_clean = _SPACE_BEFORE_UNIT.sub(r'\1\2', text_clean)
+    text_clean = _SPACED_DECIMAL.sub(r'\1.\2', text_clean)  # "6. 11" → "6.11"
+    text_clean = _WHITESPACE.sub('', text_clean)              # Eliminar espacios restantes
+    text_clean = text_clean.replace(',', '.')                  # "6,11g" → "6.11g"
+    return corrected_text, text_clean
+
+def _empty_result():
+    return {
+        'is_only_measurement': False,
+        'type': 'empty',
+        'reason': 'Texto vacío',
+        'matched_pattern': None
+    }
+
+def _result(is_only_measurement, match_type, pattern, text_original, text_clean, corrected_text):
+    if not is_only_measurement:
+        reason = 'No coincide con patrones de medidas/pesos únicamente'
+    else:
+        reason = MATCH_REASONS.get(match_type, f'Coincide con patrón de {match_type}')
+    return {
+        'is_only_measurement': is_only_measurement,
+        'type': match_type,
+        'reason': reason,
+        'matched_pattern': pattern,
+        'original_text': text_original,
+        'cleaned_text': text_clean,
+        'corrected_text': corrected_text
+    }
+
+def match_measurement(text, verbose=False):
+    """
+    Detecta si el texto es sólo una medida o un peso (ver is_measurements_or_weight_only_enhanced).
+
+    Args:
+        text: Texto extraído del rectángulo
+        verbose: Imprimir el detalle de la limpieza y del patrón encontrado
+
+    Returns:
+        dict: {'is_only_measurement', 'type', 'reason', 'matched_pattern', 'original_text',
+               'cleaned_text', 'corrected_text'}
+    """
+    if not text or len(text.strip()) == 0:
+        return _empty_result()
+
+    text_original = text.strip()
+    corrected_text, text_clean = clean_measurement_text(text_original)
+
+    best = None
+    match = _CLEAN_MATCHER.match(text_clean)
+    if match:
+        best = _CLEAN_LOOKUP[match.lastgroup]
+
+    # Un caso especial sobre el texto original gana si va antes en la lista
+    if best is None or best[0] > _SPECIAL_OFFSET:
+        match = _ORIGINAL_MATCHER.match(text_original.upper())
+        if match:
+            priority, match_type, pattern = _ORIGINAL_LOOKUP[match.lastgroup]
+            if best is None or _SPECIAL_OFFSET + priority < best[0]:
+                best = (_SPECIAL_OFFSET + priority, match_type, pattern)
+
+    # El error de OCR "6. llg" va antes que el decimal sospechoso
+    if (best is None or best[0] >= _OCR_ERROR_PRIORITY) and _OCR_ERROR_MATCHER.search(text_original.lower()):
+        best = (_OCR_ERROR_PRIORITY, 'ocr_error_weight', OCR_ERROR_WEIGHT_PATTERN)
+
+    if best is None:
+        result = _result(False, 'valid_content', None, text_original, text_clean, corrected_text)
+    else:
+        result = _result(True, best[1], best[2], text_original, text_clean, corrected_text)
+
+    if verbose:
+        print(f"   📝 Texto original: '{text_original}'")
+        if corrected_text != text_original:
+            print(f"   🔄 Corrección OCR: '{text_original}' → '{corrected_text}' (ll → 11)")
+        print(f"   🧹 Texto limpio final: '{text_clean}'")
+        if best is None:
+            print(f"   ✅ NO es medida/peso - texto válido para clasificación")
+        else:
+            print(f"   🎯 DETECTADO como {best[1]}: patrón {best[2]}")
+    return result
+
+def match_measurement_legacy(text):
+    """Bucle original, patrón a patrón, sin mensajes: referencia para comprobar la equivalencia."""
+    if not text or len(text.strip()) == 0:
+        return _empty_result()
+
+    text_original = text.strip()
+    corrected_text = text_original
+    if 'll' in corrected_text.lower():
+        corrected_text = corrected_text.lower().replace('ll', '11')
+    text_clean = corrected_text.upper()
+    text_clean = re.sub(r'(\d)\s+([A-Z])', r'\1\2', text_clean)
+    text_clean = re.sub(r'(\d)\s*\.\s*(\d)', r'\1.\2', text_clean)
+    text_clean = re.sub(r'\s+', '', text_clean)
+    text_clean = text_clean.replace(',', '.')
+
+    for pattern in PROBLEMATIC_PATTERNS:
+        if re.match(pattern, text_clean):
+            return _result(True, 'problematic_measurement', pattern, text_original, text_clean, corrected_text)
+    for pattern in SPECIAL_CASES:
+        if re.match(pattern, text_clean) or re.match(pattern, text_original.upper()):
+            return _result(True, 'special_case', pattern, text_original, text_clean, corrected_text)
+    for category, patterns in DISCARD_PATTERNS.items():
+        for pattern in patterns:
+            if re.match(pattern, text_clean):
+                return _result(True, category, pattern, text_original, text_clean, corrected_text)
+    if re.search(OCR_ERROR_WEIGHT_PATTERN, text_original.lower()):
+        return _result(True, 'ocr_error_weight', OCR_ERROR_WEIGHT_PATTERN, text_original, text_clean, corrected_text)
+    if re.match(SUSPICIOUS_DECIMAL_PATTERN, text_clean):
+        return _result(True, 'suspicious_decimal', SUSPICIOUS_DECIMAL_PATTERN, text_original, text_clean, corrected_text)
+    return _result(False, 'valid_content', None, text_original, text_clean, corrected_text)
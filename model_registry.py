@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Registro de modelos compartidos por todo el proceso.
+
+Los clasificadores de MachineLearning/ cargan configuración y modelos al construirse,
+así que crear uno por rectángulo hace que cada análisis pague la carga completa. Aquí
+cada modelo se construye una sola vez (de forma segura entre hilos) y se reutiliza;
+warm_up() los carga al arrancar e informa del tiempo y la memoria de cada uno, para
+que la latencia por rectángulo refleje sólo la inferencia.
+
+Los módulos de MachineLearning (y con ellos scikit-learn) sólo se importan al pedir el
+modelo; module_available() comprueba si existen sin importarlos. mark_startup() y
+startup_report() miden el arranque (imports, modelos listos, primera petición) desde
+que arrancó el proceso.
+"""
+
+import importlib
+import importlib.util
+import os
+import threading
+import time
+
+# Nombre del modelo -> (módulo, clase)
+MODEL_FACTORIES = {
+    'image_classifier': ('MachineLearning.classify_image', 'ImageCategoryClassifier'),
+    'jewelry_detector': ('MachineLearning.jewelry_category_detector', 'JewelryCategoryDetector'),
+    'category_predictor': ('MachineLearning.jewelry_category_predictor', 'JewelryCategoryPredictor'),
+    'enhanced_classifier': ('enhanced_classifier_with_categories', 'EnhancedJewelryClassifier'),
+}
+
+_instances = {}
+_errors = {}
+_load_stats = {}
+_registry_lock = threading.Lock()
+_model_locks = {name: threading.Lock() for name in MODEL_FACTORIES}
+
+def current_rss_mb():
+    """Memoria residente actual del proceso en MB (None si no se puede medir)."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # ru_maxrss es el pico (en KB en Linux, en bytes en macOS): sólo una aproximación
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return None
+
+def get_model(name):
+    """
+    Devuelve la instancia compartida del modelo, construyéndola la primera vez.
+    Si la carga falló, se vuelve a lanzar el mismo error sin reintentar la carga.
+    """
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    if name not in MODEL_FACTORIES:
+        raise KeyError(f"Modelo desconocido: {name}")
+
+    with _model_locks[name]:
+        # Otro hilo pudo cargarlo mientras esperábamos
+        if name in _instances:
+            return _instances[name]
+        if name in _errors:
+            raise _errors[name]
+
+        module_name, class_name = MODEL_FACTORIES[name]
+        rss_before = current_rss_mb()
+        start = time.time()
+        try:
+            module = importlib.import_module(module_name)
+            instance = getattr(module, class_name)()
+        except Exception as e:
+            with _registry_lock:
+                _errors[name] = e
+                _load_stats[name] = {'loaded': False, 'error': str(e)}
+            raise
+
+        rss_after = current_rss_mb()
+        with _registry_lock:
+            _instances[name] = instance
+            _load_stats[name] = {
+                'loaded': True,
+                'load_time': time.time() - start,
+                'memory_mb': (rss_after - rss_before) if rss_before is not None and rss_after is not None else None
+            }
+        return instance
+
+def is_loaded(name):
+    return name in _instances
+
+def warm_up(names=None):
+    """
+    Carga los modelos indicados (todos por defecto) e imprime un informe.
+
+    Returns:
+        dict: Estadísticas de carga por modelo (ver load_report)
+    """
+    print("🔥 Precargando modelos...")
+    for name in names or MODEL_FACTORIES:
+        try:
+            get_model(name)
+        except Exception as e:
+            print(f"  ⚠️ {name} no disponible: {e}")
+
+    report = load_report()
+    for name, stats in report.items():
+        if stats['loaded']:
+            memory = f"{stats['memory_mb']:+.1f} MB" if stats['memory_mb'] is not None else "memoria n/d"
+            print(f"  ✅ {name}: {stats['load_time']:.2f} s, {memory}")
+    mark_startup('models_ready')
+    return report
+
+def load_report():
+    """Tiempo de carga y memoria (variación del RSS) de cada modelo cargado o fallido."""
+    with _registry_lock:
+        return {name: dict(stats) for name, stats in _load_stats.items()}
+
+def module_available(module_name):
+    """True si el módulo puede importarse, sin llegar a importarlo (salvo sus paquetes padre)."""
+    try:
+        return importlib.util.find_spec(module_name) is not None
+    except (ImportError, ValueError):
+        return False
+
+def process_start_time():
+    """Instante (time.time()) en que arrancó el proceso, o None si no se puede saber."""
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            # El nombre del ejecutable va entre paréntesis y puede contener espacios
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/stat', 'r') as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith('btime'))
+        return boot_time + int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, StopIteration, AttributeError):
+        return None
+
+_startup_origin = process_start_time() or time.time()
+_startup_marks = {}
+
+def mark_startup(stage):
+    """Registra (sólo la primera vez) cuántos segundos han pasado desde el arranque hasta 'stage'."""
+    with _registry_lock:
+        _startup_marks.setdefault(stage, time.time() - _startup_origin)
+
+def startup_report():
+    """Segundos desde el arranque hasta cada etapa marcada, carga de modelos y memoria actual."""
+    with _registry_lock:
+        marks = dict(_startup_marks)
+    return {
+        'stages': dict(sorted(marks.items(), key=lambda item: item[1])),
+        'models': load_report(),
+        'rss_mb': current_rss_mb()
+    }
+
+def print_startup_report():
+    report = startup_report()
+    print("⏱️ Arranque:")
+    for stage, seconds in report['stages'].items():
+        print(f"  • {stage}: {seconds:.2f} s")
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Caché persistente de resultados de OCR direccionada por contenido.
+
+Un mismo recorte de código se lee varias veces por hoja (clasificación, pasada de
+categorías, emparejamiento) y de nuevo cada vez que se reprocesa. La clave es un hash
+de los píxeles del recorte (más forma y tipo), de la configuración de Tesseract y del
+motor que lee (tesserocr o pytesseract, con su versión de Tesseract), así que cualquier
+lectura repetida de los mismos píxeles con la misma configuración y el mismo motor se
+resuelve sin OCR. Se guarda en SQLite (sobrevive a reinicios y se comparte entre
+procesos), con expulsión LRU por número de entradas y contadores de aciertos/fallos.
+Los aciertos no escriben en cada lectura: el último uso se actualiza por lotes.
+
+Variables de entorno: OCR_CACHE_PATH (ruta del archivo; por defecto en el directorio
+de caché del usuario, ver default_cache_path), OCR_CACHE_MAX_ENTRIES y
+OCR_CACHE_DISABLED=1 para no usar la caché.
+"""
+
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+APP_NAME = 'images_management'
+CACHE_FILE = 'ocr_cache.sqlite'
+DEFAULT_MAX_ENTRIES = 100000
+
+PATH_ENV = 'OCR_CACHE_PATH'
+MAX_ENTRIES_ENV = 'OCR_CACHE_MAX_ENTRIES'
+DISABLE_ENV = 'OCR_CACHE_DISABLED'
+
+# Cada cuántas inserciones se comprueba el límite de entradas
+EVICTION_INTERVAL = 100
+
+# Aciertos acumulados antes de escribir su último uso (una transacción por lote)
+TOUCH_BATCH = 100
+
+def default_cache_path():
+    """Archivo de la caché en el directorio de caché del usuario ($XDG_CACHE_HOME o ~/.cache)."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, APP_NAME, CACHE_FILE)
+
+def cache_key(image, config, method='string', engine=''):
+    """Hash SHA-1 de los píxeles, la forma, el tipo, la configuración, el método y el motor de OCR."""
+    image = np.ascontiguousarray(image)
+    digest = hashlib.sha1()
+    digest.update(f"{engine}|{method}|{config}|{image.shape}|{image.dtype.str}|".encode('utf-8'))
+    digest.update(image.data)
+    return digest.hexdigest()
+
+class OCRCache:
+    """Caché LRU de OCR en SQLite, segura entre hilos y procesos."""
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path or default_cache_path()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self.inserts_since_eviction = 0
+        self.pending_touches = {}
+        self.hits_since_write = 0
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS ocr_cache (
+                                 key TEXT PRIMARY KEY,
+                                 result TEXT NOT NULL,
+                                 last_used REAL NOT NULL)''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS ocr_cache_last_used ON ocr_cache (last_used)')
+        self.conn.commit()
+
+    def get(self, key):
+        """
+        Resultado guardado para la clave o None. El último uso se anota en memoria y se
+        escribe cada TOUCH_BATCH aciertos (o en la siguiente inserción o flush()).
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT result FROM ocr_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self.pending_touches[key] = time.time()
+            self.hits_since_write += 1
+            if self.hits_since_write >= TOUCH_BATCH:
+                self._write_touches()
+                self.conn.commit()
+            self.stats['hits'] += 1
+            return row[0]
+
+    def _write_touches(self):
+        self.hits_since_write = 0
+        if self.pending_touches:
+            self.conn.executemany('UPDATE ocr_cache SET last_used = ? WHERE key = ?',
+                                  [(last_used, key) for key, last_used in self.pending_touches.items()])
+            self.pending_touches = {}
+
+    def flush(self):
+        """Escribe los últimos usos pendientes."""
+        with self.lock:
+            self._write_touches()
+            self.conn.commit()
+
+    def put(self, key, result):
+        with self.lock:
+            self._write_touches()
+            self.conn.execute('INSERT OR REPLACE INTO ocr_cache (key, result, last_used) VALUES (?, ?, ?)',
+                              (key, result, time.time()))
+            self.stats['stores'] += 1
+            self.inserts_since_eviction += 1
+            if self.inserts_since_eviction >= EVICTION_INTERVAL:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Borra las entradas usadas hace más tiempo por encima de max_entries."""
+        self.inserts_since_eviction = 0
+        count = self.conn.execute('SELECT COUNT(*) FROM ocr_cache').fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute('''DELETE FROM ocr_cache WHERE key IN (
+                                     SELECT key FROM ocr_cache ORDER BY last_used LIMIT ?)''', (excess,))
+            self.stats['evictions'] += excess
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM ocr_cache').fetchone()[0]
+
+    def clear(self):
+        with self.lock:
+            self.pending_touches = {}
+            self.conn.execute('DELETE FROM ocr_cache')
+            self.conn.commit()
+
+    def report(self):
+        """Aciertos, fallos, inserciones, expulsiones y tasa de aciertos."""
+        with self.lock:
+            report = dict(self.stats)
+        lookups = report['hits'] + report['misses']
+        report['hit_rate'] = report['hits'] / lookups if lookups else 0.0
+        return report
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def cache_enabled():
+    return os.environ.get(DISABLE_ENV, '') not in ('1', 'true', 'yes')
+
+def get_ocr_cache():
+    """Caché compartida del proceso (se abre la primera vez)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = OCRCache(os.environ.get(PATH_ENV) or default_cache_path(),
+                              int(os.environ.get(MAX_ENTRIES_ENV, DEFAULT_MAX_ENTRIES)))
+            atexit.register(_cache.flush)
+        return _cache
+
+def cached_ocr(image, config, compute, method='string', engine=''):
+    """
+    Devuelve el resultado de OCR guardado para (image, config, engine) o lo calcula
+    con compute() y lo guarda. engine identifica el motor y su versión (ver
+    ocr_service.engine_id), para no mezclar lecturas de motores distintos.
+    """
+    if not cache_enabled():
+        return compute()
+    cache = get_ocr_cache()
+    key = cache_key(image, config, method, engine)
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.put(key, result)
+    return result
+
+def cache_report():
+    if _cache is None:
+        return {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'hit_rate': 0.0}
+    return _cache.report()
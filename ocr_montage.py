@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+OCR por mosaico: todas las celdas de código de una hoja en una sola llamada a Tesseract.
+
+Las celdas de código son imágenes pequeñas de una sola línea, así que el coste fijo de
+cada llamada de OCR pesa más que el reconocimiento. Aquí los recortes se apilan en
+escala de grises en una imagen alta, cada uno en su propia franja separada por un
+hueco blanco, y se ejecuta image_to_data una vez (o una por cada MAX_MONTAGE_HEIGHT
+píxeles). Cada palabra reconocida se asigna al recorte cuya franja la contiene; los
+recortes con palabras que cruzan el límite de su franja, o sin ninguna palabra, se
+consideran ambiguos y se leen por separado.
+
+Con normalize=True cada recorte se recorta a su zona de texto y se reescala antes de
+apilarlo (ver ocr_normalizer.py), lo que además reduce la altura del mosaico.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from ocr_normalizer import normalize_for_ocr, record_normalization
+from ocr_service import image_to_data, ocr_result, recognize
+
+# Hueco blanco entre recortes y margen alrededor del mosaico (píxeles)
+MONTAGE_GAP = 32
+MONTAGE_MARGIN = 16
+
+# Altura máxima de un mosaico (Tesseract admite hasta 32767 píxeles por lado)
+MAX_MONTAGE_HEIGHT = 30000
+
+def to_gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+def build_montages(crops, gap=MONTAGE_GAP, margin=MONTAGE_MARGIN, max_height=MAX_MONTAGE_HEIGHT):
+    """
+    Apila los recortes en uno o varios mosaicos.
+
+    Returns:
+        list: [(mosaico en grises, [(índice del recorte, y inicial, y final)])]
+    """
+    montages = []
+    group, height = [], margin
+    for index, crop in enumerate(crops):
+        crop_height = crop.shape[0]
+        if group and height + crop_height + margin > max_height:
+            montages.append(group)
+            group, height = [], margin
+        group.append(index)
+        height += crop_height + gap
+
+    if group:
+        montages.append(group)
+
+    result = []
+    for group in montages:
+        width = max(crops[i].shape[1] for i in group) + 2 * margin
+        total = margin * 2 + sum(crops[i].shape[0] for i in group) + gap * (len(group) - 1)
+        montage = np.full((total, width), 255, np.uint8)
+        bands = []
+        y = margin
+        for i in group:
+            gray = to_gray(crops[i])
+            h, w = gray.shape[:2]
+            montage[y:y + h, margin:margin + w] = gray
+            bands.append((i, y, y + h))
+            y += h + gap
+        result.append((montage, bands))
+    return result
+
+def assign_words(words, bands, tolerance):
+    """
+    Reparte las palabras entre las franjas.
+
+    Returns:
+        tuple: ({índice: [palabras]}, conjunto de índices ambiguos)
+    """
+    assigned = {index: [] for index, _, _ in bands}
+    ambiguous = set()
+    for word in words:
+        top, bottom = word['top'], word['top'] + word['height']
+        center = (top + bottom) / 2
+        owner = None
+        for index, y0, y1 in bands:
+            if y0 - tolerance <= center <= y1 + tolerance:
+                owner = index
+                break
+        if owner is None:
+            # Palabra en el hueco entre dos recortes: los dos vecinos quedan en duda
+            for index, y0, y1 in bands:
+                if y1 <= center <= y1 + 2 * tolerance + 1 or y0 - 2 * tolerance - 1 <= center <= y0:
+                    ambiguous.add(index)
+            continue
+        _, y0, y1 = next(band for band in bands if band[0] == owner)
+        if top < y0 - tolerance or bottom > y1 + tolerance:
+            ambiguous.add(owner)
+        assigned[owner].append(word)
+    return assigned, ambiguous
+
+def montage_ocr(crops, config, gap=MONTAGE_GAP, fallback_empty=True, normalize=True):
+    """
+    Lee todos los recortes con el mínimo de llamadas a Tesseract.
+
+    Args:
+        crops: Lista de recortes (BGR o grises); None se devuelve como texto vacío
+        config: Configuración de Tesseract (la misma que se usaría recorte a recorte)
+        gap: Hueco blanco entre recortes en el mosaico
+        fallback_empty: Leer por separado los recortes sin ninguna palabra en el mosaico
+        normalize: Normalizar cada recorte antes del OCR (ver ocr_normalizer.py)
+
+    Returns:
+        dict: {'texts': texto por recorte, 'results': resultado estructurado por recorte
+               (ver ocr_service.ocr_result), 'montage_calls', 'fallback': índices leídos
+               por separado, 'elapsed'}
+    """
+    start = time.time()
+    valid = [i for i, crop in enumerate(crops) if crop is not None and crop.size]
+    results = [ocr_result([]) for _ in crops]
+    fallback = set()
+
+    inputs = [crops[i] for i in valid]
+    infos = {}
+    if normalize:
+        normalized = [normalize_for_ocr(crop) for crop in inputs]
+        inputs = [image for image, _ in normalized]
+        infos = {valid[i]: info for i, (_, info) in enumerate(normalized)}
+
+    montages = build_montages(inputs, gap)
+    for montage, bands in montages:
+        # Índices del mosaico → índices originales
+        bands = [(valid[i], y0, y1) for i, y0, y1 in bands]
+        ocr_start = time.time()
+        words = image_to_data(montage, config)
+        ocr_time = time.time() - ocr_start
+        # El tiempo del mosaico se reparte entre sus recortes según sus píxeles
+        for index, _, _ in bands:
+            if index in infos:
+                record_normalization(infos[index], ocr_time * infos[index]['pixels_after'] / montage.size)
+        assigned, ambiguous = assign_words(words, bands, gap // 2)
+        for index, words in assigned.items():
+            if index in ambiguous or (fallback_empty and not words):
+                fallback.add(index)
+            else:
+                results[index] = ocr_result(words)
+
+    for index in sorted(fallback):
+        results[index] = recognize(crops[index], config, normalize=normalize)
+
+    return {
+        'texts': [result['text'] for result in results],
+        'results': results,
+        'montage_calls': len(montages),
+        'fallback': sorted(fallback),
+        'elapsed': time.time() - start
+    }
+
+def report_montage(result, total):
+    """Imprime cuántas llamadas se hicieron frente a una por recorte."""
+    calls = result['montage_calls'] + len(result['fallback'])
+    print(f"🧩 OCR por mosaico: {calls} llamadas en lugar de {total} "
+          f"({len(result['fallback'])} recortes leídos por separado) en {result['elapsed']:.2f} s")
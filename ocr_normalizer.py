@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Normalización de los recortes antes del OCR: recorte a la zona de texto y escala.
+
+Los recortes de código llegan a Tesseract con el tamaño de la celda de la hoja: a
+menudo celdas grandes con un código pequeño y mucho margen blanco. El tiempo de
+Tesseract crece con el número de píxeles y la precisión empeora cuando la altura de
+los caracteres se aleja de su rango ideal. Aquí cada recorte se reduce a la caja de
+la tinta (ignorando las líneas del borde de la celda y las motas sueltas), se reescala
+para que la altura típica de los caracteres sea TARGET_GLYPH_HEIGHT y se le añade un
+pequeño margen. Funciona con texto oscuro sobre claro y con texto claro sobre oscuro
+(como la variante invertida de classify_rectangles) y conserva la polaridad.
+
+normalizer_report() resume los píxeles antes/después y una estimación del tiempo de
+OCR ahorrado (suponiendo que el tiempo de Tesseract es proporcional a los píxeles).
+"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Altura objetivo de los caracteres (píxeles) y margen alrededor del texto
+TARGET_GLYPH_HEIGHT = 32
+PADDING = 10
+
+# No se reescala si la altura ya está dentro de este margen relativo, ni más allá de estos límites
+SCALE_TOLERANCE = 0.15
+MIN_SCALE = 0.25
+MAX_SCALE = 4.0
+
+# Filas/columnas con más de esta fracción de tinta se consideran líneas del borde de la celda
+BORDER_LINE_FRACTION = 0.6
+
+# Componentes más bajos que esto son ruido, no caracteres
+MIN_GLYPH_HEIGHT = 4
+
+_stats = {'images': 0, 'pixels_before': 0, 'pixels_after': 0, 'normalize_time': 0.0,
+          'ocr_time': 0.0, 'estimated_saved': 0.0}
+_stats_lock = threading.Lock()
+
+def text_mask(gray):
+    """Máscara de tinta: oscuro sobre claro o claro sobre oscuro según el fondo (Otsu)."""
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    # Si la "tinta" ocupa más de la mitad, el fondo es oscuro: invertir
+    if np.count_nonzero(mask) > mask.size / 2:
+        mask = cv2.bitwise_not(mask)
+    return mask
+
+def ink_bounds(mask):
+    """
+    Caja (x0, y0, x1, y1) de la tinta sin contar las líneas del borde de la celda, o
+    None si no hay tinta.
+    """
+    height, width = mask.shape
+    ink = mask > 0
+    rows = np.count_nonzero(ink, axis=1)
+    cols = np.count_nonzero(ink, axis=0)
+    line_rows = rows > BORDER_LINE_FRACTION * width
+    line_cols = cols > BORDER_LINE_FRACTION * height
+    if line_rows.any() or line_cols.any():
+        ink = ink.copy()
+        ink[line_rows, :] = False
+        ink[:, line_cols] = False
+        rows = np.count_nonzero(ink, axis=1)
+        cols = np.count_nonzero(ink, axis=0)
+    # Al menos 2 píxeles para no expandir la caja por motas aisladas
+    ys = np.flatnonzero(rows >= 2)
+    xs = np.flatnonzero(cols >= 2)
+    if not len(ys) or not len(xs):
+        return None
+    return int(xs[0]), int(ys[0]), int(xs[-1]) + 1, int(ys[-1]) + 1
+
+def glyph_height(mask):
+    """Mediana de la altura de los componentes conexos que parecen caracteres (o None)."""
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    heights = stats[1:count, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:count, cv2.CC_STAT_WIDTH]
+    # Fuera el ruido y los trazos largos (restos de líneas o subrayados)
+    heights = heights[(heights >= MIN_GLYPH_HEIGHT) & (widths < BORDER_LINE_FRACTION * mask.shape[1])]
+    return float(np.median(heights)) if len(heights) else None
+
+def normalize_for_ocr(image, target_glyph_height=TARGET_GLYPH_HEIGHT, padding=PADDING):
+    """
+    Recorta el recorte a la zona de texto y lo reescala para el OCR.
+
+    Args:
+        image: Recorte BGR o en grises
+        target_glyph_height: Altura objetivo de los caracteres en píxeles
+        padding: Margen (del color del fondo) alrededor del texto
+
+    Returns:
+        tuple: (imagen en grises normalizada, {'pixels_before', 'pixels_after', 'scale',
+               'roi', 'elapsed'})
+    """
+    start = time.time()
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    mask = text_mask(gray)
+    bounds = ink_bounds(mask)
+    info = {'pixels_before': int(gray.size), 'pixels_after': int(gray.size), 'scale': 1.0, 'roi': None}
+    if bounds is None:
+        info['elapsed'] = time.time() - start
+        return gray, info
+
+    x0, y0, x1, y1 = bounds
+    roi = gray[y0:y1, x0:x1]
+    scale = 1.0
+    height = glyph_height(mask[y0:y1, x0:x1])
+    if height:
+        scale = min(MAX_SCALE, max(MIN_SCALE, target_glyph_height / height))
+        if abs(scale - 1.0) <= SCALE_TOLERANCE:
+            scale = 1.0
+    if scale != 1.0:
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+        roi = cv2.resize(roi, None, fx=scale, fy=scale, interpolation=interpolation)
+
+    # Margen con el color del fondo (el del exterior de la máscara de tinta)
+    background = int(np.median(gray[mask == 0])) if np.any(mask == 0) else 255
+    normalized = cv2.copyMakeBorder(roi, padding, padding, padding, padding,
+                                    cv2.BORDER_CONSTANT, value=background)
+    info.update(pixels_after=int(normalized.size), scale=scale, roi=bounds, elapsed=time.time() - start)
+    return normalized, info
+
+def record_normalization(info, ocr_time):
+    """
+    Acumula las estadísticas de una llamada de OCR normalizada. El ahorro estimado es el
+    tiempo de OCR escalado a los píxeles originales menos el real y el de normalizar.
+    """
+    ratio = info['pixels_before'] / info['pixels_after'] if info['pixels_after'] else 1.0
+    with _stats_lock:
+        _stats['images'] += 1
+        _stats['pixels_before'] += info['pixels_before']
+        _stats['pixels_after'] += info['pixels_after']
+        _stats['normalize_time'] += info['elapsed']
+        _stats['ocr_time'] += ocr_time
+        _stats['estimated_saved'] += ocr_time * (ratio - 1) - info['elapsed']
+
+def normalizer_report():
+    """Imágenes normalizadas, píxeles antes/después, fracción ahorrada y tiempo ahorrado estimado."""
+    with _stats_lock:
+        report = dict(_stats)
+    before = report['pixels_before']
+    report['pixel_reduction'] = 1 - report['pixels_after'] / before if before else 0.0
+    return report
+
+def print_normalizer_report():
+    report = normalizer_report()
+    if report['images']:
+        print(f"📐 Normalización OCR: {report['images']} imágenes, "
+              f"{report['pixels_before'] / 1e6:.1f} → {report['pixels_after'] / 1e6:.1f} Mpx "
+              f"({report['pixel_reduction']:.0%} menos), ahorro estimado {report['estimated_saved']:.2f} s")
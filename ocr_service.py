@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+Servicio de OCR con procesos de trabajo persistentes.
+
+pytesseract.image_to_string lanza un proceso tesseract por llamada, escribe la imagen
+en un archivo temporal y vuelve a cargar los datos del idioma: en recortes pequeños
+ese coste fijo domina. Aquí un grupo de procesos de larga duración mantiene el motor
+cargado (tesserocr si está instalado, con un motor por configuración) y recibe los
+arrays de NumPy en memoria. Cada llamada admite su propia configuración (--psm, -l,
+-c tessedit_char_whitelist=...), tiene tiempo límite y, si un proceso se cuelga o
+muere, se reemplaza por otro.
+
+Sin tesserocr no se arrancan procesos de trabajo: pytesseract lanza tesseract en cada
+llamada de todos modos, y pasar por otro proceso sólo añadiría la comunicación entre
+procesos. En ese caso, o con OCR_SERVICE_DISABLED=1, se llama a pytesseract
+directamente. Toda llamada tiene tiempo límite (DEFAULT_TIMEOUT si no se indica).
+"""
+
+import atexit
+import json
+import multiprocessing
+import os
+import queue
+import shlex
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from ocr_cache import cached_ocr
+from ocr_normalizer import normalize_for_ocr, record_normalization
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+try:
+    import pytesseract
+    PYTESSERACT_AVAILABLE = True
+except ImportError:
+    PYTESSERACT_AVAILABLE = False
+
+# Variables de entorno: desactivar el servicio y número de procesos de trabajo
+DISABLE_ENV = 'OCR_SERVICE_DISABLED'
+WORKERS_ENV = 'OCR_SERVICE_WORKERS'
+
+# Tiempo máximo por llamada (segundos) y reintentos si el proceso muere
+DEFAULT_TIMEOUT = 30
+MAX_RETRIES = 1
+
+# Confianza media de OCR (0-100) por debajo de la cual un código se vuelve a leer y, si
+# sigue por debajo, se marca para revisión manual (ver main.py)
+CODE_REVIEW_CONFIDENCE = 70
+
+# Un código leído con al menos esta confianza media, y sin ningún carácter por debajo de
+# CODE_REVIEW_CONFIDENCE, se acepta sin probar más variantes del recorte
+CODE_ACCEPT_CONFIDENCE = 85
+
+# Marca que shutdown() deja en la cola de procesos libres para despertar a quien espera
+_CLOSED = object()
+
+class OCRTimeoutError(TimeoutError):
+    """La llamada de OCR superó el tiempo límite (el proceso se reinicia)."""
+
+def parse_tesseract_config(config):
+    """
+    Traduce una cadena de configuración de pytesseract a sus partes.
+
+    Returns:
+        dict: {'psm': int o None, 'oem': int o None, 'lang': str, 'variables': {nombre: valor}}
+    """
+    parsed = {'psm': None, 'oem': None, 'lang': 'eng', 'variables': {}}
+    tokens = shlex.split(config or '')
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        value = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token == '--psm' and value is not None:
+            parsed['psm'] = int(value)
+            i += 1
+        elif token == '--oem' and value is not None:
+            parsed['oem'] = int(value)
+            i += 1
+        elif token == '-l' and value is not None:
+            parsed['lang'] = value
+            i += 1
+        elif token == '-c' and value is not None and '=' in value:
+            name, variable_value = value.split('=', 1)
+            parsed['variables'][name] = variable_value
+            i += 1
+        i += 1
+    return parsed
+
+class _TesserocrEngine:
+    """Motores tesserocr ya cargados, uno por configuración."""
+
+    def __init__(self):
+        self.apis = {}
+
+    def api_for(self, config):
+        if config not in self.apis:
+            parsed = parse_tesseract_config(config)
+            options = {'lang': parsed['lang']}
+            if parsed['psm'] is not None:
+                options['psm'] = parsed['psm']
+            if parsed['oem'] is not None:
+                options['oem'] = parsed['oem']
+            api = tesserocr.PyTessBaseAPI(**options)
+            for name, value in parsed['variables'].items():
+                api.SetVariable(name, value)
+            self.apis[config] = api
+        return self.apis[config]
+
+    def _set_image(self, image, config):
+        api = self.api_for(config)
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+        return api
+
+    def image_to_string(self, image, config):
+        return self._set_image(image, config).GetUTF8Text()
+
+    def image_to_data(self, image, config):
+        api = self._set_image(image, config)
+        api.Recognize()
+        iterator = api.GetIterator()
+        words = []
+        if iterator is None:
+            return words
+        # Se recorre por símbolos para tener también la confianza de cada carácter
+        word_level, symbol_level = tesserocr.RIL.WORD, tesserocr.RIL.SYMBOL
+        line = 0
+        word = None
+        for symbol in tesserocr.iterate_level(iterator, symbol_level):
+            if symbol.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                line += 1
+            if symbol.IsAtBeginningOf(word_level):
+                x1, y1, x2, y2 = symbol.BoundingBox(word_level)
+                word = {'text': symbol.GetUTF8Text(word_level) or '', 'conf': float(symbol.Confidence(word_level)),
+                        'left': x1, 'top': y1, 'width': x2 - x1, 'height': y2 - y1, 'line': [0, 0, line],
+                        'char_conf': []}
+                words.append(word)
+            if word is not None:
+                word['char_conf'].append(float(symbol.Confidence(symbol_level)))
+        return [word for word in words if word['text'].strip()]
+
+class _PytesseractEngine:
+    """Alternativa sin tesserocr: un proceso tesseract por llamada, dentro del proceso de trabajo."""
+
+    def image_to_string(self, image, config):
+        return pytesseract.image_to_string(image, config=config)
+
+    def image_to_data(self, image, config):
+        return pytesseract_words(image, config)
+
+def pytesseract_words(image, config, timeout=0):
+    """Palabras de pytesseract.image_to_data en el formato de image_to_data."""
+    data = pytesseract.image_to_data(image, config=config, timeout=timeout, output_type=pytesseract.Output.DICT)
+    words = []
+    for i, text in enumerate(data['text']):
+        if int(data['level'][i]) != 5 or not text or not text.strip():
+            continue
+        words.append({'text': text, 'conf': float(data['conf'][i]),
+                      'left': int(data['left'][i]), 'top': int(data['top'][i]),
+                      'width': int(data['width'][i]), 'height': int(data['height'][i]),
+                      'line': [int(data['block_num'][i]), int(data['par_num'][i]), int(data['line_num'][i])]})
+    return words
+
+def _worker_main(conn):
+    """
+    Bucle del proceso de trabajo: recibe (método, imagen, config) y devuelve ('ok', resultado)
+    o ('error', mensaje). Métodos: 'string' (texto) y 'data' (palabras con posición y confianza).
+    """
+    os.environ[DISABLE_ENV] = '1'
+    engine = _TesserocrEngine() if TESSEROCR_AVAILABLE else _PytesseractEngine()
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if request is None:
+            break
+        method, image, config = request
+        try:
+            if method == 'data':
+                conn.send(('ok', engine.image_to_data(image, config)))
+            else:
+                conn.send(('ok', engine.image_to_string(image, config)))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+    conn.close()
+
+class _Worker:
+    """Un proceso de trabajo y su extremo de la tubería."""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self, force=False):
+        try:
+            if not force:
+                self.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        if force or self.process.is_alive():
+            self.process.join(0 if force else 1)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(1)
+        self.conn.close()
+
+class OCRService:
+    """Grupo de procesos de OCR persistentes, seguro entre hilos."""
+
+    def __init__(self, workers=None, timeout=DEFAULT_TIMEOUT):
+        self.size = workers or int(os.environ.get(WORKERS_ENV, 0)) or min(4, os.cpu_count() or 1)
+        # Sin límite, un proceso colgado bloquearía la llamada para siempre
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self.context = multiprocessing.get_context('spawn')
+        self.idle = queue.Queue()
+        self.workers = []
+        self.lock = threading.Lock()
+        self.started = False
+        self.closed = False
+        self.stats = {'calls': 0, 'restarts': 0, 'timeouts': 0, 'time': 0.0}
+
+    def start(self):
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("El servicio OCR está cerrado")
+            if self.started:
+                return
+            start = time.time()
+            for _ in range(self.size):
+                worker = _Worker(self.context)
+                self.workers.append(worker)
+                self.idle.put(worker)
+            self.started = True
+        engine = 'tesserocr' if TESSEROCR_AVAILABLE else 'pytesseract'
+        print(f"🔤 Servicio OCR: {self.size} procesos ({engine}) en {time.time() - start:.2f} s")
+
+    def _replace(self, worker):
+        """Sustituye un proceso colgado o muerto por uno nuevo."""
+        worker.stop(force=True)
+        with self.lock:
+            # shutdown() pudo vaciar la lista mientras esta llamada esperaba
+            if self.closed or worker not in self.workers:
+                raise RuntimeError("El servicio OCR está cerrado")
+            replacement = _Worker(self.context)
+            self.workers[self.workers.index(worker)] = replacement
+            self.stats['restarts'] += 1
+        return replacement
+
+    def image_to_string(self, image, config='', timeout=None):
+        return self.ocr('string', image, config, timeout)
+
+    def image_to_data(self, image, config='', timeout=None):
+        return self.ocr('data', image, config, timeout)
+
+    def ocr(self, method, image, config='', timeout=None):
+        """
+        OCR de un array de NumPy (gris o BGR) con la configuración de pytesseract indicada.
+        method: 'string' devuelve el texto; 'data', la lista de palabras (ver image_to_data).
+
+        Raises:
+            OCRTimeoutError: si se supera el tiempo límite
+            RuntimeError: si el motor de OCR falla en el proceso de trabajo o el servicio
+                          se cierra (también mientras se espera un proceso libre)
+        """
+        if not self.started:
+            self.start()
+        timeout = timeout or self.timeout
+        image = np.ascontiguousarray(image)
+
+        worker = self.idle.get()
+        if worker is _CLOSED:
+            # Devolver la marca para despertar al siguiente que espera
+            self.idle.put(_CLOSED)
+            raise RuntimeError("El servicio OCR está cerrado")
+        start = time.time()
+        try:
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    worker.conn.send((method, image, config))
+                    if not worker.conn.poll(timeout):
+                        with self.lock:
+                            self.stats['timeouts'] += 1
+                        worker = self._replace(worker)
+                        raise OCRTimeoutError(f"OCR sin respuesta tras {timeout} s")
+                    status, result = worker.conn.recv()
+                    break
+                except OCRTimeoutError:
+                    raise
+                except (EOFError, OSError):
+                    # El proceso murió: se reemplaza y se reintenta
+                    worker = self._replace(worker)
+                    if attempt == MAX_RETRIES:
+                        raise RuntimeError("El proceso de OCR terminó inesperadamente")
+        finally:
+            with self.lock:
+                # Tras el cierre el proceso ya está parado: no se devuelve a la cola
+                if not self.closed:
+                    self.idle.put(worker)
+                self.stats['calls'] += 1
+                self.stats['time'] += time.time() - start
+
+        if status == 'error':
+            raise RuntimeError(result)
+        return result
+
+    def shutdown(self):
+        """
+        Para los procesos. Las llamadas que esperan un proceso libre, y las posteriores,
+        fallan con RuntimeError.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            workers, self.workers = self.workers, []
+            self.closed = True
+            self.started = False
+            # Vaciar los procesos libres y dejar la marca de cierre en la misma cola
+            while True:
+                try:
+                    self.idle.get_nowait()
+                except queue.Empty:
+                    break
+            self.idle.put(_CLOSED)
+        for worker in workers:
+            worker.stop()
+
+_service = None
+_service_lock = threading.Lock()
+
+def service_enabled():
+    """El servicio sólo compensa con tesserocr (ver la cabecera del módulo)."""
+    return TESSEROCR_AVAILABLE and os.environ.get(DISABLE_ENV, '') not in ('1', 'true', 'yes')
+
+_engine_ids = {}
+
+def engine_id():
+    """
+    Motor que resuelve las llamadas y versión de Tesseract, p. ej. 'tesserocr 5.3.0' o
+    'pytesseract 4.1.1' (forma parte de la clave de la caché de OCR).
+    """
+    use_tesserocr = service_enabled()
+    if use_tesserocr not in _engine_ids:
+        try:
+            if use_tesserocr:
+                version = tesserocr.tesseract_version().split()[1]
+            else:
+                version = str(pytesseract.get_tesseract_version())
+        except Exception:
+            version = 'desconocida'
+        _engine_ids[use_tesserocr] = f"{'tesserocr' if use_tesserocr else 'pytesseract'} {version}"
+    return _engine_ids[use_tesserocr]
+
+def get_ocr_service():
+    """Servicio compartido del proceso (se crea la primera vez)."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = OCRService()
+            atexit.register(_service.shutdown)
+        return _service
+
+def _with_normalization(image, normalize, run):
+    """
+    Ejecuta run(imagen) sobre la imagen normalizada (ver ocr_normalizer.py) si se pide,
+    acumulando los píxeles antes/después y el tiempo de OCR.
+    """
+    if not normalize:
+        return run(image)
+    normalized, info = normalize_for_ocr(image)
+    start = time.time()
+    result = run(normalized)
+    record_normalization(info, time.time() - start)
+    return result
+
+def image_to_string(image, config='', timeout=None, normalize=False):
+    """
+    Sustituto de pytesseract.image_to_string para arrays de NumPy: consulta primero la
+    caché de OCR (ver ocr_cache.py) y, si no está, usa el servicio de procesos
+    persistentes salvo que esté desactivado. Con normalize=True la imagen se recorta a
+    la zona de texto y se reescala antes (ver ocr_normalizer.py).
+    """
+    return _with_normalization(image, normalize, lambda image: cached_ocr(
+        image, config, lambda: _uncached_ocr('string', image, config, timeout), engine=engine_id()))
+
+def image_to_data(image, config='', timeout=None, normalize=False):
+    """
+    Palabras reconocidas con su caja y confianza, como pytesseract.image_to_data (TSV)
+    pero sólo con las palabras no vacías.
+
+    Returns:
+        list: [{'text', 'conf', 'left', 'top', 'width', 'height', 'line'}], donde 'line'
+              es [bloque, párrafo, línea] e identifica la línea de texto de la palabra.
+              Con tesserocr cada palabra incluye además 'char_conf' (confianza por carácter).
+              Con normalize=True las cajas son las de la imagen normalizada
+    """
+    def run(image):
+        result = cached_ocr(image, config, lambda: json.dumps(_uncached_ocr('data', image, config, timeout)),
+                            method='data', engine=engine_id())
+        return json.loads(result)
+    return _with_normalization(image, normalize, run)
+
+def words_to_text(words):
+    """Une las palabras en el orden de lectura de Tesseract, con un salto por cada línea."""
+    lines = []
+    current_line = None
+    for word in words:
+        line = tuple(word['line'])
+        if line != current_line:
+            lines.append([])
+            current_line = line
+        lines[-1].append(word['text'])
+    return '\n'.join(' '.join(line) for line in lines)
+
+def char_confidences(word):
+    """Confianza (0-100) de cada carácter de la palabra; sin datos por carácter, la de la palabra."""
+    confidences = word.get('char_conf')
+    if not confidences or len(confidences) != len(word['text']):
+        confidences = [word['conf']] * len(word['text'])
+    return [max(0.0, float(conf)) for conf in confidences]
+
+def ocr_result(words):
+    """
+    Resultado estructurado a partir de las palabras de image_to_data.
+
+    Returns:
+        dict: {'text', 'words', 'confidence' (media por carácter, 0-100),
+               'min_confidence' (la del carácter menos fiable)}
+    """
+    confidences = [conf for word in words for conf in char_confidences(word)]
+    return {
+        'text': words_to_text(words),
+        'words': words,
+        'confidence': sum(confidences) / len(confidences) if confidences else 0.0,
+        'min_confidence': min(confidences) if confidences else 0.0
+    }
+
+def recognize(image, config='', timeout=None, normalize=False):
+    """OCR con resultado estructurado: texto, palabras con caja y confianzas (ver ocr_result)."""
+    return ocr_result(image_to_data(image, config, timeout, normalize))
+
+def _uncached_ocr(method, image, config, timeout):
+    if not TESSEROCR_AVAILABLE and not PYTESSERACT_AVAILABLE:
+        raise RuntimeError("No hay motor de OCR: instala tesserocr o pytesseract")
+    if not service_enabled():
+        if not PYTESSERACT_AVAILABLE:
+            raise RuntimeError("pytesseract no está instalado")
+        if method == 'data':
+            return pytesseract_words(image, config, timeout or DEFAULT_TIMEOUT)
+        return pytesseract.image_to_string(image, config=config, timeout=timeout or DEFAULT_TIMEOUT)
+    return get_ocr_service().ocr(method, image, config, timeout)
+
+def service_report():
+    """Llamadas, reinicios, tiempos límite superados y tiempo total del servicio."""
+    if _service is None:
+        return {'calls': 0, 'restarts': 0, 'timeouts': 0, 'time': 0.0}
+    with _service.lock:
+        return dict(_service.stats)
+
+if __name__ == "__main__":
+    sample = np.full((60, 300), 255, np.uint8)
+    cv2.putText(sample, "AB123456", (10, 45), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 0, 2)
+    config = '--psm 7 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+    start = time.time()
+    for _ in range(20):
+        text = image_to_string(sample, config)
+    print(f"Texto: {text.strip()!r} - {(time.time() - start) / 20 * 1000:.1f} ms por llamada")
+    print(service_report())
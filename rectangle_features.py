@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Características de un recorte calculadas una sola vez y compartidas por todas las
+heurísticas de classify_rectangles.py.
+
+Antes, para cada recorte, process_cells, classify_rectangle, is_image_blank y
+contains_significant_text repetían cvtColor, threshold y findContours por su cuenta.
+RectangleFeatures calcula cada dato la primera vez que se pide (escala de grises,
+máscaras por umbral, contornos, áreas, envolventes convexas, bordes, porcentajes de
+contenido...) y lo guarda para las siguientes consultas. Los valores son exactamente
+los mismos que calculaba cada función, así que las decisiones no cambian.
+"""
+
+import cv2
+import numpy as np
+
+class RectangleFeatures:
+    """Caché perezosa de las características de un recorte (imagen BGR o en grises)."""
+
+    def __init__(self, image, name=None):
+        self.image = image
+        self.name = name
+        self._gray = None
+        self._binaries = {}
+        self._contours = {}
+        self._areas = {}
+        self._approx_vertices = {}
+        self._hull_areas = {}
+        self._non_white = {}
+        self._contrast = None
+        self._edges = None
+        self._adaptive = None
+
+    @classmethod
+    def of(cls, image):
+        """Devuelve el propio objeto si ya es RectangleFeatures, o lo crea a partir de la imagen."""
+        return image if isinstance(image, cls) else cls(image)
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY) if len(self.image.shape) == 3 else self.image
+        return self._gray
+
+    @property
+    def total_pixels(self):
+        return self.gray.size
+
+    def binary_inv(self, threshold):
+        """Máscara de píxeles oscuros: threshold(gray, threshold, 255, THRESH_BINARY_INV)."""
+        if threshold not in self._binaries:
+            _, self._binaries[threshold] = cv2.threshold(self.gray, threshold, 255, cv2.THRESH_BINARY_INV)
+        return self._binaries[threshold]
+
+    def contours(self, threshold):
+        """Contornos externos de binary_inv(threshold)."""
+        if threshold not in self._contours:
+            self._contours[threshold], _ = cv2.findContours(self.binary_inv(threshold), cv2.RETR_EXTERNAL,
+                                                           cv2.CHAIN_APPROX_SIMPLE)
+        return self._contours[threshold]
+
+    def contour_areas(self, threshold):
+        """cv2.contourArea de cada contorno, en el mismo orden que contours(threshold)."""
+        if threshold not in self._areas:
+            self._areas[threshold] = [cv2.contourArea(cnt) for cnt in self.contours(threshold)]
+        return self._areas[threshold]
+
+    def approx_vertices(self, threshold, index):
+        """Número de vértices de approxPolyDP(contorno, 0.02 * perímetro) del contorno 'index'."""
+        key = (threshold, index)
+        if key not in self._approx_vertices:
+            cnt = self.contours(threshold)[index]
+            perimeter = cv2.arcLength(cnt, True)
+            self._approx_vertices[key] = len(cv2.approxPolyDP(cnt, 0.02 * perimeter, True))
+        return self._approx_vertices[key]
+
+    def hull_area(self, threshold, index):
+        """Área de la envolvente convexa del contorno 'index'."""
+        key = (threshold, index)
+        if key not in self._hull_areas:
+            self._hull_areas[key] = cv2.contourArea(cv2.convexHull(self.contours(threshold)[index]))
+        return self._hull_areas[key]
+
+    def largest_contour_index(self, threshold):
+        """Índice del contorno de mayor área (el primero si hay empate) o None."""
+        areas = self.contour_areas(threshold)
+        if not areas:
+            return None
+        return max(range(len(areas)), key=areas.__getitem__)
+
+    def non_white_pixels(self, threshold):
+        """Número de píxeles con gris < threshold."""
+        if threshold not in self._non_white:
+            self._non_white[threshold] = int(np.count_nonzero(self.gray < threshold))
+        return self._non_white[threshold]
+
+    def content_percent(self, threshold):
+        """Porcentaje de píxeles con gris < threshold."""
+        return (self.non_white_pixels(threshold) / self.total_pixels) * 100
+
+    @property
+    def contrast(self):
+        """Diferencia entre el gris máximo y el mínimo."""
+        if self._contrast is None:
+            min_val, max_val, _, _ = cv2.minMaxLoc(self.gray)
+            self._contrast = max_val - min_val
+        return self._contrast
+
+    @property
+    def edges(self):
+        """Bordes Canny de la máscara a 220 dilatada (detección de siluetas de joyería)."""
+        if self._edges is None:
+            kernel = np.ones((3, 3), np.uint8)
+            dilated = cv2.dilate(self.binary_inv(220), kernel, iterations=1)
+            self._edges = cv2.Canny(dilated, 50, 150)
+        return self._edges
+
+    @property
+    def edge_count(self):
+        return int(np.count_nonzero(self.edges))
+
+    @property
+    def adaptive_binary(self):
+        """Umbral adaptativo gaussiano usado como variante de OCR."""
+        if self._adaptive is None:
+            self._adaptive = cv2.adaptiveThreshold(self.gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                                   cv2.THRESH_BINARY, 11, 2)
+        return self._adaptive
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Generador de hojas de catálogo sintéticas con sus celdas de referencia.
+
+Dibuja una cuadrícula de celdas alternando filas de imágenes de producto (siluetas de
+joyería) y filas de códigos impresos, con ruido, desenfoque, rotación y resolución
+configurables. Devuelve la hoja y las cajas reales de cada celda para poder medir
+recall/precisión de extract_rectangles sin depender de escaneos reales.
+"""
+
+import string
+
+import cv2
+import numpy as np
+
+# Caracteres de los códigos impresos
+CODE_CHARACTERS = string.ascii_uppercase + string.digits
+
+def generate_sheet(rows=6, cols=4, cell_size=(560, 420), cell_jitter=0.0, line_width=4,
+                   margin=20, codes=True, silhouettes=True, noise=0.0, blur=0,
+                   rotation=0.0, scale=1.0, paper=False, seed=0):
+    """
+    Genera una hoja sintética.
+
+    Args:
+        rows, cols: Tamaño de la cuadrícula
+        cell_size: (ancho, alto) base de las celdas en píxeles a escala 1
+        cell_jitter: Variación relativa aleatoria del ancho de cada columna y alto de cada fila
+        line_width: Grosor de las líneas de la cuadrícula
+        margin: Borde oscuro alrededor de la cuadrícula (como en los escaneos sobre fondo negro)
+        codes: Dibujar códigos en las filas impares
+        silhouettes: Dibujar siluetas de producto en las filas pares
+        noise: Desviación típica del ruido gaussiano (0 = sin ruido)
+        blur: Tamaño del desenfoque gaussiano (0 = sin desenfoque)
+        rotation: Rotación de la hoja en grados
+        scale: Factor de resolución (2.0 = el doble de píxeles por lado)
+        paper: Papel blanco alrededor de la cuadrícula (tabla con marco exterior) en
+               lugar de borde oscuro
+        seed: Semilla para que la hoja sea reproducible
+
+    Returns:
+        dict: {'image': hoja BGR, 'cells': [{'bbox', 'row', 'col', 'kind'}], 'params': {...}}
+    """
+    rng = np.random.default_rng(seed)
+    params = dict(rows=rows, cols=cols, cell_size=cell_size, cell_jitter=cell_jitter,
+                  line_width=line_width, margin=margin, codes=codes, silhouettes=silhouettes,
+                  noise=noise, blur=blur, rotation=rotation, scale=scale, paper=paper, seed=seed)
+
+    line = max(1, int(round(line_width * scale)))
+    edge = max(line, int(round(margin * scale)))
+    widths = [int(cell_size[0] * scale * (1 + rng.uniform(-cell_jitter, cell_jitter))) for _ in range(cols)]
+    heights = [int(cell_size[1] * scale * (1 + rng.uniform(-cell_jitter, cell_jitter))) for _ in range(rows)]
+
+    # Posición del interior blanco de cada fila/columna
+    xs = np.cumsum([edge] + [w + line for w in widths[:-1]])
+    ys = np.cumsum([edge] + [h + line for h in heights[:-1]])
+    width = int(xs[-1] + widths[-1] + edge)
+    height = int(ys[-1] + heights[-1] + edge)
+
+    image = np.zeros((height, width, 3), np.uint8)
+    if paper:
+        image[:] = 255
+        image[ys[0] - line:height - edge + line, xs[0] - line:width - edge + line] = 0
+    cells = []
+    for r in range(rows):
+        for c in range(cols):
+            x, y, w, h = int(xs[c]), int(ys[r]), widths[c], heights[r]
+            image[y:y + h, x:x + w] = 255
+            kind = 'image' if r % 2 == 0 else 'code'
+            if kind == 'image' and silhouettes:
+                draw_silhouette(image, (x, y, w, h), rng)
+            elif kind == 'code' and codes:
+                draw_code(image, (x, y, w, h), rng)
+            cells.append({'bbox': (x, y, w, h), 'row': r, 'col': c, 'kind': kind})
+
+    if rotation:
+        image, cells = rotate_sheet(image, cells, rotation)
+    if blur:
+        k = blur if blur % 2 else blur + 1
+        image = cv2.GaussianBlur(image, (k, k), 0)
+    if noise:
+        noisy = image.astype(np.float32) + rng.normal(0, noise, image.shape).astype(np.float32)
+        image = np.clip(noisy, 0, 255).astype(np.uint8)
+
+    return {'image': image, 'cells': cells, 'params': params}
+
+def draw_code(image, box, rng):
+    """Dibuja un código de producto centrado en la celda."""
+    x, y, w, h = box
+    code = ''.join(rng.choice(list(CODE_CHARACTERS), size=int(rng.integers(6, 10))))
+    font_scale = max(0.5, min(w / (len(code) * 28), h / 60))
+    thickness = max(1, int(font_scale * 2))
+    (text_w, text_h), _ = cv2.getTextSize(code, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+    origin = (x + max(0, (w - text_w) // 2), y + (h + text_h) // 2)
+    cv2.putText(image, code, origin, cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), thickness)
+
+def draw_silhouette(image, box, rng):
+    """Dibuja una silueta de joya sencilla (anillo, colgante o pendientes)."""
+    x, y, w, h = box
+    cx, cy = x + w // 2, y + h // 2
+    size = int(min(w, h) * rng.uniform(0.2, 0.35))
+    shade = tuple(int(v) for v in rng.integers(30, 150, size=3))
+    shape = rng.integers(0, 3)
+    if shape == 0:
+        cv2.circle(image, (cx, cy), size, shade, max(2, size // 4))
+    elif shape == 1:
+        cv2.line(image, (cx, y + h // 8), (cx, cy - size // 2), shade, 2)
+        cv2.ellipse(image, (cx, cy), (size // 2, size), 0, 0, 360, shade, -1)
+    else:
+        for dx in (-size, size):
+            cv2.circle(image, (cx + dx // 2, cy - size // 2), max(3, size // 8), shade, 2)
+            cv2.ellipse(image, (cx + dx // 2, cy + size // 3), (size // 4, size // 2), 0, 0, 360, shade, -1)
+
+def rotate_sheet(image, cells, angle):
+    """Rota la hoja y actualiza las cajas de referencia (caja envolvente de la celda rotada)."""
+    height, width = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    border = tuple(int(v) for v in image[0, 0])
+    rotated = cv2.warpAffine(image, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                             borderMode=cv2.BORDER_CONSTANT, borderValue=border)
+    rotated_cells = []
+    for cell in cells:
+        x, y, w, h = cell['bbox']
+        corners = np.array([[x, y, 1], [x + w, y, 1], [x, y + h, 1], [x + w, y + h, 1]], np.float64)
+        moved = corners @ matrix.T
+        x0, y0 = np.floor(moved.min(axis=0)).astype(int)
+        x1, y1 = np.ceil(moved.max(axis=0)).astype(int)
+        rotated_cells.append(dict(cell, bbox=(int(x0), int(y0), int(x1 - x0), int(y1 - y0))))
+    return rotated, rotated_cells
+
+def box_iou(a, b):
+    """Intersección sobre unión de dos cajas (x, y, w, h)."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = iw * ih
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+def match_cells(detected, expected, min_iou=0.8):
+    """
+    Empareja cajas detectadas con las de referencia (voraz por IoU descendente).
+
+    Returns:
+        dict: {'true_positives', 'precision', 'recall', 'missing', 'extra'}
+    """
+    pairs = []
+    for i, d in enumerate(detected):
+        for j, e in enumerate(expected):
+            iou = box_iou(d, e)
+            if iou >= min_iou:
+                pairs.append((iou, i, j))
+    pairs.sort(reverse=True)
+    used_detected, used_expected = set(), set()
+    for _, i, j in pairs:
+        if i not in used_detected and j not in used_expected:
+            used_detected.add(i)
+            used_expected.add(j)
+
+    matched = len(used_expected)
+    return {
+        'true_positives': matched,
+        'precision': matched / len(detected) if detected else 1.0,
+        'recall': matched / len(expected) if expected else 1.0,
+        'missing': [expected[j] for j in range(len(expected)) if j not in used_expected],
+        'extra': [detected[i] for i in range(len(detected)) if i not in used_detected]
+    }
+
+if __name__ == "__main__":
+    sheet = generate_sheet(noise=8, blur=3, rotation=0.5, seed=1)
+    cv2.imwrite("synthetic_sheet.png", sheet['image'])
+    print(f"Hoja sintética guardada en synthetic_sheet.png ({len(sheet['cells'])} celdas)")
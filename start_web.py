@@ -59,7 +59,8 @@ def main():
     
     # Ejecutar la aplicación Flask
     try:
-        from web_app import app
+        from web_app import app, start_model_warm_up
+        start_model_warm_up()
         app.run(debug=True, host='0.0.0.0', port=5000)
     except KeyboardInterrupt:
         print("\n👋 Aplicación detenida")
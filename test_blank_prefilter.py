@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Pruebas del prefiltro de celdas en blanco: sólo puede marcar como en blanco los
+recortes que classify_rectangles.is_image_blank también da por en blanco.
+
+Uso:
+    python -m pytest -q test_blank_prefilter.py
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from blank_prefilter import prefilter_blank_images
+from classify_rectangles import is_image_blank
+
+def white(size=100):
+    return np.full((size, size), 255, dtype=np.uint8)
+
+def outline_rectangle(x0, y0, x1, y1, size=100):
+    crop = white(size)
+    cv2.rectangle(crop, (x0, y0), (x1, y1), 0, 1)
+    return crop
+
+def outline_circle(radius, size=100):
+    crop = white(size)
+    cv2.circle(crop, (size // 2, size // 2), radius, 0, 1)
+    return crop
+
+def glyph(text, scale=0.6, size=100):
+    crop = white(size)
+    cv2.putText(crop, text, (40, 60), cv2.FONT_HERSHEY_SIMPLEX, scale, 0, 1)
+    return crop
+
+def dots(count, size=100, seed=0):
+    crop = white(size)
+    rng = np.random.default_rng(seed)
+    crop[rng.integers(0, size, count), rng.integers(0, size, count)] = 0
+    return crop
+
+CROPS = {
+    'blanco': white(),
+    'rectangulo_hueco_12px': outline_rectangle(40, 40, 52, 52),
+    'rectangulo_hueco_6px': outline_rectangle(40, 40, 46, 46),
+    'circulo_hueco_r5': outline_circle(5),
+    'circulo_hueco_r3': outline_circle(3),
+    'cero': glyph('0'),
+    'o_mayuscula': glyph('O'),
+    'ocho': glyph('8'),
+    'cero_pequeno': glyph('0', scale=0.3),
+    'motas_20': dots(20),
+    'motas_45': dots(45),
+    'gris_tenue': np.full((100, 100), 240, dtype=np.uint8),
+}
+
+@pytest.mark.parametrize('name', sorted(CROPS))
+def test_prefilter_agrees_with_is_image_blank(name):
+    crop = CROPS[name]
+    [result] = prefilter_blank_images([crop])
+    if result['blank']:
+        assert is_image_blank(crop)
+
+def test_hollow_glyph_is_not_blank():
+    # 48 píxeles oscuros que encierran un área de 144: no es una celda en blanco
+    [result] = prefilter_blank_images([outline_rectangle(40, 40, 52, 52)])
+    assert not result['blank']
+
+def test_batch_matches_single_crops():
+    names = sorted(CROPS)
+    batch = prefilter_blank_images([CROPS[name] for name in names])
+    for name, result in zip(names, batch):
+        assert result == prefilter_blank_images([CROPS[name]])[0]
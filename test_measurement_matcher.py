@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Pruebas del detector de medidas/pesos: match_measurement debe devolver exactamente lo
+mismo que el bucle original (match_measurement_legacy) sobre el corpus generado de
+benchmark_measurement_matcher.py y sobre casos fijos.
+
+Uso:
+    python -m pytest -q test_measurement_matcher.py
+"""
+
+import random
+
+import pytest
+
+from benchmark_measurement_matcher import random_text
+from measurement_matcher import match_measurement, match_measurement_legacy
+
+# Casos escritos a mano: pesos con errores de OCR, medidas, tallas, códigos y vacíos
+FIXED_CASES = ['6.1g', '6. llg', '6,11 G', '6 . ll', '34G', '22 cm', '7', 'G', 'KG', '18k',
+               'AB12345', '123456789', '12345AB', '', ' ', '\n', '1.5', '12.25', '3 x 4 cm']
+
+@pytest.mark.parametrize('text', FIXED_CASES)
+def test_fixed_cases_match_legacy(text):
+    assert match_measurement(text) == match_measurement_legacy(text)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_generated_corpus_matches_legacy(seed):
+    rng = random.Random(seed)
+    mismatches = []
+    for _ in range(4000):
+        text = random_text(rng)
+        expected = match_measurement_legacy(text)
+        result = match_measurement(text)
+        if result != expected:
+            mismatches.append((text, expected, result))
+    assert not mismatches, f"{len(mismatches)} resultados distintos, p. ej. {mismatches[:3]}"
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la cascada de OCR de classify_rectangles con un OCR determinista (cada
+variante del recorte devuelve una lectura fija). La cascada debe decidir lo mismo que
+cascade=False, que lee siempre las tres variantes, salvo cuando se para en una lectura
+decisiva (un código leído con confianza alta), que entonces se acepta.
+
+Uso:
+    python -m pytest -q test_ocr_cascade.py
+"""
+
+import itertools
+import random
+
+import cv2
+import numpy as np
+import pytest
+
+import classify_rectangles
+from classify_rectangles import (CASCADE_MIN_SAMPLES, OCR_VARIANTS, contains_significant_text,
+                                  decisive_reading, evaluate_code_text, variant_image)
+from ocr_service import CODE_ACCEPT_CONFIDENCE, CODE_REVIEW_CONFIDENCE, ocr_result
+from rectangle_features import RectangleFeatures
+
+# Lecturas (gris, adaptativo, invertido) que unas salidas anticipadas sin confianza decidían mal
+REVIEW_CASES = [
+    ('ABCDEF', 'XYZ', '12345678'),
+    ('123456789', '123456789ABCDEFGHIJ', ''),
+    ('1234A567', 'ABCDEFGHIJKL1234', '1234A567'),
+]
+
+# Fragmentos con los que se generan lecturas aleatorias
+TOKENS = ['', 'ABCDEF', 'XYZ', 'OO', 'Ill', 'ioCA', '1234', '12345678', '987654321',
+          'AB12', 'R2D2', '7', 'abcdefghijklmn', '0000', ' ', '-']
+
+def make_crop(seed):
+    """Recorte sintético con tinta (para que ninguna variante sea uniforme)."""
+    rng = np.random.default_rng(seed)
+    crop = np.full((40, 160), 255, dtype=np.uint8)
+    # Motas sueltas: tinta en todas las variantes, sin siluetas que suban min_chars
+    crop[10:30, 10:150][rng.random((20, 140)) < 0.05] = 100
+    return crop
+
+def random_reading(rng):
+    return ''.join(rng.choice(TOKENS) for _ in range(rng.randint(0, 4)))
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    """Cada prueba empieza sin victorias acumuladas (orden original de las variantes)."""
+    monkeypatch.setattr(classify_rectangles, '_ocr_stats',
+                        {'crops': 0, 'calls': 0, 'early_exits': 0, 'skipped': 0,
+                         'wins': {variant: 0 for variant in OCR_VARIANTS}})
+
+def as_result(reading):
+    """Lectura del stub: texto plano o (texto, confianza) como una sola palabra."""
+    if isinstance(reading, tuple):
+        text, confidence = reading
+        return ocr_result([{'text': text, 'conf': confidence, 'line': (1, 1, 1)}])
+    return {'text': reading, 'words': None, 'confidence': None, 'min_confidence': None}
+
+def stub_ocr(monkeypatch, features, readings):
+    """Sustituye Tesseract por una tabla imagen -> lectura y devuelve la lista de llamadas."""
+    table = {variant_image(features, variant).tobytes(): reading for variant, reading in zip(OCR_VARIANTS, readings)}
+    calls = []
+
+    def recognize(image, config, normalize=False):
+        calls.append(image)
+        return as_result(table.get(image.tobytes(), '') if image.min() != image.max() else '')
+
+    monkeypatch.setattr(classify_rectangles, 'recognize', recognize)
+    return calls
+
+def cases():
+    rng = random.Random(0)
+    for readings in REVIEW_CASES:
+        yield readings
+    for readings in itertools.product(['', 'XYZ', '12345678', '1234ABC', 'ABCDEFGHIJ1234'], repeat=3):
+        yield readings
+    for _ in range(300):
+        yield tuple(random_reading(rng) for _ in OCR_VARIANTS)
+
+@pytest.mark.parametrize('readings', list(cases()))
+def test_cascade_matches_three_variants(monkeypatch, readings):
+    features = RectangleFeatures.of(make_crop(0))
+    stub_ocr(monkeypatch, features, readings)
+    for min_chars in (5, 7):
+        expected = contains_significant_text(features, min_chars=min_chars, cascade=False)
+        assert contains_significant_text(features, min_chars=min_chars) == expected
+
+@pytest.mark.parametrize('readings', REVIEW_CASES)
+def test_cascade_matches_with_precomputed_gray(monkeypatch, readings):
+    features = RectangleFeatures.of(make_crop(0))
+    stub_ocr(monkeypatch, features, readings)
+    expected = contains_significant_text(features, cascade=False, precomputed_text=readings[0])
+    assert contains_significant_text(features, precomputed_text=readings[0]) == expected
+
+@pytest.mark.parametrize('readings, is_code', [(REVIEW_CASES[0], True), (REVIEW_CASES[1], False)])
+def test_best_variant_decides(monkeypatch, readings, is_code):
+    # Dos lecturas sin dígitos no descartan un código que sólo lee la última variante, y
+    # una lectura válida no se acepta si otra con más caracteres incumple la proporción
+    features = RectangleFeatures.of(make_crop(0))
+    stub_ocr(monkeypatch, features, readings)
+    assert contains_significant_text(features) == is_code
+
+def confident_cases():
+    rng = random.Random(1)
+    for _ in range(300):
+        yield tuple((random_reading(rng), rng.choice([40, 70, 85, 95])) for _ in OCR_VARIANTS)
+
+@pytest.mark.parametrize('readings', list(confident_cases()))
+def test_cascade_matches_unless_decisive(monkeypatch, readings):
+    features = RectangleFeatures.of(make_crop(0))
+    calls = stub_ocr(monkeypatch, features, readings)
+    expected = contains_significant_text(features, cascade=False)
+    del calls[:]
+    result = contains_significant_text(features)
+    decisive = [decisive_reading(evaluate_code_text(text, 7), as_result((text, conf)))
+                for text, conf in readings]
+    if not any(decisive):
+        # Recorte ambiguo: se leen las tres variantes y decide la mejor, como sin cascada
+        assert len(calls) == len(OCR_VARIANTS)
+        assert result == expected
+    else:
+        # Se para en la primera lectura decisiva y acepta el código
+        assert len(calls) == decisive.index(True) + 1
+        assert result
+
+def test_decisive_reading_stops_after_one_call(monkeypatch):
+    features = RectangleFeatures.of(make_crop(0))
+    calls = stub_ocr(monkeypatch, features, [('123456789', 95), ('ABCDEFGHIJKLMNOP', 95), ('', 0)])
+    assert contains_significant_text(features)
+    assert len(calls) == 1
+    assert classify_rectangles.ocr_cascade_report()['early_exits'] == 1
+
+@pytest.mark.parametrize('char_conf, decisive', [
+    ([CODE_ACCEPT_CONFIDENCE] * 9, True),
+    ([CODE_ACCEPT_CONFIDENCE - 1] * 9, False),
+    # Media alta pero un carácter que iría a revisión: no basta para parar
+    ([100] * 8 + [CODE_REVIEW_CONFIDENCE - 1], False),
+    ([100] * 8 + [CODE_REVIEW_CONFIDENCE], True),
+])
+def test_confidence_gates_early_accept(monkeypatch, char_conf, decisive):
+    features = RectangleFeatures.of(make_crop(0))
+    code = ocr_result([{'text': '123456789', 'char_conf': char_conf, 'conf': min(char_conf), 'line': (1, 1, 1)}])
+    calls = stub_ocr(monkeypatch, features, ['', '', ''])
+    assert contains_significant_text(features, precomputed_text=code)
+    # La lectura del mosaico ('gris') no cuenta como llamada: si es decisiva no hay ninguna
+    assert len(calls) == (0 if decisive else 2)
+
+def test_plain_text_is_never_decisive(monkeypatch):
+    features = RectangleFeatures.of(make_crop(0))
+    calls = stub_ocr(monkeypatch, features, ['123456789', '', ''])
+    assert contains_significant_text(features)
+    assert len(calls) == len(OCR_VARIANTS)
+
+def test_variants_ordered_by_wins(monkeypatch):
+    features = RectangleFeatures.of(make_crop(0))
+    calls = stub_ocr(monkeypatch, features, [('', 0), ('', 0), ('123456789', 95)])
+    for _ in range(CASCADE_MIN_SAMPLES):
+        contains_significant_text(features)
+    # Tras CASCADE_MIN_SAMPLES victorias de 'invertido' se prueba primero y basta una llamada
+    del calls[:]
+    assert contains_significant_text(features)
+    assert len(calls) == 1
+    assert np.array_equal(calls[0], variant_image(features, 'invertido'))
+
+def test_confident_reading_without_digits_does_not_reject(monkeypatch):
+    # Una lectura sin dígitos muy fiable no descarta el recorte antes de leer las demás
+    features = RectangleFeatures.of(make_crop(0))
+    calls = stub_ocr(monkeypatch, features, [('ABCDEFG', 95), ('123456789', 80), ('XYZ', 90)])
+    assert contains_significant_text(features)
+    assert len(calls) == len(OCR_VARIANTS)
+
+def test_confidence_breaks_ties(monkeypatch):
+    # Con el mismo número de caracteres gana la lectura más fiable, no la primera
+    features = RectangleFeatures.of(make_crop(0))
+    stub_ocr(monkeypatch, features, [('123456789', 40), ('ABCDEFGHI', 90), ('', 0)])
+    assert not contains_significant_text(features)
+    stub_ocr(monkeypatch, features, [('123456789', 90), ('ABCDEFGHI', 40), ('', 0)])
+    assert contains_significant_text(features)
+
+def test_uniform_crop_skips_tesseract(monkeypatch):
+    features = RectangleFeatures.of(np.full((40, 160), 255, dtype=np.uint8))
+    calls = stub_ocr(monkeypatch, features, ('', '', ''))
+    assert not contains_significant_text(features)
+    assert calls == []
+
+def test_montage_skips_product_photos(monkeypatch, tmp_path):
+    # Una foto de producto se clasifica sin OCR: no debe entrar en el mosaico
+    code = np.full((150, 400), 255, dtype=np.uint8)
+    cv2.putText(code, '123456789', (60, 85), cv2.FONT_HERSHEY_SIMPLEX, 1, 0, 2)
+    product = np.full((120, 120), 255, dtype=np.uint8)
+    product[20:100, 30:90] = 60
+    cells = [{'name': 'codigo.png', 'image': code}, {'name': 'producto.png', 'image': product}]
+    stub_ocr(monkeypatch, RectangleFeatures.of(cells[0]['image']), ['123456789', '', ''])
+    sent = []
+
+    def montage_ocr(images, config):
+        sent.extend(images)
+        return {'results': [as_result('123456789') for _ in images]}
+
+    monkeypatch.setattr(classify_rectangles, 'montage_ocr', montage_ocr)
+    monkeypatch.setattr(classify_rectangles, 'report_montage', lambda result, count: None)
+    result = classify_rectangles.process_cells(cells, str(tmp_path / 'codes'), str(tmp_path / 'images'), montage=True)
+    assert len(sent) == 1 and sent[0] is cells[0]['image']
+    assert result['producto.png'] == 'image'
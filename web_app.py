@@ -9,6 +9,7 @@ from werkzeug.utils import secure_filename
 import cv2
 from connect_mongodb import return_mongo_client
 from extract_rectangles import extract_rectangles
+from model_registry import get_model, mark_startup, startup_report, warm_up
 # IMPORTAR DIRECTAMENTE LAS FUNCIONES QUE FUNCIONAN
 from main import pair_and_upload_codes_images_by_order
 # Importar la función original pero la vamos a modificar
@@ -33,6 +34,17 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 # Cola para mensajes de progreso
 progress_queue = queue.Queue()
 
+mark_startup('imports')
+
+@app.before_request
+def mark_first_request():
+    """Tiempo hasta la primera petición atendida (ver /startup_report)"""
+    mark_startup('first_request')
+
+def start_model_warm_up():
+    """Precarga los modelos en segundo plano para que la primera petición no pague la carga"""
+    threading.Thread(target=warm_up, daemon=True).start()
+
 # Crear directorios necesarios
 for directory in ['uploads', 'codes_output', 'images_output', 'discards_output', 'rectangles_output', 'source_images', 'images_old', 'source']:
     if not os.path.exists(directory):
@@ -306,13 +318,75 @@ def get_directory_contents_with_categories(directory):
     
     return files
 
-def process_rectangles_web_version(input_dir, codes_dir, images_dir, discards_dir):
+# Emoji de cada categoría de joyería en los textos de la interfaz
+CATEGORY_EMOJIS = {
+    'pendientes': '👂',
+    'anillos': '💍',
+    'collares': '📿',
+    'pulseras': '⌚',
+    'colgantes': '🧿',
+    'colgantes y collares': '🔗',
+    'sin_categoria': '❓'
+}
+
+def analysis_category(analysis):
+    """
+    Predicción de categoría (formato predict_jewelry_category) que ya trae el análisis
+    de un rectángulo (ver enhanced_rectangle_analysis), o None si no la trae
+    """
+    category = analysis.get('jewelry_category')
+    if not category:
+        return None
+    detected = analysis.get('jewelry_analysis') or {}
+    emoji = CATEGORY_EMOJIS.get(category, '🔹')
+    return {
+        'category': category,
+        'category_display': f"{emoji} {category.replace('_', ' ').title()}",
+        'css_class': detected.get('css_class', 'category-unknown'),
+        'confidence': analysis.get('jewelry_confidence', 0.0),
+        'features': analysis.get('jewelry_features', {})
+    }
+
+def save_category_sidecar(images_dir, img_file, prediction):
+    """Escribe el _category.json de una imagen a partir de su predicción y devuelve su contenido"""
+    from enhanced_classifier_with_categories import category_sidecar
+    
+    category_info = category_sidecar(img_file, prediction)
+    try:
+        content = json.dumps(category_info, indent=2, ensure_ascii=False)
+    except (TypeError, ValueError) as e:
+        # Características no serializables: se guarda sin ellas
+        send_progress(f"  ⚠️ Error en formato JSON para {img_file}: {str(e)}")
+        category_info = dict(category_info, features={})
+        content = json.dumps(category_info, indent=2, ensure_ascii=False)
+    
+    category_json_path = os.path.join(images_dir, f"{os.path.splitext(img_file)[0]}_category.json")
+    with open(category_json_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return category_info
+
+def process_rectangles_web_version(input_dir, codes_dir, images_dir, discards_dir, parallel=False, workers=None):
     """
     Versión para web CON CATEGORÍAS DE JOYERÍA
     Adaptada para funcionar como en main.py pero SIN SUFIJOS en los archivos descartados
+    Con parallel=True los rectángulos se analizan en un pool de procesos; el progreso
+    se sigue enviando en orden rect_N (ver iter_rectangle_analyses). Por defecto no: el
+    pool usa 'spawn' y cada proceso volvería a importar web_app (y su configuración de
+    Flask) desde el hilo de la petición
+    
+    Una sola pasada: la categoría de joyería y las características que ya calcula el
+    análisis de cada rectángulo se guardan directamente en su _category.json, sin volver
+    a analizar (ML + OCR) las imágenes. Sólo las que llegan sin categoría pasan por el
+    predictor, todas juntas en un lote.
+    
+    Returns:
+        dict: Estado del trabajo {'codes', 'images', 'discards', 'categories': {imagen:
+              contenido de su _category.json}}, o None si se usó el sistema clásico
     """
     # Importamos las funciones necesarias pero implementamos nuestra propia versión del procesamiento
-    from improved_classify_rectangles_ocr_fixed import enhanced_rectangle_analysis, clean_output_directories
+    from improved_classify_rectangles_ocr_fixed import (
+        clean_output_directories, find_blank_paths, iter_rectangle_analyses
+    )
     
     send_progress("🎯 Usando clasificador personalizado (sin sufijos en descartes)...")
     
@@ -346,14 +420,19 @@ def process_rectangles_web_version(input_dir, codes_dir, images_dir, discards_di
         text_count = 0
         image_count = 0
         discard_count = 0
+        categories = {}
+        uncategorized = []
         
-        # Procesar cada imagen
-        for i, image_path in enumerate(image_paths, 1):
+        # Descartar las celdas en blanco antes de cualquier OCR o inferencia
+        blank_paths = find_blank_paths(image_paths)
+        if blank_paths:
+            send_progress(f"⚡ {len(blank_paths)} celdas en blanco descartadas sin OCR")
+        
+        # Procesar cada imagen con el análisis existente (resultados en orden rect_N)
+        analyses = iter_rectangle_analyses(image_paths, blank_paths, parallel=parallel, workers=workers)
+        for i, (image_path, analysis) in enumerate(zip(image_paths, analyses), 1):
             file_name = os.path.basename(str(image_path))
-            send_progress(f"📋 [{i}/{len(image_paths)}] Analizando {file_name}...")
-            
-            # Usar el análisis existente
-            analysis = enhanced_rectangle_analysis(str(image_path))
+            send_progress(f"📋 [{i}/{len(image_paths)}] Analizado {file_name}")
             
             if analysis['should_discard']:
                 # Guardar en descartes SIN SUFIJOS como solicitado
@@ -385,7 +464,15 @@ def process_rectangles_web_version(input_dir, codes_dir, images_dir, discards_di
                 destination = os.path.join(images_dir, file_name)
                 shutil.copy2(image_path, destination)
                 image_count += 1
-                send_progress(f"  🖼️ Imagen guardada")
+                
+                # Categoría calculada en el mismo análisis, sin segunda pasada
+                prediction = analysis_category(analysis)
+                if prediction is None:
+                    uncategorized.append(file_name)
+                    send_progress(f"  🖼️ Imagen guardada")
+                else:
+                    categories[file_name] = save_category_sidecar(images_dir, file_name, prediction)
+                    send_progress(f"  🖼️ Imagen guardada: {categories[file_name]['category_display']}")
             
             else:
                 # Caso inesperado - descartar SIN SUFIJOS
@@ -399,140 +486,26 @@ def process_rectangles_web_version(input_dir, codes_dir, images_dir, discards_di
         send_progress(f"   🖼️ {image_count} imágenes")
         send_progress(f"   🗑️ {discard_count} descartes")
         
-        # Generar archivos JSON de categoría para cada imagen, como en main.py
-        try:
-            from enhanced_classifier_with_categories import EnhancedJewelryClassifier
-            classifier = EnhancedJewelryClassifier()
-            
-            image_files = [f for f in os.listdir(images_dir) 
-                          if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-            
-            send_progress(f"📊 Generando archivos JSON de categoría para {len(image_files)} imágenes...")
-            
-            for i, img_file in enumerate(image_files):
-                img_path = os.path.join(images_dir, img_file)
-                base_name = os.path.splitext(img_file)[0]
-                category_json_path = os.path.join(images_dir, f"{base_name}_category.json")
-                
-                # Solo crear el archivo JSON si no existe ya
-                if not os.path.exists(category_json_path):
-                    try:
-                        # Analizar la imagen para obtener categoría
-                        analysis = classifier.enhanced_rectangle_analysis_with_categories(img_path)
-                        
-                        # Obtener la categoría y modificar el display para no mostrar porcentajes
-                        category = analysis.get('jewelry_category', 'sin_categoria')
-                        category_emojis = {
-                            'pendientes': '👂',
-                            'anillos': '💍',
-                            'collares': '📿',
-                            'pulseras': '⌚',
-                            'colgantes': '🧿',
-                            'colgantes y collares': '🔗',
-                            'sin_categoria': '❓'
-                        }
-                        emoji = category_emojis.get(category, '🔹')
-                        
-                        # Crear display simple sin porcentaje
-                        category_title = category.replace('_', ' ').title()
-                        category_display = f"{emoji} {category_title}"
-                        
-                        # Crear archivo JSON con información de categoría
-                        category_info = {
-                            'filename': img_file,
-                            'category': category,
-                            'category_display': category_display,
-                            'css_class': analysis.get('jewelry_css_class', 'category-unknown'),
-                            'confidence': float(analysis.get('jewelry_confidence', 0.0)),
-                            'confidence_level': 'alta' if analysis.get('jewelry_confidence', 0) >= 0.8 else 'media' if analysis.get('jewelry_confidence', 0) >= 0.6 else 'baja',
-                            'features': analysis.get('features', {}),
-                            'timestamp': datetime.now().isoformat()
-                        }
-                        
-                        # Función mejorada para convertir tipos NumPy a tipos JSON compatibles
-                        def convert_numpy_to_python_types(obj):
-                            import numpy as np
-                            if isinstance(obj, np.ndarray):
-                                if obj.size == 1:
-                                    return obj.item()  # Extraer valor escalar de arrays de 1 elemento
-                                else:
-                                    return obj.tolist()  # Convertir arrays a listas
-                            elif isinstance(obj, (np.integer, np.int64, np.int32)):
-                                return int(obj)
-                            elif isinstance(obj, (np.floating, np.float64, np.float32)):
-                                return float(obj)
-                            elif isinstance(obj, np.bool_):
-                                return bool(obj)
-                            elif isinstance(obj, dict):
-                                return {k: convert_numpy_to_python_types(v) for k, v in obj.items()}
-                            elif isinstance(obj, (list, tuple)):
-                                return [convert_numpy_to_python_types(item) for item in obj]
-                            elif obj is None:
-                                return None
-                            else:
-                                return obj
-                        
-                        # Limpiar características problemáticas ANTES de la conversión
-                        features = category_info.get('features', {})
-                        clean_features = {}
-                        for key, value in features.items():
-                            try:
-                                # Manejar arrays NumPy problemáticos
-                                if hasattr(value, '__module__') and value.__module__ and 'numpy' in str(value.__module__):
-                                    if hasattr(value, 'size') and value.size == 1:
-                                        clean_features[key] = value.item()  # Extraer valor escalar
-                                    elif hasattr(value, 'tolist'):
-                                        clean_features[key] = value.tolist()  # Convertir a lista
-                                    else:
-                                        clean_features[key] = convert_numpy_to_python_types(value)
-                                elif value is None or value == "":
-                                    clean_features[key] = False  # Valor por defecto para campos vacíos
-                                else:
-                                    clean_features[key] = value
-                            except Exception as conv_error:
-                                send_progress(f"  ⚠️ Error procesando característica {key}: {conv_error}")
-                                clean_features[key] = False
-                        
-                        # Actualizar las características limpias
-                        category_info['features'] = clean_features
-                        
-                        # Convertir todos los valores a tipos compatibles con JSON
-                        category_info = convert_numpy_to_python_types(category_info)
-                        
-                        # Validar que el JSON sea correcto antes de guardarlo
-                        try:
-                            import json
-                            # Validar la serialización (prueba de conversión)
-                            json_test = json.dumps(category_info, ensure_ascii=False)
-                            
-                            # Guardar información de categoría
-                            with open(category_json_path, 'w', encoding='utf-8') as f:
-                                json.dump(category_info, f, indent=2, ensure_ascii=False)
-                            
-                        except Exception as json_error:
-                            send_progress(f"  ⚠️ Error en formato JSON para {img_file}: {str(json_error)}")
-                            # Guardar una versión simplificada sin características problemáticas
-                            simple_info = {
-                                'filename': img_file,
-                                'category': category,
-                                'category_display': category_display,
-                                'confidence': float(analysis.get('jewelry_confidence', 0.0)),
-                                'timestamp': datetime.now().isoformat()
-                            }
-                            with open(category_json_path, 'w', encoding='utf-8') as f:
-                                json.dump(simple_info, f, indent=2, ensure_ascii=False)
-                        
-                        send_progress(f"  ✅ Categoría generada para {img_file}: {category_info['category_display']}")
-                    except Exception as e:
-                        import traceback
-                        send_progress(f"  ❌ Error generando categoría para {img_file}: {str(e)}")
-                        traceback.print_exc()
-            
-            send_progress("✅ Procesamiento de categorías completado")
-            return
-        except Exception as e:
-            send_progress(f"⚠️ Error en análisis de categorías: {e}")
-            send_progress("🔄 Continuando sin categorías...")
+        # Imágenes cuyo análisis no trajo categoría: se predicen al final, con el clasificador compartido
+        if uncategorized:
+            send_progress(f"📊 Prediciendo la categoría de {len(uncategorized)} imágenes sin categoría...")
+            try:
+                classifier = get_model('enhanced_classifier')
+                predictions = classifier.predict_categories(
+                    [os.path.join(images_dir, f) for f in uncategorized])
+                for img_file, prediction in zip(uncategorized, predictions):
+                    categories[img_file] = save_category_sidecar(images_dir, img_file, prediction)
+            except Exception as e:
+                send_progress(f"⚠️ Error en análisis de categorías: {e}")
+                send_progress("🔄 Continuando sin categorías...")
+        
+        send_progress("✅ Procesamiento de categorías completado")
+        return {
+            'codes': text_count,
+            'images': image_count,
+            'discards': discard_count,
+            'categories': categories
+        }
     
     except Exception as e:
         send_progress(f"❌ Error en procesamiento: {str(e)}")
@@ -644,17 +617,24 @@ def process_image_automated():
         
         # Paso 2: Procesar rectángulos CON CATEGORÍAS
         send_progress("🤖 Clasificando rectángulos con OCR y categorías...", 2, 3)
-        process_rectangles_web_version(
+        job = process_rectangles_web_version(
             input_dir="rectangles_output",
             codes_dir="codes_output",
             images_dir="images_output",
             discards_dir="discards_output"
         )
         
-        # Obtener estadísticas CON CATEGORÍAS
-        codes_count = len(get_directory_contents("codes_output"))
-        images_count = len(get_directory_contents_with_categories("images_output"))
-        discards_count = len(get_directory_contents("discards_output"))
+        # Obtener estadísticas CON CATEGORÍAS (del propio análisis si está disponible)
+        if job:
+            codes_count, images_count, discards_count = job['codes'], job['images'], job['discards']
+            category_counts = {}
+            for category_info in job['categories'].values():
+                category_counts[category_info['category']] = category_counts.get(category_info['category'], 0) + 1
+        else:
+            codes_count = len(get_directory_contents("codes_output"))
+            images_count = len(get_directory_contents_with_categories("images_output"))
+            discards_count = len(get_directory_contents("discards_output"))
+            category_counts = {}
         
         send_progress(f"📊 Resultado: {codes_count} códigos, {images_count} imágenes, {discards_count} descartes", 3, 3)
         
@@ -684,6 +664,7 @@ def process_image_automated():
             'system_status': system_status,
             'awaiting_upload': True,  # Nuevo campo para indicar que espera subida
             'enhanced_categories': ENHANCED_CATEGORIES_AVAILABLE,
+            'category_counts': category_counts,
             'message': f'Procesada {filename}: {codes_count} códigos, {images_count} imágenes, {discards_count} descartes. Esperando subida a MongoDB.'
         }
         
@@ -832,6 +813,11 @@ def system_status():
     except Exception as e:
         return jsonify({'error': f'Error obteniendo estado: {str(e)}'}), 500
 
+@app.route('/startup_report')
+def get_startup_report():
+    """Tiempos de arranque (imports, modelos listos, primera petición) y carga de modelos"""
+    return jsonify(startup_report())
+
 @app.route('/setup_next_image')
 def setup_next_image():
     """Mueve la siguiente imagen de source a images_sources"""
@@ -1149,7 +1135,8 @@ def process_final():
                     codes_dir="codes_output",
                     images_dir="images_output", 
                     mongo_client=client,
-                    image_id="web_upload"
+                    image_id="web_upload",
+                    grid_index_path=os.path.join("rectangles_output", "cells.json")
                 )
                 
                 send_progress(f"✅ Proceso completado: {codes_count} códigos y {images_count} imágenes subidos a MongoDB")
@@ -1231,18 +1218,17 @@ def reprocess_categories():
                 send_progress(f"🔍 Re-procesando categorías de {len(images_files)} imágenes...")
                 
                 # Importar y usar el sistema de categorías
-                from enhanced_classifier_with_categories import categorize_jewelry_enhanced
+                from enhanced_classifier_with_categories import categorize_jewelry_images
+                
+                image_paths = [os.path.join("images_output", image_file['name']) for image_file in images_files]
+                category_results = categorize_jewelry_images(image_paths)
                 
-                for i, image_file in enumerate(images_files, 1):
+                for i, (image_file, category_result) in enumerate(zip(images_files, category_results), 1):
                     filename = image_file['name']
-                    image_path = os.path.join("images_output", filename)
                     
                     send_progress(f"📋 [{i}/{len(images_files)}] Categorizando {filename}...")
                     
                     try:
-                        # Analizar categoría
-                        category_result = categorize_jewelry_enhanced(image_path)
-                        
                         # Guardar archivo JSON de categoría
                         base_name = os.path.splitext(filename)[0]
                         json_filename = f"{base_name}_category.json"
@@ -1352,4 +1338,5 @@ if __name__ == '__main__':
     print("   http://localhost:5000 - Procesamiento automático")
     print("   http://localhost:5000/manual - Procesamiento manual (legacy)")
     print("🌍 Iniciando servidor en http://localhost:5000")
+    start_model_warm_up()
     app.run(debug=True, host='0.0.0.0', port=5000)